@@ -1,11 +1,14 @@
-from base64 import b64decode
 from collections import namedtuple
-from io import BytesIO
 import re
 
-import requests
-import cv2 as cv
-import numpy as np
+from .aio import (
+    AsyncAutoCollimatorClient,
+    gather_crosshair,
+)
+from .client import (
+    AutoCollimatorClient,
+    CrosshairReply,
+)
 
 __author__ = 'Measurement Standards Laboratory of New Zealand'
 __copyright__ = '\xa9 2022, ' + __author__
@@ -17,58 +20,84 @@ version_info = namedtuple('version_info', 'major minor micro releaselevel')(int(
 """:obj:`~collections.namedtuple`: Contains the version information as a (major, minor, micro, releaselevel) tuple."""
 
 
-def crosshair(*, host='pr-autocollimator', debug=False, show=False,
-              origin=None, threshold=None, pixels_per_arcmin=None):
+_clients = {}
+
+
+def get_client(host='pr-autocollimator'):
+    """Get the default client for a Raspberry Pi.
+
+    The module functions, e.g., :func:`crosshair`, use the default client.
+
+    Parameters
+    ----------
+    host : :class:`str`, optional
+        The hostname or IP address of the Raspberry Pi.
+
+    Returns
+    -------
+    :class:`~autocollimator.client.AutoCollimatorClient`
+        The client.
+    """
+    try:
+        return _clients[host]
+    except KeyError:
+        return _clients.setdefault(host, AutoCollimatorClient(host))
+
+
+def crosshair(*, host='pr-autocollimator', **kwargs):
     """Fetch information about the current location of the crosshair.
 
     Parameters
     ----------
     host : :class:`str`, optional
         The hostname or IP address of the Raspberry Pi.
-    debug : :class:`bool`, optional
-        Whether to return a binary image of the localized crosshair and the
-        projections along the x and y axes as an <img> html tag.
-    show : :class:`bool`, optional
-        Whether to return an image of the localized crosshair as an
-        <img> html tag.
-    origin : :class:`list`, optional
-        The [x, y] location of the origin in pixel units.
-    threshold : :class:`int`, optional
-        A value between [0, 255] to filter the crosshair from the image.
-    pixels_per_arcmin : :class:`float`, optional
-        The conversion factor to convert pixel units to arcmin units.
+    kwargs
+        See :meth:`~autocollimator.client.AutoCollimatorClient.crosshair`.
 
     Returns
     -------
-    :class:`dict` or :class:`str`
+    :class:`~autocollimator.client.CrosshairReply` or :class:`str`
         If `debug` or `show` is enabled then the <img> html tag as
         a string. Otherwise, a dictionary containing the location of the
         crosshair and the image is returned.
     """
-    params = {}
-    if debug:
-        params['debug'] = 1
-    if show:
-        params['show'] = 1
-    if origin:
-        params['origin'] = f'{origin[0]},{origin[1]}'
-    if threshold:
-        params['threshold'] = str(threshold)
-    if pixels_per_arcmin:
-        params['pixels_per_arcmin'] = str(pixels_per_arcmin)
-
-    reply = requests.get(f'http://{host}/crosshair', params=params)
-    reply.raise_for_status()
-
-    if debug or show:
-        return reply.content.decode()
-
-    json = reply.json()
-    buffer = BytesIO(b64decode(json['image']))
-    arr = np.frombuffer(buffer.getvalue(), dtype=np.uint8)
-    image = cv.imdecode(arr, flags=cv.IMREAD_UNCHANGED)
-    json['image'] = image
-    return json
+    return get_client(host).crosshair(**kwargs)
+
+
+def crosshair_events(*, host='pr-autocollimator', **kwargs):
+    """Continuously receive the location of the crosshair.
+
+    Parameters
+    ----------
+    host : :class:`str`, optional
+        The hostname or IP address of the Raspberry Pi.
+    kwargs
+        See :meth:`~autocollimator.client.AutoCollimatorClient.crosshair_events`.
+
+    Yields
+    ------
+    :class:`dict`
+        The location of the crosshair in each frame.
+    """
+    return get_client(host).crosshair_events(**kwargs)
+
+
+def measurements(*, host='pr-autocollimator', **kwargs):
+    """Fetch the measurements of the crosshair from the measurement log.
+
+    Parameters
+    ----------
+    host : :class:`str`, optional
+        The hostname or IP address of the Raspberry Pi.
+    kwargs
+        See :meth:`~autocollimator.client.AutoCollimatorClient.measurements`.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The measurements, as a structured array.
+    """
+    return get_client(host).measurements(**kwargs)
 
 
 def saveas(filename, image, params=None):
@@ -78,17 +107,26 @@ def saveas(filename, image, params=None):
     ----------
     filename : :class:`str`
         The name of the file to save to.
-    image : :class:`numpy.ndarray`
-        The image in OpenCV format.
+    image : :class:`numpy.ndarray` or :class:`bytes`
+        The image in OpenCV format, or the bytes of an encoded image (e.g., the
+        :attr:`~autocollimator.client.CrosshairReply.jpeg` attribute of a reply)
+        which are written to the file unchanged.
     params : :class:`tuple`, optional
         Format-specific parameters encoded as pairs (paramId_1, paramValue_1, paramId_2, paramValue_2, ...).
         See :ref:`ImwriteFlags <https://docs.opencv.org/3.4/d8/d6a/group__imgcodecs__flags.html#ga292d81be8d76901bff7988d18d2b42ac>`_
+        Ignored if `image` is of type :class:`bytes`.
 
     Returns
     -------
     :class:`bool`
         Whether calling this function was successful.
     """
+    if isinstance(image, bytes):
+        with open(filename, mode='wb') as fp:
+            fp.write(image)
+        return True
+
+    import cv2 as cv
     return cv.imwrite(filename, image, params=params)
 
 
@@ -100,4 +138,4 @@ def shutdown(*, host='pr-autocollimator'):
     host : :class:`str`, optional
         The hostname or IP address of the Raspberry Pi.
     """
-    requests.get(f'http://{host}/shutdown')
+    get_client(host).shutdown()
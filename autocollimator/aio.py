@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import AutoCollimatorClient
+
+# the maximum number of requests that gather_crosshair() sends concurrently
+MAX_WORKERS = 64
+
+# the executor and the clients of gather_crosshair(), which are kept so that
+# the connections to each Raspberry Pi are kept alive between calls
+_executor = None
+_clients = {}
+_lock = threading.Lock()
+
+
+class AsyncAutoCollimatorClient(object):
+
+    def __init__(self, host='pr-autocollimator', *, executor=None, **kwargs):
+        """An asyncio client for the web application that is running on the Raspberry Pi.
+
+        The requests are sent by an :class:`~autocollimator.client.AutoCollimatorClient`
+        in a thread pool so that the event loop is not blocked while waiting
+        for the Raspberry Pi to reply.
+
+        Parameters
+        ----------
+        host : :class:`str`, optional
+            The hostname or IP address of the Raspberry Pi.
+        executor : :class:`concurrent.futures.Executor`, optional
+            The executor to send the requests in. If not specified then the
+            default executor of the event loop is used.
+        kwargs
+            All additional keyword arguments are passed to
+            :class:`~autocollimator.client.AutoCollimatorClient`.
+        """
+        super(AsyncAutoCollimatorClient, self).__init__()
+        self._client = AutoCollimatorClient(host, **kwargs)
+        self._executor = executor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *ignore):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} host={self.host!r}>'
+
+    @property
+    def host(self):
+        """:class:`str`: The hostname or IP address of the Raspberry Pi."""
+        return self._client.host
+
+    def close(self):
+        """Close all connections to the Raspberry Pi."""
+        self._client.close()
+
+    async def crosshair(self, **kwargs):
+        """Fetch information about the current location of the crosshair.
+
+        Parameters
+        ----------
+        kwargs
+            See :meth:`~autocollimator.client.AutoCollimatorClient.crosshair`.
+
+        Returns
+        -------
+        :class:`dict` or :class:`str`
+            If `debug` or `show` is enabled then the <img> html tag as a string.
+            Otherwise, a dictionary containing the location of the crosshair
+            and the image is returned. The dictionary also contains the times
+            (seconds since the epoch, of the computer that sent the request)
+            when the request was sent, ``t_send``, and when the reply was
+            received, ``t_receive``.
+        """
+        def send():
+            t_send = time.time()
+            reply = self._client.crosshair(**kwargs)
+            t_receive = time.time()
+            if not isinstance(reply, str):
+                reply['t_send'] = t_send
+                reply['t_receive'] = t_receive
+            return reply
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, send)
+
+    async def shutdown(self):
+        """Shut down the Raspberry Pi."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._client.shutdown)
+
+
+def get_client(host='pr-autocollimator', *, timeout=(3.05, 30.)):
+    """Get the client that :func:`gather_crosshair` uses for a Raspberry Pi.
+
+    The clients (one per host and timeout) share an executor and are kept
+    until :func:`close` is called.
+
+    Parameters
+    ----------
+    host : :class:`str`, optional
+        The hostname or IP address of the Raspberry Pi.
+    timeout : :class:`float` or :class:`tuple`, optional
+        The number of seconds to wait for the Raspberry Pi to respond.
+
+    Returns
+    -------
+    :class:`AsyncAutoCollimatorClient`
+        The client.
+    """
+    global _executor
+    with _lock:
+        try:
+            return _clients[(host, timeout)]
+        except KeyError:
+            pass
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='autocollimator')
+        client = AsyncAutoCollimatorClient(host, executor=_executor, timeout=timeout)
+        _clients[(host, timeout)] = client
+        return client
+
+
+def close():
+    """Close the clients of :func:`gather_crosshair` and shut down their executor.
+
+    The requests that are being sent are not waited for.
+    """
+    global _executor
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        executor, _executor = _executor, None
+    for client in clients:
+        client.close()
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+async def gather_crosshair(hosts, *, return_exceptions=False, timeout=(3.05, 30.), **kwargs):
+    """Fetch the location of the crosshair from multiple Raspberry Pi's concurrently.
+
+    The connection to each Raspberry Pi is kept alive between calls, see
+    :func:`get_client`. If the call is cancelled (e.g., by
+    :func:`asyncio.wait_for`) then it returns immediately, but the requests
+    that were already sent finish in the background.
+
+    Parameters
+    ----------
+    hosts : :class:`list` of :class:`str`
+        The hostnames or IP addresses of the Raspberry Pi's.
+    return_exceptions : :class:`bool`, optional
+        Whether an exception that is raised for a host is returned in the
+        results (instead of being raised).
+    timeout : :class:`float` or :class:`tuple`, optional
+        The number of seconds to wait for each Raspberry Pi to respond.
+    kwargs
+        The same keyword arguments as
+        :meth:`~autocollimator.client.AutoCollimatorClient.crosshair`.
+
+    Returns
+    -------
+    :class:`list` of :class:`dict`
+        The reply from each Raspberry Pi, in the same order as `hosts`.
+        See :meth:`AsyncAutoCollimatorClient.crosshair`.
+    """
+    clients = [get_client(host, timeout=timeout) for host in hosts]
+    return await asyncio.gather(
+        *(client.crosshair(**kwargs) for client in clients),
+        return_exceptions=return_exceptions)
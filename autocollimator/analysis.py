@@ -0,0 +1,498 @@
+"""
+Run the analysis of images in a pool of processes.
+
+The images are passed to the processes through shared memory, so an image is
+copied once (into a shared slot) instead of being pickled and sent through a
+pipe. The functions that run in the processes only return small results (e.g.,
+the location of the crosshair or the JPEG bytes), not the processed images.
+"""
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+)
+
+import cv2 as cv
+import numpy as np
+
+from .frames import Frame
+from .utils import (
+    Workspace,
+    add_marker,
+    locate_crosshair,
+    locate_origin,
+    plot_crosshair,
+    resize,
+    to_bytes,
+)
+
+# the shared slots, as numpy arrays, in a worker process
+_slots = []
+
+# the workspace of a worker process (a worker analyses one image at a time)
+_workspace = None
+
+
+def _initialize(buffers):
+    global _slots, _workspace
+    _slots = [np.frombuffer(buffer, dtype=np.uint8) for buffer in buffers]
+    _workspace = Workspace()
+
+
+def _run(function, slot, shape, dtype, kwargs):
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    image = _slots[slot][:size].view(dtype).reshape(shape)
+    return function(image, **kwargs)
+
+
+def process_context():
+    """Returns the :mod:`multiprocessing` context to start the processes with.
+
+    On Linux the processes are started by a fork server, since forking a
+    process that has other threads running (e.g., the web server or the
+    threads of OpenCV) is not safe. The main module must therefore be
+    importable without side effects (i.e., use ``if __name__ == '__main__'``).
+    """
+    if sys.platform.startswith('linux'):
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
+
+class Analyzer(object):
+
+    def __init__(self, *, workers=None, slots=None, nbytes=2560*1920*3):
+        """Analyse images in a pool of processes.
+
+        Parameters
+        ----------
+        workers : :class:`int`, optional
+            The number of processes. Default is the number of CPUs minus 1
+            (one CPU is left for capturing images and for the web server).
+        slots : :class:`int`, optional
+            The number of images that can be queued or analysed at the same
+            time. A call to :meth:`submit` blocks until a slot is available.
+            Default is one more than the number of processes, so that the
+            next image can be copied into a slot while the processes are busy.
+        nbytes : :class:`int`, optional
+            The initial size, in bytes, of each slot. The slots are
+            reallocated (and the processes are restarted) if a larger
+            image is submitted.
+        """
+        super(Analyzer, self).__init__()
+        self._workers = workers or max(1, (os.cpu_count() or 1) - 1)
+        self._num_slots = slots or self._workers + 1
+        self._lock = threading.Lock()
+        self._executor = None
+        self._start(nbytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} workers={self._workers} slots={self._num_slots}>'
+
+    @property
+    def workers(self):
+        """:class:`int`: The number of processes."""
+        return self._workers
+
+    def close(self):
+        """Wait for the analyses to finish then stop the processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def submit(self, function, image, **kwargs):
+        """Call ``function(image, **kwargs)`` in a process.
+
+        The image is copied into a shared slot before this method returns,
+        so the image may be modified or released immediately.
+
+        Parameters
+        ----------
+        function : :obj:`callable`
+            A function that can be pickled (i.e., defined at the top level
+            of a module), see the functions in this module.
+        image : :class:`numpy.ndarray`
+            The image to analyse.
+        kwargs
+            The keyword arguments that are passed to `function`.
+
+        Returns
+        -------
+        :class:`concurrent.futures.Future`
+            The future of the value that `function` returns.
+        """
+        with self._lock:
+            if self._executor is None:
+                raise RuntimeError('The analyzer has been closed')
+            if image.nbytes > self._nbytes:
+                self._executor.shutdown(wait=True)
+                self._start(image.nbytes)
+            slot = self._free.get()
+            free = self._free
+            view = self._buffers[slot][:image.nbytes].view(image.dtype).reshape(image.shape)
+            np.copyto(view, image)
+            future = self._executor.submit(_run, function, slot, image.shape, image.dtype.str, kwargs)
+        future.add_done_callback(lambda f: free.put(slot))
+        return future
+
+    def _start(self, nbytes):
+        # the slots must be created before the processes are started, since
+        # the processes access them by inheritance
+        context = process_context()
+        buffers = [context.RawArray('B', nbytes) for _ in range(self._num_slots)]
+        self._buffers = [np.frombuffer(buffer, dtype=np.uint8) for buffer in buffers]
+        self._nbytes = nbytes
+        self._free = queue.Queue()
+        for i in range(self._num_slots):
+            self._free.put(i)
+        self._executor = ProcessPoolExecutor(
+            self._workers, mp_context=context, initializer=_initialize, initargs=(buffers,))
+        # start the processes now instead of when the first image is submitted
+        for future in [self._executor.submit(os.getpid) for _ in range(self._workers)]:
+            future.result()
+
+
+class InlineAnalyzer(object):
+
+    def __init__(self):
+        """Analyse images in the calling thread.
+
+        Has the same interface as :class:`Analyzer`.
+        """
+        super(InlineAnalyzer, self).__init__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}>'
+
+    @property
+    def workers(self):
+        """:class:`int`: The number of processes (always 0)."""
+        return 0
+
+    def close(self):
+        """Does nothing."""
+        pass
+
+    def submit(self, function, image, **kwargs):
+        """Call ``function(image, **kwargs)`` and return the completed future.
+
+        See :meth:`Analyzer.submit`.
+        """
+        future = Future()
+        try:
+            future.set_result(function(image, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class PreviewEncoder(object):
+
+    def __init__(self, analyzer, *, width=1280, quality=None, min_quality=40, max_quality=90):
+        """Encode downscaled previews of the images in a background thread.
+
+        Only the most recent image is encoded. If a new image is submitted
+        before the previous image was encoded then the previous image is
+        dropped, so a slow encoder never holds back the thread that submits
+        the images (e.g., the thread that locates the origin and the crosshair).
+
+        Parameters
+        ----------
+        analyzer : :class:`Analyzer` or :class:`InlineAnalyzer`
+            The analyzer that encodes the previews.
+        width : :class:`int`, optional
+            The width, in pixels, of a preview. See :func:`encode`.
+        quality : :class:`int`, optional
+            The JPEG quality, between [0, 100]. If not specified then the
+            quality is adapted. It is decreased if images are dropped (the
+            encoder cannot keep up) and increased if no images were dropped
+            while the previous 10 previews were encoded.
+        min_quality : :class:`int`, optional
+            The minimum quality, if the quality is adapted.
+        max_quality : :class:`int`, optional
+            The maximum quality, if the quality is adapted.
+        """
+        super(PreviewEncoder, self).__init__()
+        self._analyzer = analyzer
+        self._width = width
+        self._adaptive = quality is None
+        self._quality = max_quality if quality is None else quality
+        self._min_quality = min_quality
+        self._max_quality = max_quality
+        self._condition = threading.Condition()
+        self._pending = None
+        self._jpeg = None
+        self._seq = 0
+        self._dropped = 0
+        self._kept = 0
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} width={self._width} quality={self._quality}>'
+
+    @property
+    def dropped(self):
+        """:class:`int`: The number of images that were dropped."""
+        return self._dropped
+
+    @property
+    def quality(self):
+        """:class:`int`: The JPEG quality of the next preview."""
+        return self._quality
+
+    def close(self):
+        """Stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._discard()
+
+    def latest(self, *, after=0):
+        """Get the most recent preview.
+
+        Parameters
+        ----------
+        after : :class:`int`, optional
+            The sequence number of a previous preview.
+
+        Returns
+        -------
+        :class:`tuple` or :data:`None`
+            The (sequence number, JPEG bytes) of the most recent preview, or
+            :data:`None` if a preview newer than `after` is not available.
+            Does not wait for a preview to be encoded.
+
+        Raises
+        ------
+        Exception
+            The exception that stopped the background thread, if a preview
+            could not be encoded.
+        """
+        with self._condition:
+            if self._error is not None:
+                raise self._error
+            if self._seq > after:
+                return self._seq, self._jpeg
+
+    def submit(self, image, *, markers=(), labels=()):
+        """Submit an image to encode.
+
+        Parameters
+        ----------
+        image : :class:`~autocollimator.frames.Frame` or :class:`numpy.ndarray`
+            The image. A frame is referenced (not copied) until the preview
+            is encoded (in colour, see :meth:`~autocollimator.frames.Frame.bgr`),
+            an array is copied.
+        markers : :class:`list`, optional
+            The markers to draw. See :func:`encode`.
+        labels : :class:`list`, optional
+            The text to draw. See :func:`encode`.
+
+        Raises
+        ------
+        Exception
+            The exception that stopped the background thread, if a preview
+            could not be encoded.
+        """
+        if isinstance(image, Frame):
+            pending = (image.acquire(), markers, labels)
+        else:
+            pending = (image.copy(), markers, labels)
+        with self._condition:
+            if self._error is not None:
+                _release(pending[0])
+                raise self._error
+            if self._pending is not None:
+                self._dropped += 1
+                self._kept = 0
+                _release(self._pending[0])
+            self._pending = pending
+            self._condition.notify_all()
+
+    def _discard(self):
+        with self._condition:
+            if self._pending is not None:
+                _release(self._pending[0])
+                self._pending = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or self._pending is not None)
+                if self._closed:
+                    return
+                (source, markers, labels), self._pending = self._pending, None
+                dropped = self._dropped
+
+            try:
+                try:
+                    image = source.bgr() if isinstance(source, Frame) else source
+                    future = self._analyzer.submit(
+                        encode, image, quality=self._quality, width=self._width, markers=markers, labels=labels)
+                finally:
+                    _release(source)
+                jpeg = future.result()
+            except Exception as e:
+                # the error is raised by latest() and submit(), so the caller stops
+                with self._condition:
+                    self._error = e
+                self._discard()
+                return
+
+            with self._condition:
+                self._seq += 1
+                self._jpeg = jpeg
+                if self._adaptive:
+                    self._adapt(self._dropped > dropped)
+
+    def _adapt(self, dropped):
+        # the lock must already be acquired
+        if dropped:
+            self._quality = max(self._min_quality, self._quality - 5)
+            return
+        self._kept += 1
+        if self._kept >= 10:
+            self._kept = 0
+            self._quality = min(self._max_quality, self._quality + 5)
+
+
+def _release(source):
+    if isinstance(source, Frame):
+        source.release()
+
+
+def crosshair_position(image, **kwargs):
+    """Locate the crosshair.
+
+    Parameters
+    ----------
+    image : :class:`numpy.ndarray`
+        The image object.
+    kwargs
+        All keyword arguments are passed to :func:`~autocollimator.utils.locate_crosshair`.
+        In a worker process, the worker's workspace is used.
+
+    Returns
+    -------
+    :class:`dict`
+        The location of the crosshair and the time of each stage (the
+        processed image and the projections are not included).
+    """
+    timings = {}
+    kwargs.setdefault('workspace', _workspace)
+    result = locate_crosshair(image, timings=timings, **kwargs)
+    return {'x': result['x'], 'y': result['y'], 'offset': result['offset'], 'timings': timings}
+
+
+def origin_position(image, **kwargs):
+    """Locate the origin.
+
+    Parameters
+    ----------
+    image : :class:`numpy.ndarray`
+        The image object.
+    kwargs
+        All keyword arguments are passed to :func:`~autocollimator.utils.locate_origin`.
+        In a worker process, the worker's workspace is used.
+
+    Returns
+    -------
+    :class:`dict`
+        The location of the origin (the processed image and the
+        projections are not included).
+    """
+    kwargs.setdefault('workspace', _workspace)
+    result = locate_origin(image, **kwargs)
+    return {'x': result['x'], 'y': result['y'], 'offset': result['offset']}
+
+
+def plot(image, **kwargs):
+    """Locate the crosshair and plot the processed image and the projections.
+
+    Parameters
+    ----------
+    image : :class:`numpy.ndarray`
+        The image object.
+    kwargs
+        All keyword arguments are passed to :func:`~autocollimator.utils.locate_crosshair`.
+
+    Returns
+    -------
+    :class:`str`
+        The plot as a base64 string. See :func:`~autocollimator.utils.plot_crosshair`.
+    """
+    return plot_crosshair(locate_crosshair(image, **kwargs))
+
+
+def encode(image, *, quality=None, width=None, markers=(), labels=()):
+    """Draw markers and text on an image and then encode it as a JPEG image.
+
+    Parameters
+    ----------
+    image : :class:`numpy.ndarray`
+        The image object.
+    quality : :class:`int`, optional
+        The JPEG quality, between [0, 100].
+    width : :class:`int`, optional
+        The width to resize the image to. See :func:`~autocollimator.utils.resize`.
+    markers : :class:`list`, optional
+        The markers to draw, as (position, colour, label) tuples. The position
+        is in pixel units of the image before it is resized.
+        See :func:`~autocollimator.utils.add_marker`.
+    labels : :class:`list`, optional
+        The text to draw, as (text, (x, y)) tuples.
+
+    Returns
+    -------
+    :class:`bytes`
+        The JPEG image (empty if the image is empty).
+    """
+    if image.size == 0:
+        return b''
+
+    full_width = image.shape[1]
+    if width:
+        image = resize(image, width)
+    if (markers or labels) and image.ndim == 2:
+        # draw the markers in colour on a greyscale image
+        image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    elif (markers or labels) and not image.flags.writeable:
+        image = image.copy()
+
+    scale = image.shape[1] / full_width
+    for position, colour, label in markers:
+        if position['x'] is None or position['y'] is None:
+            continue
+        add_marker(image, {'x': position['x'] * scale, 'y': position['y'] * scale}, colour, label=label)
+
+    for text, xy in labels:
+        cv.putText(image, text, xy, cv.FONT_HERSHEY_DUPLEX, 1, (127, 127, 127), thickness=1)
+
+    return to_bytes(image, quality=quality)
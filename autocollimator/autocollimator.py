@@ -1,23 +1,127 @@
+import itertools
+import queue
 import threading
+from concurrent.futures import Future
 
 from .camera import Camera
 from .led_ring import LEDRing
 from .lightbulb import Lightbulb
 
 
+BACKENDS = ('raspberrypi', 'simulated')
+
+# the illumination scenes, see AutoCollimator.illuminate()
+SCENES = ('measure', 'view', 'dark')
+
+# the priorities of the commands that the hardware thread runs, a command
+# with a lower value runs first, see AutoCollimator.submit()
+PRIORITY_MEASURE = 0
+PRIORITY_CONTROL = 1
+PRIORITY_STREAM = 2
+
+
+def create_autocollimator(backend='raspberrypi', **kwargs):
+    """Create an :class:`AutoCollimator` for a particular hardware backend.
+
+    Parameters
+    ----------
+    backend : :class:`str`, optional
+        Either ``raspberrypi`` (the camera, lightbulb and LED ring that are
+        connected to the Raspberry Pi) or ``simulated`` (see
+        :mod:`autocollimator.simulation`).
+    kwargs
+        If the backend is ``simulated`` then all keyword arguments are
+        passed to :class:`~autocollimator.simulation.Scene`.
+
+    Returns
+    -------
+    :class:`AutoCollimator`
+        The autocollimator.
+    """
+    if backend == 'raspberrypi':
+        return AutoCollimator()
+    if backend == 'simulated':
+        from .simulation import Scene, simulated_devices
+        return AutoCollimator(**simulated_devices(Scene(**kwargs)))
+    raise ValueError(f'Invalid backend {backend!r}, must be one of: {", ".join(BACKENDS)}')
+
+
 class AutoCollimator(object):
 
-    def __init__(self):
-        """The autocollimator assembly consists of the camera, lightbulb and LED ring."""
+    def __init__(self, *, camera=None, lightbulb=None, leds=None):
+        """The autocollimator assembly consists of the camera, lightbulb and LED ring.
+
+        The devices are owned by a background thread that runs one command at
+        a time (see :meth:`submit`). The methods of this class submit a command
+        and wait for it to finish.
+
+        Parameters
+        ----------
+        camera : :class:`~autocollimator.camera.Camera`, optional
+            The camera. If not specified then the Raspberry Pi camera is used.
+        lightbulb : :class:`~autocollimator.lightbulb.Lightbulb`, optional
+            The lightbulb. If not specified then the GPIO pins of the
+            Raspberry Pi are used.
+        leds : :class:`~autocollimator.led_ring.LEDRing`, optional
+            The LED ring. If not specified then the GPIO pins of the
+            Raspberry Pi are used.
+        """
         super(AutoCollimator, self).__init__()
-        self._lock = threading.Lock()
+        self._camera = camera or Camera()
+        self._lightbulb = lightbulb or Lightbulb()
+        self._leds = leds or LEDRing()
+
+        # the sequence number of the last frame that was (possibly) exposed
+        # before the illumination was changed, only used in continuous mode
+        self._illumination_seq = 0
+
+        # the brightness of the LED ring for the view scene
+        self._view_brightness = 50
+
+        # the commands are (priority, count, future, function, args, kwargs),
+        # the count keeps the order of commands that have the same priority
+        self._commands = queue.PriorityQueue()
+        self._count = itertools.count()
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='hardware', daemon=True)
+        self._thread.start()
+
+    def submit(self, function, *args, priority=PRIORITY_CONTROL, **kwargs):
+        """Run a command in the hardware thread.
+
+        The commands run one at a time, in order of priority and then in the
+        order that they were submitted. A command that is running is not
+        interrupted, but a measurement that is submitted while stream frames
+        are waiting runs before them.
 
-        self._camera = Camera()
-        self._lightbulb = Lightbulb()
-        self._leds = LEDRing()
+        The command may call the methods of this class (they run immediately,
+        in the hardware thread) so, for example, the illumination can be set
+        and an image captured without another command running in between.
 
-        self.index_stream_enabled = False
-        self.origin_stream_enabled = False
+        Parameters
+        ----------
+        function : :obj:`callable`
+            The command, called as ``function(*args, **kwargs)``.
+        args
+            The positional arguments that are passed to `function`.
+        priority : :class:`int`, optional
+            One of :data:`PRIORITY_MEASURE`, :data:`PRIORITY_CONTROL` or
+            :data:`PRIORITY_STREAM`.
+        kwargs
+            The keyword arguments that are passed to `function`.
+
+        Returns
+        -------
+        :class:`concurrent.futures.Future`
+            The future of the value that `function` returns.
+        """
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError('The autocollimator has been closed')
+            self._commands.put((priority, next(self._count), future, function, args, kwargs))
+        return future
 
     def led_brightness(self):
         """Get the brightness of all LED's.
@@ -29,6 +133,16 @@ class AutoCollimator(object):
         """
         return self._leds.get_brightness()
 
+    def is_lightbulb_on(self):
+        """Whether the lightbulb is on.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the lightbulb is on.
+        """
+        return self._lightbulb.is_on()
+
     def frame(self):
         """Capture a frame for fast video streaming.
 
@@ -37,57 +151,167 @@ class AutoCollimator(object):
         :class:`bytes`
             The frame.
         """
-        with self._lock:
-            return self._camera.frame()
+        # the hardware encoder produces the frames while recording, so the
+        # hardware thread is not blocked while waiting for the next frame
+        jpeg = self._camera.recorded_frame()
+        if jpeg is not None:
+            return jpeg
+        # not recording, or the recording stopped (e.g., the resolution is changing)
+        return self._call(PRIORITY_STREAM, self._camera.frame)
+
+    def capture(self, *, after=None, scene=None, brightness=None, priority=PRIORITY_MEASURE):
+        """Capture an image.
 
-    def capture(self):
-        """Capture an image into an OpenCV array.
+        If the camera is capturing continuously then the newest image that
+        was exposed with the current illumination is returned immediately
+        (or as soon as one is available after the illumination changed).
+
+        Parameters
+        ----------
+        after : :class:`int`, optional
+            The sequence number of a previous image. If the camera is capturing
+            continuously then wait for a newer image, otherwise ignored (a new
+            image is always captured).
+        scene : :class:`str`, optional
+            The illumination scene, see :meth:`illuminate`. If specified then
+            the scene is illuminated and the image is captured by the same
+            command, so another command cannot change the illumination in
+            between (unless the camera is capturing continuously).
+        brightness : :class:`float`, optional
+            The brightness of the LED ring for the ``view`` scene.
+        priority : :class:`int`, optional
+            The priority of the command, see :meth:`submit`. Use
+            :data:`PRIORITY_STREAM` for the images of a stream.
 
         Returns
         -------
-        :class:`numpy.ndarray`
-            The image as an OpenCV array.
+        :class:`~autocollimator.frames.Frame`
+            The image (as a read-only OpenCV array), sequence number, timestamp
+            and the brightness of the LED ring and whether the lightbulb was on
+            when the image was captured. The caller must release the frame,
+            e.g., by using a `with` statement.
         """
-        with self._lock:
-            return self._camera.capture()
+        if self._camera.continuous:
+            def command():
+                if scene is not None:
+                    self.illuminate(scene, brightness=brightness)
+                return self._illumination_seq, self._leds.get_brightness(), self._lightbulb.is_on()
+
+            seq, led_brightness, lightbulb = self._call(priority, command)
+            # the frames are captured in the background, so the
+            # hardware thread is not blocked while waiting
+            frame = self._camera.latest(after=max(after or 0, seq), timeout=10)
+            frame.led_brightness, frame.lightbulb = led_brightness, lightbulb
+            return frame
+
+        def command():
+            if scene is not None:
+                self.illuminate(scene, brightness=brightness)
+            frame = self._camera.capture()
+            frame.led_brightness, frame.lightbulb = self._leds.get_brightness(), self._lightbulb.is_on()
+            return frame
+
+        return self._call(priority, command)
+
+    def start_continuous(self):
+        """Start capturing images continuously in a background thread."""
+        self._call(PRIORITY_CONTROL, self._camera.start_continuous)
+
+    def stop_continuous(self):
+        """Stop capturing images continuously."""
+        self._call(PRIORITY_CONTROL, self._camera.stop_continuous)
+
+    def start_recording(self):
+        """Start recording MJPEG video, so that :meth:`frame` returns the
+        frames that the hardware encoder produces.
+
+        See :meth:`~autocollimator.camera.Camera.start_recording`.
+        """
+        self._call(PRIORITY_CONTROL, self._camera.start_recording)
+
+    def stop_recording(self):
+        """Stop recording MJPEG video."""
+        self._call(PRIORITY_CONTROL, self._camera.stop_recording)
 
     def close(self):
-        """Close the connection to the camera and turn off the lightbulb and LED ring."""
-        self.origin_stream_enabled = False
-        self.index_stream_enabled = False
-        with self._lock:
-            try:
-                self._camera.close()
-            except:
-                pass
-            try:
-                self._lightbulb.turn_off()
-            except:
-                pass
-            try:
-                self._leds.set_brightness(0, update=True)
-            except:
-                pass
+        """Close the connection to the camera and turn off the lightbulb and LED ring.
+
+        The commands that were submitted, but have not started, are cancelled.
+        """
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            future = Future()
+            # the devices are closed before any command that is waiting runs,
+            # then the hardware thread stops
+            self._commands.put((PRIORITY_MEASURE - 1, next(self._count), future, self._close, (), {}))
+            self._commands.put((PRIORITY_MEASURE - 1, next(self._count), None, None, (), {}))
+        if threading.current_thread() is not self._thread:
+            future.result()
+            self._thread.join()
+
+    def illuminate(self, scene, *, brightness=None):
+        """Set the illumination for a scene.
+
+        Only the devices whose state must change are updated, so setting the
+        scene that is already set does not change the illumination (and, in
+        continuous mode, the next image does not have to be skipped).
+
+        Parameters
+        ----------
+        scene : :class:`str`
+            One of ``measure`` (the LED ring is off and the lightbulb is on,
+            to locate the crosshair), ``view`` (the LED ring and the lightbulb
+            are on, to view the origin or the autocollimator) or ``dark`` (the
+            LED ring and the lightbulb are off).
+        brightness : :class:`float`, optional
+            The brightness, as a percentage, of the LED ring for the ``view``
+            scene. If not specified then the brightness that was previously
+            used for the ``view`` scene (initially 50).
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the illumination changed.
+        """
+        if scene not in SCENES:
+            raise ValueError(f'Invalid scene {scene!r}, must be one of: {", ".join(SCENES)}')
+
+        def command():
+            nonlocal brightness
+            if scene == 'view':
+                if brightness is None:
+                    brightness = self._view_brightness
+                self._view_brightness = brightness
+                changed = self._set_leds(brightness, 127, None)
+            else:
+                changed = self._leds.set_brightness(0, update=True)
+            if scene == 'dark':
+                changed |= self._lightbulb.turn_off()
+            else:
+                changed |= self._lightbulb.turn_on()
+            if changed:
+                self._illumination_changed()
+            return changed
+
+        return self._call(PRIORITY_CONTROL, command)
 
     def resolution(self, resolution):
         """Set the resolution of the camera."""
-        with self._lock:
-            self._camera.set_resolution(resolution=resolution)
+        self._call(PRIORITY_CONTROL, self._camera.set_resolution, resolution)
 
     def turn_lightbulb_off(self):
         """Turn the lightbulb off."""
-        with self._lock:
-            self._lightbulb.turn_off()
+        self._call(PRIORITY_CONTROL, self._changed, self._lightbulb.turn_off)
 
     def turn_lightbulb_on(self):
         """Turn the lightbulb on."""
-        with self._lock:
-            self._lightbulb.turn_on()
+        self._call(PRIORITY_CONTROL, self._changed, self._lightbulb.turn_on)
 
     def turn_led_off(self):
         """Turn the LED's off."""
-        with self._lock:
-            self._leds.set_brightness(0, update=True)
+        self._call(PRIORITY_CONTROL, self._changed, self._leds.set_brightness, 0, update=True)
 
     def turn_led_on(self, *, brightness=50, greyscale=127, indices=None):
         """Turn the specified LED's on.
@@ -101,10 +325,69 @@ class AutoCollimator(object):
         indices : :class:`list` of :class:`int`, optional
             The LED indices to turn on. Default is to turn all on.
         """
-        with self._lock:
-            if indices is None:
-                indices = list(range(self._leds.num_leds()))
-            self._leds.set_brightness(brightness)
-            for index in indices:
-                self._leds.set_rgb(index, greyscale, greyscale, greyscale)
-            self._leds.update()
+        self._call(PRIORITY_CONTROL, self._changed, self._set_leds, brightness, greyscale, indices)
+
+    def _call(self, priority, function, *args, **kwargs):
+        # run a command in the hardware thread and wait for the result, if
+        # already in the hardware thread (a command that calls another
+        # method) then run it immediately
+        if threading.current_thread() is self._thread:
+            return function(*args, **kwargs)
+        return self.submit(function, *args, priority=priority, **kwargs).result()
+
+    def _changed(self, function, *args, **kwargs):
+        # call a function that returns whether the illumination changed
+        if function(*args, **kwargs):
+            self._illumination_changed()
+
+    def _close(self):
+        try:
+            self._camera.close()
+        except:
+            pass
+        try:
+            self._lightbulb.turn_off()
+        except:
+            pass
+        try:
+            self._leds.set_brightness(0, update=True)
+        except:
+            pass
+
+    def _run(self):
+        while True:
+            _, _, future, function, args, kwargs = self._commands.get()
+            if future is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        # the autocollimator was closed, cancel the commands that are waiting
+        while True:
+            try:
+                future = self._commands.get_nowait()[2]
+            except queue.Empty:
+                break
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError('The autocollimator has been closed'))
+
+    def _set_leds(self, brightness, greyscale, indices):
+        # the LED ring is only updated if the buffer changed
+        if indices is None:
+            indices = range(self._leds.num_leds())
+        self._leds.set_brightness(brightness)
+        for index in indices:
+            self._leds.set_rgb(index, greyscale, greyscale, greyscale)
+        return self._leds.update()
+
+    def _illumination_changed(self):
+        # the frame that is currently being exposed may have been exposed
+        # before the illumination changed, so it must also be skipped
+        if self._camera.continuous:
+            self._illumination_seq = self._camera.seq + 1
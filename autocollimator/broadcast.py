@@ -0,0 +1,197 @@
+import threading
+
+
+class Subscription(object):
+
+    def __init__(self, broadcaster):
+        """Receives the data that a :class:`Broadcaster` produces.
+
+        Only the most recent data is kept, so if the subscriber is slower
+        than the producer then data is dropped (for this subscriber only).
+        Iterate over the subscription to receive the data. The iteration
+        stops when the subscription is closed, or when the broadcaster stops.
+
+        Parameters
+        ----------
+        broadcaster : :class:`Broadcaster`
+            The broadcaster that the subscription belongs to.
+        """
+        super(Subscription, self).__init__()
+        self._broadcaster = broadcaster
+        self._condition = threading.Condition()
+        self._data = None
+        self._closed = False
+        self.dropped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.close()
+
+    def __iter__(self):
+        try:
+            while True:
+                data = self.get()
+                if data is None:
+                    return
+                yield data
+        finally:
+            self.close()
+
+    @property
+    def closed(self):
+        """:class:`bool`: Whether the subscription is closed."""
+        return self._closed
+
+    def close(self):
+        """Stop receiving data."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._broadcaster._unsubscribe(self)
+
+    def get(self, timeout=None):
+        """Wait for data.
+
+        Parameters
+        ----------
+        timeout : :class:`float`, optional
+            The maximum number of seconds to wait.
+
+        Returns
+        -------
+        The data, or :data:`None` if the subscription is closed (or if
+        no data was received before the timeout).
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or self._data is not None, timeout=timeout)
+            if self._closed:
+                return
+            data, self._data = self._data, None
+            return data
+
+    def _put(self, data):
+        with self._condition:
+            if self._data is not None:
+                self.dropped += 1
+            self._data = data
+            self._condition.notify_all()
+
+    def _end(self):
+        # the broadcaster stopped, it has already removed this subscription
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class Broadcaster(object):
+
+    def __init__(self, produce, *, name=None):
+        """Produce data once and send it to any number of subscribers.
+
+        The data is produced in a background thread, which starts when the
+        first subscriber subscribes and stops when the last subscriber
+        unsubscribes (or when :meth:`stop` is called).
+
+        Parameters
+        ----------
+        produce : :obj:`callable`
+            A generator function, ``produce(stop)``, that yields the data
+            (e.g., the encoded frames of a video stream). `stop` is a
+            :class:`threading.Event` that is set when the broadcaster stops,
+            the generator must check it before it produces more data (a stop
+            is otherwise only noticed when the generator yields). The
+            generator is closed when the broadcaster stops.
+        name : :class:`str`, optional
+            The name of the broadcaster (and of the background thread).
+        """
+        super(Broadcaster, self).__init__()
+        self._produce = produce
+        self._name = name
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._thread = None
+        self._stopped = False
+        self._stop_event = threading.Event()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} name={self._name!r} subscribers={len(self._subscribers)}>'
+
+    @property
+    def name(self):
+        """:class:`str`: The name of the broadcaster."""
+        return self._name
+
+    @property
+    def stopped(self):
+        """:class:`bool`: Whether the broadcaster has stopped (it cannot be restarted)."""
+        return self._stopped
+
+    def subscribe(self):
+        """Subscribe to the data.
+
+        Returns
+        -------
+        :class:`Subscription`
+            The subscription.
+
+        Raises
+        ------
+        RuntimeError
+            If the broadcaster has stopped.
+        """
+        subscription = Subscription(self)
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError(f'The {self._name!r} broadcaster has stopped')
+            self._subscribers.append(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+        return subscription
+
+    def stop(self, *, wait=False):
+        """Stop producing data and end all subscriptions.
+
+        Parameters
+        ----------
+        wait : :class:`bool`, optional
+            Whether to wait for the background thread to finish (e.g., before
+            the state of the hardware that the data is produced from changes).
+        """
+        with self._lock:
+            self._stopped = True
+            self._stop_event.set()
+            subscribers, self._subscribers = self._subscribers, []
+            thread = self._thread
+        for subscription in subscribers:
+            subscription._end()
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            try:
+                self._subscribers.remove(subscription)
+            except ValueError:
+                pass
+            if not self._subscribers:
+                self._stopped = True
+                self._stop_event.set()
+
+    def _run(self):
+        generator = self._produce(self._stop_event)
+        try:
+            for data in generator:
+                with self._lock:
+                    if self._stopped:
+                        break
+                    subscribers = list(self._subscribers)
+                for subscription in subscribers:
+                    subscription._put(data)
+        finally:
+            generator.close()
+            self.stop()
@@ -0,0 +1,281 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from .analysis import origin_position
+from .utils import (
+    CROP_PADDING,
+    ORIGIN_REGION,
+    Workspace,
+    crop_bounds,
+    from_crop,
+    locate_origin,
+)
+
+# the conversion factor for the Raspberry Pi HQ camera and the 6mm lens at 2560x1920
+DEFAULT_PIXELS_PER_ARCMIN = 17.9
+
+
+def default_path():
+    """Returns the default path of the calibration file.
+
+    The value of the ``AUTOCOLLIMATOR_CALIBRATION`` environment variable, if
+    it is defined, otherwise ``~/.autocollimator/calibration.json``.
+    """
+    try:
+        return os.environ['AUTOCOLLIMATOR_CALIBRATION']
+    except KeyError:
+        return os.path.join(os.path.expanduser('~'), '.autocollimator', 'calibration.json')
+
+
+def resolution_key(shape):
+    """Returns the WIDTHxHEIGHT key of the resolution of an image with the specified shape."""
+    height, width = shape[:2]
+    return f'{width}x{height}'
+
+
+class Calibration(object):
+
+    def __init__(self, path=None):
+        """The location of the origin and the ``pixels_per_arcmin`` conversion
+        factor, for each resolution of the camera.
+
+        The values are saved to a JSON file when they change and are loaded
+        from the file when the web application starts.
+
+        Parameters
+        ----------
+        path : :class:`str`, optional
+            The path of the calibration file. If not specified then uses
+            :func:`default_path`.
+        """
+        super(Calibration, self).__init__()
+        self._lock = threading.Lock()
+        self._path = path or default_path()
+        self._values = {}
+        if os.path.isfile(self._path):
+            with open(self._path) as fp:
+                self._values = json.load(fp)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} path={self._path!r}>'
+
+    @property
+    def path(self):
+        """:class:`str`: The path of the calibration file."""
+        return self._path
+
+    def origin(self, shape):
+        """Get the location of the origin.
+
+        Parameters
+        ----------
+        shape : :class:`tuple`
+            The shape of the image.
+
+        Returns
+        -------
+        :class:`dict` or :data:`None`
+            The x and y location of the origin, in pixel units, or :data:`None`
+            if the origin has not been saved for the resolution of the image.
+        """
+        with self._lock:
+            origin = self._values.get(resolution_key(shape), {}).get('origin')
+        if origin is None:
+            return
+        return {'x': origin['x'], 'y': origin['y']}
+
+    def pixels_per_arcmin(self, shape):
+        """Get the conversion factor to convert pixel units to arcmin units.
+
+        Parameters
+        ----------
+        shape : :class:`tuple`
+            The shape of the image.
+
+        Returns
+        -------
+        :class:`float`
+            The saved conversion factor for the resolution of the image, or
+            :data:`DEFAULT_PIXELS_PER_ARCMIN` if a value has not been saved.
+        """
+        with self._lock:
+            value = self._values.get(resolution_key(shape), {}).get('pixels_per_arcmin')
+        return DEFAULT_PIXELS_PER_ARCMIN if value is None else value
+
+    def update(self, shape, *, origin=None, pixels_per_arcmin=None):
+        """Update the calibration values and save them to the file.
+
+        Parameters
+        ----------
+        shape : :class:`tuple`
+            The shape of the image.
+        origin : :class:`dict`, optional
+            The x and y location of the origin, in pixel units.
+        pixels_per_arcmin : :class:`float`, optional
+            The conversion factor to convert pixel units to arcmin units.
+        """
+        with self._lock:
+            values = self._values.setdefault(resolution_key(shape), {})
+            if origin is not None:
+                values['origin'] = {'x': origin['x'], 'y': origin['y']}
+            if pixels_per_arcmin is not None:
+                values['pixels_per_arcmin'] = pixels_per_arcmin
+            values['timestamp'] = time.time()
+            self._save()
+
+    def _save(self):
+        # write to a temporary file then rename it, so that the calibration
+        # file is never left partially written (e.g., if the power is lost)
+        directory = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(self._values, fp, indent=2)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp, self._path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+class OriginMonitor(object):
+
+    def __init__(self, calibration, *, thresh=20, estimator='gaussian', interval=10.,
+                 drift=1., half_size=64):
+        """Verify the location of the origin that is saved in the calibration.
+
+        Locating the origin in the central region of the image, for every
+        image, is not necessary since the origin only moves if the camera
+        moves relative to the autocollimator. The origin is located within a
+        small window that is centred on the saved origin instead. The central
+        region of the image is only processed periodically, if the origin
+        was not found within the window, if the origin drifted from the saved
+        location or if the origin has not been saved. The origin is saved if
+        the location that was found in the central region drifted from the
+        saved location.
+
+        Parameters
+        ----------
+        calibration : :class:`Calibration`
+            The calibration values.
+        thresh : :class:`int`, optional
+            The threshold value. See :func:`~autocollimator.utils.locate_origin`.
+        estimator : :class:`str`, optional
+            The name of the sub-pixel peak estimator.
+            See :data:`~autocollimator.utils.ESTIMATORS`.
+        interval : :class:`float`, optional
+            The number of seconds between processing the central region of the image.
+        drift : :class:`float`, optional
+            The distance, in pixels, that the origin may be from the saved
+            location before the origin is considered to have moved.
+        half_size : :class:`int`, optional
+            Half the width (and height) of the window, in pixels.
+        """
+        super(OriginMonitor, self).__init__()
+        self.calibration = calibration
+        self.thresh = thresh
+        self.estimator = estimator
+        self.interval = interval
+        self.drift = drift
+        self.half_size = half_size
+        self._shape = None
+        self._verified = -math.inf
+        self._workspace = Workspace()
+
+    def locate(self, image, *, analyzer=None):
+        """Locate the origin.
+
+        Parameters
+        ----------
+        image : :class:`numpy.ndarray`
+            The image object.
+        analyzer : :class:`~autocollimator.analysis.Analyzer`, optional
+            If specified (and it has worker processes) then the image is
+            analysed by the analyzer, see
+            :func:`~autocollimator.analysis.origin_position`. Only the window
+            (or the central region) is copied to the analyzer. Otherwise the
+            image is analysed in the calling thread.
+
+        Returns
+        -------
+        :class:`dict`
+            See :func:`~autocollimator.utils.locate_origin`. The arrays in the
+            result are overwritten by the next call to :meth:`locate`. If the
+            image was analysed by an `analyzer` then only the location and the
+            offset are returned.
+        """
+        return self.submit(image, analyzer=analyzer)()
+
+    def submit(self, image, *, analyzer=None):
+        """Start to locate the origin.
+
+        If an `analyzer` is specified then this method returns while the
+        image is analysed, so the caller can, for example, capture the next
+        image in the meantime. Wait for the result of an image before the
+        next image is submitted.
+
+        Parameters
+        ----------
+        image : :class:`numpy.ndarray`
+            The image object. The image must not be modified until the result
+            is returned, since the central region is processed if the origin
+            is not found within the window.
+        analyzer : :class:`~autocollimator.analysis.Analyzer`, optional
+            See :meth:`locate`.
+
+        Returns
+        -------
+        :obj:`callable`
+            Call it (without arguments) to wait for the result. See :meth:`locate`.
+        """
+        saved = self.calibration.origin(image.shape)
+        now = time.monotonic()
+        if saved is not None and image.shape == self._shape and now - self._verified < self.interval:
+            d = 2 * self.half_size
+            window = (round(saved['x']) - self.half_size, round(saved['y']) - self.half_size, d, d)
+            wait = self._submit(image, window, analyzer)
+
+            def result():
+                located = wait()
+                if not self._moved(located, saved):
+                    return located
+                return self._verify(image.shape, self._submit(image, ORIGIN_REGION, analyzer)(), saved, now)
+
+            return result
+
+        wait = self._submit(image, ORIGIN_REGION, analyzer)
+        return lambda: self._verify(image.shape, wait(), saved, now)
+
+    def _submit(self, image, region, analyzer):
+        # start to locate the origin within a region, only a crop that contains the region is processed
+        bounds, region = crop_bounds(image.shape, region, pad=CROP_PADDING)
+        x0, y0, w, h = bounds
+        crop = image[y0:y0+h, x0:x0+w]
+        if analyzer is None or analyzer.workers == 0:
+            result = locate_origin(crop, thresh=self.thresh, estimator=self.estimator, region=region,
+                                   workspace=self._workspace)
+            return lambda: from_crop(result, x0, y0)
+        future = analyzer.submit(origin_position, crop, thresh=self.thresh,
+                                 estimator=self.estimator, region=region)
+        return lambda: from_crop(future.result(), x0, y0)
+
+    def _verify(self, shape, result, saved, now):
+        # the origin was located in the central region, save it if it moved
+        self._shape = shape
+        self._verified = now
+        if result['x'] is not None and result['y'] is not None:
+            if saved is None or self._moved(result, saved):
+                self.calibration.update(shape, origin=result)
+        return result
+
+    def _moved(self, result, saved):
+        # whether the origin was not found or is too far from the saved location
+        if result['x'] is None or result['y'] is None:
+            return True
+        return math.hypot(result['x'] - saved['x'], result['y'] - saved['y']) > self.drift
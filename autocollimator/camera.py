@@ -1,18 +1,151 @@
+import threading
 from io import BytesIO
 
-import picamera
-import numpy as np
+from .frames import (
+    FORMATS,
+    FramePool,
+)
+
+
+class _PoolOutput(object):
+
+    def __init__(self, pool):
+        """A file-like object that writes each capture into a frame from a pool."""
+        self._pool = pool
+        self._frame = None
+        self._offset = 0
+
+    def write(self, data):
+        if self._frame is None:
+            self._frame = self._pool.writable()
+            self._offset = 0
+        buffer = self._frame.buffer
+        n = min(len(data), buffer.size - self._offset)
+        buffer[self._offset:self._offset + n] = memoryview(data)[:n]
+        self._offset += n
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def publish(self):
+        """Publish the frame if a complete image was written to it, otherwise discard it."""
+        frame, self._frame = self._frame, None
+        if frame is None:
+            return
+        if self._offset == frame.buffer.size:
+            self._pool.publish(frame)
+        else:
+            frame.release()
+
+
+class _MJPEGOutput(object):
+
+    def __init__(self):
+        """A file-like object that the hardware MJPEG encoder writes to.
+
+        The encoder may write a frame in multiple chunks. Each complete JPEG
+        image becomes the most-recent frame.
+        """
+        self._condition = threading.Condition()
+        self._buffer = BytesIO()
+        self._jpeg = None
+        self._seq = 0
+        self._closed = False
+
+    def write(self, data):
+        if data[:2] == b'\xff\xd8':  # the start-of-image marker, discard an incomplete frame
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        self._buffer.write(data)
+        if data[-2:] == b'\xff\xd9':  # the end-of-image marker
+            with self._condition:
+                self._jpeg = self._buffer.getvalue()
+                self._seq += 1
+                self._condition.notify_all()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def next(self, *, timeout=None):
+        """Wait for the next frame.
+
+        Returns :data:`None` if the recording stopped or if no frame was
+        encoded before the timeout.
+        """
+        with self._condition:
+            seq = self._seq
+            self._condition.wait_for(lambda: self._closed or self._seq > seq, timeout=timeout)
+            if self._closed or self._seq == seq:
+                return
+            return self._jpeg
 
 
 class Camera(object):
 
-    def __init__(self, **kwargs):
-        """All keywords arguments are passed to :class:`picamera.PiCamera`."""
-        self._camera = picamera.PiCamera(**kwargs)
-        self._initialize_array()
+    def __init__(self, *, camera=None, buffers=4, format='yuv', **kwargs):
+        """The Raspberry Pi camera.
+
+        Parameters
+        ----------
+        camera : :class:`picamera.PiCamera`, optional
+            The camera object. If not specified then a :class:`picamera.PiCamera`
+            is created. Any object that has the same interface may be used,
+            e.g., a stand-in camera for testing.
+        buffers : :class:`int`, optional
+            The number of image buffers to preallocate.
+        format : :class:`str`, optional
+            The format to capture images in, ``yuv`` or ``bgr``. For ``yuv``,
+            the image of a captured :class:`~autocollimator.frames.Frame` is
+            the greyscale Y plane (a third of the size of a BGR image and it
+            does not need to be converted to greyscale to be analysed), see
+            :meth:`~autocollimator.frames.Frame.bgr` to get a colour image.
+        kwargs
+            All additional keyword arguments are passed to :class:`picamera.PiCamera`.
+        """
+        if format not in FORMATS:
+            raise ValueError(f'Invalid format {format!r}, must be one of: {", ".join(FORMATS)}')
+        if camera is None:
+            import picamera
+            camera = picamera.PiCamera(**kwargs)
+        self._camera = camera
+        self._buffers = buffers
+        self._format = format
+        self._pool = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._mjpeg = None
+        self._recorders = 0
+        self._initialize_pool()
+
+    @property
+    def continuous(self):
+        """:class:`bool`: Whether images are being captured continuously."""
+        return self._thread is not None
+
+    @property
+    def recording(self):
+        """:class:`bool`: Whether MJPEG video is being recorded, see :meth:`start_recording`."""
+        return self._mjpeg is not None
+
+    @property
+    def seq(self):
+        """:class:`int`: The sequence number of the most-recent image that was captured."""
+        return self._pool.seq
 
     def frame(self):
-        """Capture a frame for fast video streaming.
+        """Capture a JPEG image from the video port for fast video streaming.
+
+        See :meth:`recorded_frame` to get the frames that the hardware
+        encoder produces.
 
         Returns
         -------
@@ -24,26 +157,147 @@ class Camera(object):
             buffer.seek(0)
             return buffer.read()
 
+    def recorded_frame(self, *, timeout=1.):
+        """Wait for the next frame that the hardware encoder produces.
+
+        The camera is not accessed, so this method may be called while
+        another thread uses (or reconfigures) the camera.
+
+        Parameters
+        ----------
+        timeout : :class:`float`, optional
+            The maximum number of seconds to wait for a frame.
+
+        Returns
+        -------
+        :class:`bytes` or :data:`None`
+            The frame, or :data:`None` if the camera is not recording (see
+            :meth:`start_recording`), if the recording stopped (e.g., the
+            resolution is changing) or if no frame was encoded before the
+            timeout.
+        """
+        output = self._mjpeg
+        if output is None:
+            return
+        return output.next(timeout=timeout)
+
     def capture(self):
-        """Capture an image into an OpenCV array.
+        """Capture an image.
+
+        If images are being captured continuously then the most-recent
+        image is returned (without waiting for a new image to be captured).
 
         Returns
         -------
-        :class:`numpy.ndarray`
-            The image as an OpenCV array.
+        :class:`~autocollimator.frames.Frame`
+            The captured image. The caller must release the frame.
         """
-        self._camera.capture(self._array, format='bgr')
-        return self._array.reshape((self._height, self._width, 3))
+        if self.continuous:
+            return self._pool.latest()
+        frame = self._pool.writable()
+        self._camera.capture(frame.buffer, format=self._format)
+        self._pool.publish(frame)
+        return self._pool.latest()
+
+    def latest(self, *, after=None, timeout=None):
+        """Get the most-recent image that was captured.
+
+        Parameters
+        ----------
+        after : :class:`int`, optional
+            Wait for an image that has a sequence number greater than this value.
+        timeout : :class:`float`, optional
+            The maximum number of seconds to wait for an image.
+
+        Returns
+        -------
+        :class:`~autocollimator.frames.Frame`
+            The captured image. The caller must release the frame.
+        """
+        return self._pool.latest(after=after, timeout=timeout)
+
+    def start_continuous(self):
+        """Start capturing images continuously (from the video port) in a background thread."""
+        if self.continuous:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._capture_continuous, daemon=True)
+        self._thread.start()
+
+    def stop_continuous(self):
+        """Stop capturing images continuously."""
+        if not self.continuous:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def start_recording(self):
+        """Start recording MJPEG video for fast video streaming.
+
+        The frames are encoded by the GPU, at the frame rate of the camera,
+        and :meth:`recorded_frame` returns each frame as it is encoded. If
+        recording has already started then the recording continues until
+        :meth:`stop_recording` has been called as many times as this method.
+        """
+        self._recorders += 1
+        if self._mjpeg is None:
+            self._start_mjpeg()
+
+    def stop_recording(self):
+        """Stop recording MJPEG video, see :meth:`start_recording`."""
+        if self._recorders == 0:
+            return
+        self._recorders -= 1
+        if self._recorders == 0:
+            self._stop_mjpeg()
 
     def close(self):
         """Close the connection to the camera."""
+        self.stop_continuous()
+        self._recorders = 0
+        self._stop_mjpeg()
         self._camera.close()
 
     def set_resolution(self, resolution):
         """Set the resolution of the camera."""
+        continuous = self.continuous
+        recording = self.recording
+        self.stop_continuous()
+        self._stop_mjpeg()
         self._camera.resolution = resolution
-        self._initialize_array()
+        self._initialize_pool()
+        if continuous:
+            self.start_continuous()
+        if recording:
+            self._start_mjpeg()
+
+    def _capture_continuous(self):
+        output = _PoolOutput(self._pool)
+        # use a different splitter port than the one that frame() uses
+        for _ in self._camera.capture_continuous(output, format=self._format,
+                                                 use_video_port=True, splitter_port=2):
+            output.publish()
+            if self._stop_event.is_set():
+                break
+
+    def _start_mjpeg(self):
+        output = _MJPEGOutput()
+        # use a different splitter port than the ones that frame() and capture_continuous() use
+        self._camera.start_recording(output, format='mjpeg', splitter_port=1)
+        self._mjpeg = output
+
+    def _stop_mjpeg(self):
+        output, self._mjpeg = self._mjpeg, None
+        if output is None:
+            return
+        try:
+            self._camera.stop_recording(splitter_port=1)
+        finally:
+            output.close()
 
-    def _initialize_array(self):
-        self._width, self._height = self._camera.resolution
-        self._array = np.empty((self._width * self._height * 3,), dtype=np.uint8)
+    def _initialize_pool(self):
+        width, height = self._camera.resolution
+        seq = 0 if self._pool is None else self._pool.seq
+        shape = (height, width) if self._format == 'yuv' else (height, width, 3)
+        self._pool = FramePool(shape, size=self._buffers, seq=seq, format=self._format)
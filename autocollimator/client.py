@@ -0,0 +1,344 @@
+from base64 import b64decode
+from collections.abc import MutableMapping
+from json import loads
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class AutoCollimatorClient(object):
+
+    def __init__(self, host='pr-autocollimator', *, timeout=(3.05, 30.), retries=3,
+                 backoff_factor=0.1, pool_connections=1, pool_maxsize=4):
+        """A client for the web application that is running on the Raspberry Pi.
+
+        The connection to the Raspberry Pi is kept alive between requests.
+
+        Parameters
+        ----------
+        host : :class:`str`, optional
+            The hostname or IP address of the Raspberry Pi.
+        timeout : :class:`float` or :class:`tuple`, optional
+            The number of seconds to wait for the server to respond. Can also
+            be a (connect timeout, read timeout) tuple. If :data:`None` then
+            wait forever.
+        retries : :class:`int`, optional
+            The maximum number of times to retry a request if the connection
+            fails or if the server replies with a 502, 503 or 504 status code.
+            A request is not retried if the server does not reply in time
+            (it may be measuring, which would be triggered again).
+        backoff_factor : :class:`float`, optional
+            The factor to use to calculate the number of seconds to wait before
+            the next retry, i.e., ``backoff_factor * 2 ** (retry - 1)``.
+        pool_connections : :class:`int`, optional
+            The number of connection pools to cache.
+        pool_maxsize : :class:`int`, optional
+            The maximum number of connections to keep alive in the pool
+            (i.e., the number of threads that can send requests concurrently
+            without opening new connections).
+        """
+        super(AutoCollimatorClient, self).__init__()
+        self._host = host
+        self._timeout = timeout
+        retry = Retry(total=retries, read=0, backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} host={self._host!r}>'
+
+    @property
+    def host(self):
+        """:class:`str`: The hostname or IP address of the Raspberry Pi."""
+        return self._host
+
+    def close(self):
+        """Close all connections to the Raspberry Pi."""
+        self._session.close()
+
+    def crosshair(self, *, debug=False, show=False, origin=None, threshold=None,
+                  pixels_per_arcmin=None, estimator=None, track=True, frames=1,
+                  image='jpeg', quality=None, size=None, downscale=1):
+        """Fetch information about the current location of the crosshair.
+
+        Parameters
+        ----------
+        debug : :class:`bool`, optional
+            Whether to return a binary image of the localized crosshair and the
+            projections along the x and y axes as an <img> html tag.
+        show : :class:`bool`, optional
+            Whether to return an image of the localized crosshair as an
+            <img> html tag.
+        origin : :class:`list`, optional
+            The [x, y] location of the origin in pixel units.
+        threshold : :class:`int`, optional
+            A value between [0, 255] to filter the crosshair from the image.
+        pixels_per_arcmin : :class:`float`, optional
+            The conversion factor to convert pixel units to arcmin units.
+        estimator : :class:`str`, optional
+            The sub-pixel peak estimator to use to locate the crosshair, one of
+            ``gaussian``, ``centroid``, ``parabola`` or ``curve_fit``.
+        track : :class:`bool`, optional
+            Whether to only process a window around the location of the crosshair
+            from the previous call, instead of the full image.
+        frames : :class:`int`, optional
+            The number of frames to capture. If greater than 1 then the location
+            of the crosshair is the average of the location in each frame and the
+            returned dictionary also contains the standard deviations and the
+            location of the crosshair in each frame.
+        image : :class:`str`, optional
+            The type of image to return, one of ``none`` (no image, which is the
+            fastest), ``jpeg`` (the full-size image) or ``thumbnail`` (a smaller image).
+        quality : :class:`int`, optional
+            The JPEG quality of the image, between [0, 100].
+        size : :class:`int`, optional
+            The width, in pixels, of the image if `image` is ``thumbnail``.
+        downscale : :class:`int`, optional
+            If greater than 1 then the crosshair is first located in an image
+            that is downscaled by this factor and then only a small window of
+            the full-resolution image is processed (only if `frames` is 1).
+
+        Returns
+        -------
+        :class:`CrosshairReply` or :class:`str`
+            If `debug` or `show` is enabled then the <img> html tag as
+            a string. Otherwise, a dictionary containing the location of the
+            crosshair and the image (which is :data:`None` if `image` is
+            ``none``) is returned. The image is only decoded when it is accessed.
+        """
+        params = crosshair_params(
+            debug=debug, show=show, origin=origin, threshold=threshold,
+            pixels_per_arcmin=pixels_per_arcmin, estimator=estimator, track=track,
+            frames=frames, image=image, quality=quality, size=size, downscale=downscale)
+
+        reply = self._get('/crosshair', params=params)
+        reply.raise_for_status()
+
+        if debug or show:
+            return reply.content.decode()
+        return CrosshairReply(reply.json())
+
+    def crosshair_events(self, *, origin=None, threshold=None,
+                         pixels_per_arcmin=None, estimator=None, downscale=1):
+        """Continuously receive the location of the crosshair.
+
+        The location of the crosshair is pushed by the Raspberry Pi, as
+        Server-Sent Events, for every frame that the camera captures. No image
+        is transferred, so the update rate is much faster than calling
+        :meth:`crosshair` repeatedly.
+
+        Parameters
+        ----------
+        origin : :class:`list`, optional
+            The [x, y] location of the origin in pixel units.
+        threshold : :class:`int`, optional
+            A value between [0, 255] to filter the crosshair from the image.
+        pixels_per_arcmin : :class:`float`, optional
+            The conversion factor to convert pixel units to arcmin units.
+        estimator : :class:`str`, optional
+            The sub-pixel peak estimator to use to locate the crosshair, one of
+            ``gaussian``, ``centroid``, ``parabola`` or ``curve_fit``.
+        downscale : :class:`int`, optional
+            If greater than 1 then the crosshair is located coarse-to-fine when
+            the full image must be searched.
+
+        Yields
+        ------
+        :class:`dict`
+            The sequence number of the frame (``seq``), the time that the frame
+            was captured (``t``, seconds since the epoch) and the location of the
+            crosshair in pixel units (``x_pixel``, ``y_pixel``) and in arcmin
+            units (``x_arcmin``, ``y_arcmin``).
+        """
+        params = crosshair_params(origin=origin, threshold=threshold, pixels_per_arcmin=pixels_per_arcmin,
+                                  estimator=estimator, downscale=downscale)
+
+        with self._get('/crosshair/events', params=params, stream=True) as reply:
+            reply.raise_for_status()
+            for line in reply.iter_lines(decode_unicode=True):
+                if line.startswith('data:'):
+                    yield loads(line[5:])
+
+    def measurements(self, *, start=None, stop=None, limit=None):
+        """Fetch the measurements of the crosshair from the measurement log.
+
+        Parameters
+        ----------
+        start : :class:`float`, optional
+            The start time (inclusive), in seconds since the epoch. If not
+            specified then from the first measurement.
+        stop : :class:`float`, optional
+            The stop time (exclusive), in seconds since the epoch. If not
+            specified then until the last measurement.
+        limit : :class:`int`, optional
+            The maximum number of measurements (the earliest measurements
+            within the time range are returned). If not specified then the
+            maximum number that the web application returns in a request.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The measurements, in order of the time that the images were
+            captured, as a structured array. See
+            :data:`~autocollimator.measurements.DTYPE` for the fields.
+        """
+        # numpy is imported here so that it is not required to fetch the location of the crosshair
+        from io import BytesIO
+        import numpy as np
+
+        params = {'format': 'npy'}
+        if start is not None:
+            params['start'] = start
+        if stop is not None:
+            params['stop'] = stop
+        if limit is not None:
+            params['limit'] = limit
+        reply = self._get('/measurements', params=params)
+        reply.raise_for_status()
+        return np.load(BytesIO(reply.content), allow_pickle=False)
+
+    def shutdown(self):
+        """Shut down the Raspberry Pi."""
+        # not sent by the session, so that the request is not retried while the Raspberry Pi shuts down
+        requests.get(f'http://{self._host}/shutdown', timeout=self._timeout)
+
+    def _get(self, route, **kwargs):
+        return self._session.get(f'http://{self._host}{route}', timeout=self._timeout, **kwargs)
+
+
+def crosshair_params(*, debug=False, show=False, origin=None, threshold=None,
+                     pixels_per_arcmin=None, estimator=None, track=True, frames=1,
+                     image='jpeg', quality=None, size=None, downscale=1):
+    """Create the URL parameters for the /crosshair endpoint.
+
+    See :meth:`AutoCollimatorClient.crosshair` for the description of the parameters.
+
+    Returns
+    -------
+    :class:`dict`
+        The URL parameters.
+    """
+    params = {}
+    if debug:
+        params['debug'] = 1
+    if show:
+        params['show'] = 1
+    if origin:
+        params['origin'] = f'{origin[0]},{origin[1]}'
+    if threshold:
+        params['threshold'] = str(threshold)
+    if pixels_per_arcmin:
+        params['pixels_per_arcmin'] = str(pixels_per_arcmin)
+    if estimator:
+        params['estimator'] = estimator
+    if not track:
+        params['track'] = 0
+    if frames > 1:
+        params['frames'] = frames
+    if image != 'jpeg':
+        params['image'] = image
+    if quality is not None:
+        params['quality'] = str(quality)
+    if size:
+        params['size'] = str(size)
+    if downscale > 1:
+        params['downscale'] = downscale
+    return params
+
+
+class CrosshairReply(MutableMapping):
+
+    def __init__(self, json):
+        """The JSON reply from the /crosshair endpoint.
+
+        The reply behaves like a :class:`dict`. The image is kept as the JPEG
+        bytes that were received and is only decoded to an OpenCV array,
+        which requires :mod:`cv2` and :mod:`numpy`, when the ``image`` item
+        (or the :attr:`image` attribute) is accessed for the first time. A
+        script that only uses the location of the crosshair does not need
+        OpenCV to be installed.
+
+        Parameters
+        ----------
+        json : :class:`dict`
+            The JSON reply.
+        """
+        super(CrosshairReply, self).__init__()
+        self._data = dict(json)
+        self._b64 = self._data.get('image')
+        self._jpeg = None
+
+    def __getitem__(self, key):
+        if key == 'image' and self._b64:
+            self._data['image'] = decode_jpeg(self.jpeg)
+            self._b64 = None
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key == 'image':
+            self._b64, self._jpeg = None, None
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key == 'image':
+            self._b64, self._jpeg = None, None
+        del self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        # the image is not decoded
+        items = ', '.join(f'{key!r}: <JPEG image>' if key == 'image' and self._b64 else f'{key!r}: {value!r}'
+                          for key, value in self._data.items())
+        return f'{self.__class__.__name__}({{{items}}})'
+
+    def copy(self):
+        """Returns a shallow copy of the reply (the image is not decoded)."""
+        reply = CrosshairReply(self._data)
+        reply._b64, reply._jpeg = self._b64, self._jpeg
+        return reply
+
+    @property
+    def image(self):
+        """:class:`numpy.ndarray` or :data:`None`: The decoded image."""
+        return self['image']
+
+    @property
+    def jpeg(self):
+        """:class:`bytes` or :data:`None`: The JPEG image (not decoded)."""
+        if self._jpeg is None and self._b64:
+            self._jpeg = b64decode(self._b64)
+        return self._jpeg
+
+
+def decode_jpeg(data):
+    """Decode a JPEG image.
+
+    Parameters
+    ----------
+    data : :class:`bytes`
+        The JPEG image.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The image in OpenCV format.
+    """
+    # cv2 and numpy are imported here so that they are not required to fetch the location of the crosshair
+    import cv2 as cv
+    import numpy as np
+    return cv.imdecode(np.frombuffer(data, dtype=np.uint8), flags=cv.IMREAD_UNCHANGED)
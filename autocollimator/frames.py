@@ -0,0 +1,295 @@
+import threading
+import time
+from collections import deque
+
+import cv2 as cv
+import numpy as np
+
+# the formats that an image may be captured in
+FORMATS = ('bgr', 'yuv')
+
+
+def yuv_shape(shape):
+    """Returns the (height, width) of the Y plane of a YUV420 image.
+
+    The camera pads the width to a multiple of 32 and the height to a
+    multiple of 16.
+
+    Parameters
+    ----------
+    shape : :class:`tuple`
+        The shape of the image.
+    """
+    height, width = shape[:2]
+    return (height + 15) // 16 * 16, (width + 31) // 32 * 32
+
+
+class Frame(object):
+
+    def __init__(self, pool, shape, *, format='bgr'):
+        """An image buffer that belongs to a :class:`FramePool`.
+
+        A frame is reference counted. The frame is returned to the pool (and
+        its buffer will be reused) when the last reference is released, so the
+        :attr:`image` must not be used after calling :meth:`release`.
+
+        Parameters
+        ----------
+        pool : :class:`FramePool` or :data:`None`
+            The pool that the frame belongs to. If :data:`None` then the frame
+            is not returned to a pool when it is released.
+        shape : :class:`tuple`
+            The shape of the image, (height, width, 3) for ``bgr`` or
+            (height, width) for ``yuv``.
+        format : :class:`str`, optional
+            The format that the image is captured in, ``bgr`` or ``yuv``
+            (YUV420, only the Y plane is used as the :attr:`image`).
+        """
+        self._pool = pool
+        self._shape = shape
+        self._format = format
+        if format == 'yuv':
+            height, width = yuv_shape(shape)
+            size = height * width * 3 // 2
+        else:
+            size = int(np.prod(shape))
+        self._buffer = np.empty((size,), dtype=np.uint8)
+        self._refs = 0
+        self.seq = 0
+        self.timestamp = 0.
+        # the illumination when the image was captured (if known), see AutoCollimator.capture
+        self.led_brightness = None
+        self.lightbulb = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.release()
+
+    def __repr__(self):
+        return f'<Frame seq={self.seq} timestamp={self.timestamp} shape={self._shape}>'
+
+    @property
+    def buffer(self):
+        """:class:`numpy.ndarray`: The writable, flat, buffer to capture an image into."""
+        return self._buffer
+
+    @property
+    def format(self):
+        """:class:`str`: The format that the image is captured in."""
+        return self._format
+
+    @property
+    def image(self):
+        """:class:`numpy.ndarray`: A read-only view of the image (in OpenCV format).
+
+        If the format is ``yuv`` then the image is the Y plane (a greyscale
+        image, which is all that the analysis requires). Copy the image if it
+        needs to be modified, e.g., to draw on it.
+        """
+        if self._format == 'yuv':
+            height, width = yuv_shape(self._shape)
+            view = self._buffer[:height * width].reshape(height, width)[:self._shape[0], :self._shape[1]]
+        else:
+            view = self._buffer.reshape(self._shape)
+        view.flags.writeable = False
+        return view
+
+    @property
+    def shape(self):
+        """:class:`tuple`: The shape of the image."""
+        return self._shape
+
+    def bgr(self, region=None):
+        """Get the image in BGR format.
+
+        Parameters
+        ----------
+        region : :class:`tuple`, optional
+            The (x, y, w, h) region, in pixels, of the image to get. If not
+            specified then the full image. Only the region is converted.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The image. If the format is ``yuv`` then the image is converted
+            to a new (writable) array, otherwise a read-only view of the
+            image is returned.
+        """
+        if region is None:
+            x, y, w, h = 0, 0, self._shape[1], self._shape[0]
+        else:
+            x, y, w, h = region
+        if self._format != 'yuv':
+            return self.image[y:y+h, x:x+w]
+
+        height, width = yuv_shape(self._shape)
+        if region is None:
+            yuv = self._buffer.reshape(height * 3 // 2, width)
+            return cv.cvtColor(yuv, cv.COLOR_YUV2BGR_I420)[:h, :w]
+
+        # the U and V planes have half the resolution, so the region that is converted must
+        # start and end on even pixels (the padded width and height of the planes are even)
+        x0, y0 = x - x % 2, y - y % 2
+        x1, y1 = x + w + (x + w) % 2, y + h + (y + h) % 2
+        cw, ch = x1 - x0, y1 - y0
+        n = height * width
+        yuv = np.empty(cw * ch * 3 // 2, dtype=np.uint8)
+        yuv[:cw * ch].reshape(ch, cw)[:] = self._buffer[:n].reshape(height, width)[y0:y1, x0:x1]
+        for i in range(2):
+            plane = self._buffer[n + i * n // 4:n + (i + 1) * n // 4].reshape(height // 2, width // 2)
+            start = cw * ch + i * cw * ch // 4
+            yuv[start:start + cw * ch // 4].reshape(ch // 2, cw // 2)[:] = plane[y0//2:y1//2, x0//2:x1//2]
+        bgr = cv.cvtColor(yuv.reshape(ch * 3 // 2, cw), cv.COLOR_YUV2BGR_I420)
+        return bgr[y - y0:y - y0 + h, x - x0:x - x0 + w]
+
+    def acquire(self):
+        """Increment the reference count.
+
+        Returns
+        -------
+        :class:`Frame`
+            The frame.
+        """
+        if self._pool is None:
+            self._refs += 1
+        else:
+            with self._pool._lock:
+                self._refs += 1
+        return self
+
+    def release(self):
+        """Decrement the reference count and, if unreferenced, return the buffer to the pool."""
+        if self._pool is None:
+            self._refs -= 1
+        else:
+            self._pool._release(self)
+
+
+class FramePool(object):
+
+    def __init__(self, shape, *, size=4, seq=0, format='bgr'):
+        """A ring of preallocated image buffers.
+
+        A producer (e.g., a camera) requests a :meth:`writable` frame, captures
+        an image into its :attr:`~Frame.buffer` and then calls :meth:`publish`.
+        Consumers get the most-recently published frame with
+        :meth:`latest` and must :meth:`~Frame.release` the frame when finished
+        with it.
+
+        Parameters
+        ----------
+        shape : :class:`tuple`
+            The shape of each image.
+        size : :class:`int`, optional
+            The number of buffers to preallocate.
+        seq : :class:`int`, optional
+            The sequence number of the last frame that was published
+            (the sequence numbers continue from this value).
+        format : :class:`str`, optional
+            The format that the images are captured in. See :class:`Frame`.
+        """
+        self._lock = threading.Lock()
+        self._published = threading.Condition(self._lock)
+        self._shape = shape
+        self._format = format
+        self._free = deque(Frame(self, shape, format=format) for _ in range(size))
+        self._latest = None
+        self._seq = seq
+
+    @property
+    def seq(self):
+        """:class:`int`: The sequence number of the most-recently published frame."""
+        return self._seq
+
+    @property
+    def format(self):
+        """:class:`str`: The format that the images are captured in."""
+        return self._format
+
+    @property
+    def shape(self):
+        """:class:`tuple`: The shape of each image."""
+        return self._shape
+
+    def writable(self):
+        """Get a frame to capture an image into.
+
+        If all buffers in the ring are in use then a new buffer is allocated
+        (which is not returned to the ring when it is released).
+
+        Returns
+        -------
+        :class:`Frame`
+            A frame that is owned by the caller.
+        """
+        with self._lock:
+            if self._free:
+                frame = self._free.popleft()
+            else:
+                frame = Frame(None, self._shape, format=self._format)
+            frame._refs = 1
+            return frame
+
+    def publish(self, frame):
+        """Make a frame that was captured the most-recently published frame.
+
+        The reference to the frame that the caller owns is transferred to the pool.
+
+        Parameters
+        ----------
+        frame : :class:`Frame`
+            A frame from :meth:`writable`.
+        """
+        with self._lock:
+            self._seq += 1
+            frame.seq = self._seq
+            frame.timestamp = time.time()
+            frame.led_brightness = None
+            frame.lightbulb = None
+            previous, self._latest = self._latest, frame
+            if previous is not None:
+                self._decrement(previous)
+            self._published.notify_all()
+
+    def latest(self, *, after=None, timeout=None):
+        """Get the most-recently published frame.
+
+        Parameters
+        ----------
+        after : :class:`int`, optional
+            Wait for a frame that has a sequence number greater than this value.
+        timeout : :class:`float`, optional
+            The maximum number of seconds to wait for a frame.
+
+        Returns
+        -------
+        :class:`Frame`
+            The frame. The caller must release the frame.
+
+        Raises
+        ------
+        TimeoutError
+            If a frame was not published before the timeout.
+        """
+        if after is None:
+            after = 0
+        with self._lock:
+            ok = self._published.wait_for(
+                lambda: self._latest is not None and self._latest.seq > after,
+                timeout=timeout)
+            if not ok:
+                raise TimeoutError(f'No frame was published after {timeout} seconds')
+            self._latest._refs += 1
+            return self._latest
+
+    def _decrement(self, frame):
+        # the lock must already be acquired
+        frame._refs -= 1
+        if frame._refs == 0 and frame._pool is self:
+            self._free.append(frame)
+
+    def _release(self, frame):
+        with self._lock:
+            self._decrement(frame)
@@ -1,9 +1,6 @@
-from rpi_ws281x import PixelStrip
-
-
 class LEDRing(object):
 
-    def __init__(self, *, number=24, channel=18, **kwargs):
+    def __init__(self, *, number=24, channel=18, strip=None, **kwargs):
         """The LED ring (NeoPixel) from Duinotech (Adafruit).
 
         Parameters
@@ -12,12 +9,24 @@ class LEDRing(object):
             The number of LED's that the NeoPixel has.
         channel : :class:`int`, optional
             The GPIO channel that is connected to the DATA IN on the NeoPixel.
+        strip : :class:`rpi_ws281x.PixelStrip`, optional
+            The LED strip. If not specified then a :class:`rpi_ws281x.PixelStrip`
+            is created. Any object that has the same interface may be used.
         kwargs
             All additional keyword arguments are passed to :class:`rpi_ws281x.PixelStrip`.
         """
-        self._neopixel = PixelStrip(number, channel, **kwargs)
+        if strip is None:
+            from rpi_ws281x import PixelStrip
+            strip = PixelStrip(number, channel, **kwargs)
+        self._neopixel = strip
         self._neopixel.begin()
 
+        # the state in the buffer and the state that is displayed (the
+        # display is unknown until the buffer is shown for the first time)
+        self._brightness = self._neopixel.getBrightness()
+        self._pixels = [(0, 0, 0)] * self._neopixel.numPixels()
+        self._displayed = None
+
     def get_brightness(self):
         """Get the brightness of all LED's.
 
@@ -26,7 +35,20 @@ class LEDRing(object):
         :class:`float`
             The brightness, as a percentage, between [0, 100].
         """
-        return 100. * self._neopixel.getBrightness() / 255.
+        return 100. * self._brightness / 255.
+
+    def is_on(self):
+        """Whether any LED is displayed with a non-zero brightness and colour.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the LED ring is on.
+        """
+        if self._displayed is None:
+            return False
+        brightness, pixels = self._displayed
+        return brightness > 0 and any(any(pixel) for pixel in pixels)
 
     def num_leds(self):
         """Get the number of LEDs in the ring.
@@ -36,7 +58,7 @@ class LEDRing(object):
         :class:`int`
             The number of LEDs in the ring.
         """
-        return self._neopixel.numPixels()
+        return len(self._pixels)
 
     def set_brightness(self, brightness, *, update=False):
         """Set the brightness percentage of all LED's.
@@ -48,11 +70,20 @@ class LEDRing(object):
         update : :class:`bool`, optional
             Whether to update the LED brightness immediately or to just set the
             brightness in the buffer.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the display was updated. Always :data:`False` if `update`
+            is :data:`False`.
         """
         b = round(255.0 * min(max(0, brightness), 100) / 100.0)
-        self._neopixel.setBrightness(b)
+        if b != self._brightness:
+            self._neopixel.setBrightness(b)
+            self._brightness = b
         if update:
-            self.update()
+            return self.update()
+        return False
 
     def set_rgb(self, index, red, green, blue, *, update=False):
         """Set the RGB value of an LED.
@@ -70,11 +101,41 @@ class LEDRing(object):
         update : :class:`bool`, optional
             Whether to update the LED colour immediately or to just set the
             colour in the buffer.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the display was updated. Always :data:`False` if `update`
+            is :data:`False`.
         """
-        self._neopixel.setPixelColorRGB(index, red, green, blue)
+        rgb = (red, green, blue)
+        if rgb != self._pixels[index]:
+            self._neopixel.setPixelColorRGB(index, red, green, blue)
+            self._pixels[index] = rgb
         if update:
-            self.update()
+            return self.update()
+        return False
 
-    def update(self):
-        """Update the display with the data from the buffer."""
+    def update(self, *, force=False):
+        """Update the display with the data from the buffer.
+
+        Each update is a transfer to the LED ring (and changes the illumination,
+        which then has to settle), so the display is only updated if the buffer
+        has changed since the previous update.
+
+        Parameters
+        ----------
+        force : :class:`bool`, optional
+            Whether to update the display even if the buffer has not changed.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the display was updated.
+        """
+        state = (self._brightness, tuple(self._pixels))
+        if not force and state == self._displayed:
+            return False
         self._neopixel.show()
+        self._displayed = state
+        return True
@@ -1,26 +1,40 @@
-import RPi.GPIO as GPIO
-
-
 class Lightbulb(object):
 
-    def __init__(self, channel=19):
+    def __init__(self, channel=19, *, gpio=None):
         """Control the state of the autocollimator's lightbulb.
 
         Parameters
         ----------
         channel : :class:`int`, optional
             The GPIO channel that controls the voltage regulator.
+        gpio : :mod:`RPi.GPIO`, optional
+            The GPIO module. If not specified then :mod:`RPi.GPIO` is used.
+            Any object that has the same interface may be used.
         """
         super(Lightbulb, self).__init__()
 
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self._gpio = gpio
         self._channel = channel
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(channel, GPIO.OUT, initial=GPIO.LOW)
+        self._on = False
+        gpio.setmode(gpio.BCM)
+        gpio.setup(channel, gpio.OUT, initial=gpio.LOW)
 
     def close(self):
         """Turn off the lightbulb and clean up GPIO resources."""
         self.turn_off()
-        GPIO.cleanup()
+        self._gpio.cleanup()
+
+    def is_on(self):
+        """Whether the lightbulb is on.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the lightbulb is on.
+        """
+        return self._on
 
     def toggle(self):
         """Toggle the state of the lightbulb.
@@ -28,12 +42,32 @@ class Lightbulb(object):
         If it is currently on then turn it off.
         If it is currently off then turn it on.
         """
-        GPIO.output(self._channel, not GPIO.input(self._channel))
+        self._set(not self._on)
 
     def turn_on(self):
-        """Turn the lightbulb on."""
-        GPIO.output(self._channel, GPIO.HIGH)
+        """Turn the lightbulb on.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the state of the lightbulb changed.
+        """
+        return self._set(True)
 
     def turn_off(self):
-        """Turn the lightbulb off."""
-        GPIO.output(self._channel, GPIO.LOW)
+        """Turn the lightbulb off.
+
+        Returns
+        -------
+        :class:`bool`
+            Whether the state of the lightbulb changed.
+        """
+        return self._set(False)
+
+    def _set(self, on):
+        # only write to the GPIO channel if the state changes
+        if on == self._on:
+            return False
+        self._gpio.output(self._channel, self._gpio.HIGH if on else self._gpio.LOW)
+        self._on = on
+        return True
@@ -0,0 +1,260 @@
+"""
+An append-only, on-disk, log of the measurements of the crosshair.
+
+Each measurement is a fixed-size record (see :data:`DTYPE`) that is appended
+to a binary file. When the file reaches a maximum size a new file is started.
+
+The measurements are not appended in the order that the images were captured
+(a measurement is appended after it is analysed, by different threads) and the
+clock of the Raspberry Pi may jump (it does not have a real-time clock, so the
+clock jumps when it is synchronised by NTP after booting). Therefore, every
+record also has the time that it was appended (see ``logged``) which never
+decreases, and the files are named and searched by this time. The files are
+memory mapped as NumPy structured arrays to query a time range, so only the
+records that were appended within (at most :data:`MAX_DELAY` seconds after)
+the time range are read from disk.
+"""
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# the fields of a record (a value that is not known is NaN)
+DTYPE = np.dtype([
+    ('t', '<f8'),               # the time that the image was captured (seconds since the epoch)
+    ('seq', '<u8'),             # the sequence number of the (last) image
+    ('x_pixel', '<f8'),         # the location of the crosshair, in pixels
+    ('y_pixel', '<f8'),
+    ('x_arcmin', '<f8'),        # the location of the crosshair relative to the origin, in arcmin
+    ('y_arcmin', '<f8'),
+    ('x_pixel_std', '<f4'),     # the standard deviation of the location, if multiple images were averaged
+    ('y_pixel_std', '<f4'),
+    ('frames', '<u2'),          # the number of images that were averaged
+    ('width', '<u2'),           # the resolution of the images
+    ('height', '<u2'),
+    ('led_brightness', '<f4'),  # the brightness of the LED ring, as a percentage
+    ('lightbulb', '?'),         # whether the lightbulb was on
+    ('logged', '<f8'),          # the time that the record was appended (never decreases)
+])
+
+# the maximum time, in seconds, between capturing an image and appending the
+# measurement to the log for the measurement to be found by a query
+MAX_DELAY = 60.
+
+_FILENAME = re.compile(r'^measurements-(\d+)\.bin$')
+
+
+def default_directory():
+    """Returns the default directory of the measurement log.
+
+    The value of the ``AUTOCOLLIMATOR_LOG`` environment variable, if it is
+    defined, otherwise ``~/.autocollimator/log``.
+    """
+    try:
+        return os.environ['AUTOCOLLIMATOR_LOG']
+    except KeyError:
+        return os.path.join(os.path.expanduser('~'), '.autocollimator', 'log')
+
+
+class MeasurementLog(object):
+
+    def __init__(self, directory=None, *, max_bytes=64 * 1024 * 1024):
+        """An append-only log of the measurements of the crosshair.
+
+        Parameters
+        ----------
+        directory : :class:`str`, optional
+            The directory to write the files to. If not specified then
+            :func:`default_directory` is used. The directory is created
+            if it does not exist.
+        max_bytes : :class:`int`, optional
+            The maximum size, in bytes, of a file before a new file is started.
+        """
+        super(MeasurementLog, self).__init__()
+        self._directory = directory or default_directory()
+        self._max_records = max(1, max_bytes // DTYPE.itemsize)
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = 0
+        os.makedirs(self._directory, exist_ok=True)
+
+        # continue from the last record (and file name) so that they never decrease
+        self._logged = 0.
+        self._name = 0
+        files = self.files()
+        if files:
+            self._name, path = files[-1]
+            records = read(path)
+            if records.size > 0:
+                self._logged = float(records[-1]['logged'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignore):
+        self.close()
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} directory={self._directory!r}>'
+
+    @property
+    def directory(self):
+        """:class:`str`: The directory of the files."""
+        return self._directory
+
+    def append(self, **values):
+        """Append a measurement to the log.
+
+        Parameters
+        ----------
+        values
+            The values of the fields of the record, see :data:`DTYPE`. The
+            ``t`` field defaults to the current time. A field that is not
+            specified, or is :data:`None`, is NaN (or 0 for an integer field).
+            The ``logged`` field is always set by the log.
+        """
+        record = np.zeros(1, dtype=DTYPE)
+        for name in DTYPE.names:
+            if DTYPE[name].kind == 'f':
+                record[name] = np.nan
+        record['t'] = time.time()
+        for name, value in values.items():
+            if value is not None and name != 'logged':
+                record[name] = value
+        with self._lock:
+            # the time is taken while the lock is acquired, so the records are in order of this time
+            self._logged = max(self._logged, time.time(), float(record['t'][0]))
+            record['logged'] = self._logged
+            if self._file is None or self._records >= self._max_records:
+                self._open(self._logged)
+            data = record.tobytes()
+            # a single write per record, so a record is never interleaved with another
+            self._file.write(data)
+            self._records += 1
+
+    def close(self):
+        """Close the file that is being written to."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def files(self):
+        """Returns the paths of the files, oldest first.
+
+        Returns
+        -------
+        :class:`list` of (:class:`int`, :class:`str`)
+            The name of each file, which is the time (in microseconds since
+            the epoch) that its first record was appended, and the path.
+        """
+        found = []
+        for name in os.listdir(self._directory):
+            match = _FILENAME.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self._directory, name)))
+        return sorted(found)
+
+    def query(self, start=None, stop=None, *, limit=None):
+        """Get the measurements within a time range.
+
+        The files are memory mapped, and the records are found by a binary
+        search of the times that they were appended, so only the files, and
+        only the records, that were appended from `start` until
+        :data:`MAX_DELAY` seconds after `stop` are read.
+
+        Parameters
+        ----------
+        start : :class:`float`, optional
+            The start time (inclusive), in seconds since the epoch. If not
+            specified then from the first measurement.
+        stop : :class:`float`, optional
+            The stop time (exclusive), in seconds since the epoch. If not
+            specified then until the last measurement.
+        limit : :class:`int`, optional
+            The maximum number of measurements to return (the earliest
+            measurements within the time range are returned). If not
+            specified then there is no limit.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The measurements that were captured within the time range, in
+            order of the time that the images were captured, as a structured
+            array (see :data:`DTYPE`).
+        """
+        start = -np.inf if start is None else start
+        stop = np.inf if stop is None else stop
+        slices = []
+        n = 0
+        for _, path in self.files():
+            records = read(path)
+            if records.size == 0 or records[-1]['logged'] < start:
+                continue
+            if records[0]['logged'] >= stop + MAX_DELAY:
+                break
+            # a measurement is appended after (but not more than MAX_DELAY after) the image was captured
+            i0 = _search(records, start)
+            i1 = _search(records, stop + MAX_DELAY)
+            t = records['t'][i0:i1]
+            selected = records[i0:i1][(t >= start) & (t < stop)]
+            if selected.size == 0:
+                continue
+            slices.append(np.array(selected))
+            n += selected.size
+            if limit is not None and n >= limit:
+                # the measurements that were captured after the limit'th measurement are not required
+                times = np.sort(np.concatenate([s['t'] for s in slices]))
+                stop = np.nextafter(times[limit - 1], np.inf)
+        if not slices:
+            return np.empty(0, dtype=DTYPE)
+        records = np.concatenate(slices)
+        records = records[np.argsort(records['t'], kind='stable')]
+        return records if limit is None else records[:limit]
+
+    def _open(self, t):
+        # the lock must already be acquired
+        if self._file is not None:
+            self._file.close()
+        # the name of the new file must be after the name of the previous file
+        self._name = max(int(t * 1e6), self._name + 1)
+        path = os.path.join(self._directory, f'measurements-{self._name}.bin')
+        # unbuffered, so a record is on disk (and is visible to query()) when append() returns
+        self._file = open(path, mode='ab', buffering=0)
+        self._records = os.path.getsize(path) // DTYPE.itemsize
+
+
+def read(path):
+    """Memory map a file of the measurement log.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path of the file.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        A read-only, memory-mapped, structured array of the measurements
+        (see :data:`DTYPE`). An incomplete record at the end of the file
+        (e.g., if the power was lost while a record was written) is ignored.
+    """
+    n = os.path.getsize(path) // DTYPE.itemsize
+    if n == 0:
+        return np.empty(0, dtype=DTYPE)
+    return np.memmap(path, dtype=DTYPE, mode='r', shape=(n,))
+
+
+def _search(records, t):
+    # the index of the first record that was appended at or after time t. numpy.searchsorted
+    # would copy the (strided) column of times, which reads the entire file
+    lo, hi = 0, records.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if records[mid]['logged'] < t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
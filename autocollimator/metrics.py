@@ -0,0 +1,279 @@
+"""
+Instrumentation of the web application.
+
+The duration of each stage of a request (e.g., capturing an image, processing
+the image, encoding the image) is added to the ``Server-Timing`` header of the
+response and to a histogram. The histograms, and the number of frames and
+the frame rate of the streams, are exposed in the Prometheus text format.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# the upper bounds, in seconds, of the buckets of a histogram
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Timings(object):
+
+    def __init__(self):
+        """The duration of each stage of a request.
+
+        If a stage occurs multiple times then the durations are summed.
+        """
+        super(Timings, self).__init__()
+        self._stages = {}
+
+    def __iter__(self):
+        return iter(self._stages.items())
+
+    def add(self, name, seconds):
+        """Add the duration of a stage.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the stage.
+        seconds : :class:`float`
+            The duration of the stage.
+        """
+        self._stages[name] = self._stages.get(name, 0.) + seconds
+
+    def update(self, timings):
+        """Add the duration of multiple stages.
+
+        Parameters
+        ----------
+        timings : :class:`dict`
+            The duration, in seconds, of each stage.
+        """
+        for name, seconds in timings.items():
+            self.add(name, seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the duration of a stage, use as a context manager.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the stage.
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def header(self):
+        """Returns the value of the ``Server-Timing`` header (the durations are in milliseconds)."""
+        return ', '.join(f'{name};dur={1e3 * seconds:.2f}' for name, seconds in self._stages.items())
+
+
+class Histogram(object):
+
+    def __init__(self, name, description, labels=(), *, buckets=BUCKETS):
+        """A histogram of values, e.g., the duration of a stage.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the metric.
+        description : :class:`str`
+            The description of the metric.
+        labels : :class:`tuple` of :class:`str`, optional
+            The names of the labels.
+        buckets : :class:`tuple` of :class:`float`, optional
+            The upper bounds of the buckets (in increasing order).
+        """
+        super(Histogram, self).__init__()
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, *labels):
+        """Add a value to the histogram.
+
+        Parameters
+        ----------
+        value : :class:`float`
+            The value.
+        labels
+            The values of the labels.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            try:
+                counts, total = self._values[labels]
+            except KeyError:
+                counts, total = [0] * (len(self.buckets) + 1), 0.
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def render(self):
+        """Returns the histogram in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            pairs = _pairs(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format(pairs + [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format(pairs)} {total}')
+            lines.append(f'{self.name}_count{_format(pairs)} {cumulative}')
+        return '\n'.join(lines)
+
+
+class Counter(object):
+
+    def __init__(self, name, description, labels=()):
+        """A value that only increases, e.g., the number of frames.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the metric.
+        description : :class:`str`
+            The description of the metric.
+        labels : :class:`tuple` of :class:`str`, optional
+            The names of the labels.
+        """
+        super(Counter, self).__init__()
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def increment(self, *labels):
+        """Increment the counter by 1.
+
+        Parameters
+        ----------
+        labels
+            The values of the labels.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + 1
+
+    def render(self):
+        """Returns the counter in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format(_pairs(self.labels, labels))} {value}')
+        return '\n'.join(lines)
+
+
+class Rate(object):
+
+    def __init__(self, name, description, labels=(), *, window=5.):
+        """The rate of events (e.g., the frame rate) within a rolling window.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the metric.
+        description : :class:`str`
+            The description of the metric.
+        labels : :class:`tuple` of :class:`str`, optional
+            The names of the labels.
+        window : :class:`float`, optional
+            The duration, in seconds, of the rolling window.
+        """
+        super(Rate, self).__init__()
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.window = window
+        self._lock = threading.Lock()
+        self._times = {}
+
+    def tick(self, *labels):
+        """Record that an event occurred.
+
+        Parameters
+        ----------
+        labels
+            The values of the labels.
+        """
+        now = time.monotonic()
+        with self._lock:
+            times = self._times.setdefault(labels, deque())
+            times.append(now)
+            while now - times[0] > self.window:
+                times.popleft()
+
+    def value(self, *labels):
+        """Returns the number of events per second within the rolling window.
+
+        Parameters
+        ----------
+        labels
+            The values of the labels.
+        """
+        now = time.monotonic()
+        with self._lock:
+            times = [t for t in self._times.get(labels, ()) if now - t <= self.window]
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def render(self):
+        """Returns the rate in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            keys = list(self._times)
+        for labels in keys:
+            lines.append(f'{self.name}{_format(_pairs(self.labels, labels))} {self.value(*labels)}')
+        return '\n'.join(lines)
+
+
+class Registry(object):
+
+    def __init__(self):
+        """A collection of metrics."""
+        super(Registry, self).__init__()
+        self._metrics = []
+
+    def counter(self, name, description, labels=()):
+        """Create a :class:`Counter` and add it to the registry."""
+        return self._add(Counter(name, description, labels))
+
+    def histogram(self, name, description, labels=(), **kwargs):
+        """Create a :class:`Histogram` and add it to the registry."""
+        return self._add(Histogram(name, description, labels, **kwargs))
+
+    def rate(self, name, description, labels=(), **kwargs):
+        """Create a :class:`Rate` and add it to the registry."""
+        return self._add(Rate(name, description, labels, **kwargs))
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+def _pairs(names, values):
+    return list(zip(names, values))
+
+
+def _format(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
@@ -0,0 +1,293 @@
+"""
+Replay the analysis on recorded images.
+
+Locate the crosshair (or the origin) in every image of a directory (e.g.,
+the images that were saved with :func:`autocollimator.saveas`) or in every
+frame of a video file, for example, to compare different thresholds or
+estimators on the same images. The images are analysed in chunks by a pool
+of processes and the results are written to a NumPy ``.npz`` file (one
+array per column).
+
+Usage::
+
+    autocollimator-replay PATH [--analysis crosshair] [--threshold 25] [--estimator gaussian]
+                               [--workers 3] [--chunksize 16] [--output replay.npz]
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+from .analysis import process_context
+from .utils import (
+    ESTIMATORS,
+    Workspace,
+    locate_crosshair,
+    locate_crosshair_stack,
+    locate_origin,
+)
+
+# the types of analysis that can be replayed
+ANALYSES = ('crosshair', 'origin')
+
+# the default threshold value of each analysis (the same as the web application)
+THRESHOLDS = {'crosshair': 25, 'origin': 30}
+
+# the file extensions of the images in a directory
+IMAGE_EXTENSIONS = ('.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff')
+
+
+def image_files(directory):
+    """Returns the paths of the images in a directory, sorted by filename.
+
+    Parameters
+    ----------
+    directory : :class:`str`
+        The directory.
+
+    Returns
+    -------
+    :class:`list` of :class:`str`
+        The paths of the images.
+    """
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def read_video(path):
+    """Read the frames of a video file.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        The path of the video file.
+
+    Yields
+    ------
+    :class:`numpy.ndarray`
+        Each frame, as a greyscale image.
+    """
+    capture = cv.VideoCapture(path)
+    if not capture.isOpened():
+        raise OSError(f'Cannot open the video file {path!r}')
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    finally:
+        capture.release()
+
+
+def locate(images, *, analysis='crosshair', thresh=None, estimator='gaussian'):
+    """Locate the crosshair (or the origin) in each image.
+
+    Parameters
+    ----------
+    images : :class:`numpy.ndarray` or :class:`list` of :class:`numpy.ndarray`
+        The images. If the images have the same shape (e.g., an (N, height,
+        width) stack) then the crosshair is located in all images at once,
+        see :func:`~autocollimator.utils.locate_crosshair_stack`. An image
+        may be :data:`None` (e.g., a file that could not be read).
+    analysis : :class:`str`, optional
+        Either ``crosshair`` or ``origin``.
+    thresh : :class:`int`, optional
+        The threshold value. If :data:`None` then the crosshair is filtered
+        from the images based on RGB values (the images must be BGR).
+    estimator : :class:`str`, optional
+        The name of the sub-pixel peak estimator.
+
+    Returns
+    -------
+    :class:`tuple` of :class:`numpy.ndarray`
+        The x and y locations (:data:`numpy.nan` if not found).
+    """
+    shapes = {None if image is None else image.shape for image in images}
+    if analysis == 'crosshair' and len(shapes) == 1 and None not in shapes:
+        located = locate_crosshair_stack(np.asarray(images), thresh=thresh, estimator=estimator)
+        return located['x'], located['y']
+
+    workspace = Workspace()
+    x = np.full(len(images), np.nan)
+    y = np.full(len(images), np.nan)
+    for i, image in enumerate(images):
+        if image is None:
+            continue
+        if analysis == 'origin':
+            located = locate_origin(image, thresh=thresh, estimator=estimator, workspace=workspace)
+        else:
+            located = locate_crosshair(image, thresh=thresh, estimator=estimator, workspace=workspace)
+        if located['x'] is not None:
+            x[i] = located['x']
+        if located['y'] is not None:
+            y[i] = located['y']
+    return x, y
+
+
+def _locate_files(paths, kwargs):
+    # runs in a worker process, so the images are also decoded in parallel
+    return locate([cv.imread(path, cv.IMREAD_GRAYSCALE) for path in paths], **kwargs)
+
+
+def _locate_stack(stack, kwargs):
+    # runs in a worker process
+    return locate(stack, **kwargs)
+
+
+def replay(path, *, analysis='crosshair', thresh=None, estimator='gaussian', workers=None,
+           chunksize=16, callback=None):
+    """Locate the crosshair (or the origin) in recorded images.
+
+    The images are analysed in chunks by a pool of processes. Only a few
+    chunks are read ahead of the processes, so the images of a large
+    directory (or video file) are never all in memory.
+
+    Parameters
+    ----------
+    path : :class:`str`
+        A directory of images or a video file.
+    analysis : :class:`str`, optional
+        Either ``crosshair`` or ``origin``.
+    thresh : :class:`int`, optional
+        The threshold value (the images are analysed in greyscale). Default
+        is the value that the web application uses, see :data:`THRESHOLDS`.
+    estimator : :class:`str`, optional
+        The name of the sub-pixel peak estimator.
+    workers : :class:`int`, optional
+        The number of processes. Default is the number of CPUs.
+    chunksize : :class:`int`, optional
+        The number of images in each chunk that is sent to a process.
+    callback : :obj:`callable`, optional
+        Called as ``callback(done)`` after each chunk, where `done` is the
+        number of images that have been analysed.
+
+    Returns
+    -------
+    :class:`dict`
+        The ``name`` of each image (the filename, or the frame number of a
+        video file) and the ``x`` and ``y`` location, as arrays.
+    """
+    if analysis not in ANALYSES:
+        raise ValueError(f'Invalid analysis {analysis!r}, must be one of: {", ".join(ANALYSES)}')
+    if estimator not in ESTIMATORS:
+        raise ValueError(f'Invalid estimator {estimator!r}, must be one of: {", ".join(ESTIMATORS)}')
+    if chunksize < 1:
+        raise ValueError(f'Invalid chunksize {chunksize}, must be >= 1')
+    if thresh is None:
+        thresh = THRESHOLDS[analysis]
+    kwargs = {'analysis': analysis, 'thresh': thresh, 'estimator': estimator}
+
+    if os.path.isdir(path):
+        paths = image_files(path)
+        names = [os.path.basename(p) for p in paths]
+        chunks = ((_locate_files, paths[i:i + chunksize], kwargs)
+                  for i in range(0, len(paths), chunksize))
+    elif os.path.isfile(path):
+        names = []
+        chunks = _video_chunks(path, chunksize, names, kwargs)
+    else:
+        raise FileNotFoundError(f'No such file or directory {path!r}')
+
+    workers = workers or os.cpu_count() or 1
+    xs, ys = [], []
+    with ProcessPoolExecutor(workers, mp_context=process_context()) as executor:
+        pending = deque()
+        done = 0
+        for chunk in chunks:
+            pending.append(executor.submit(*chunk))
+            # at most two chunks per process are waiting, so only a few chunks are in memory
+            while len(pending) > 2 * workers or (pending and pending[0].done()):
+                done = _collect(pending.popleft(), xs, ys, done, callback)
+        while pending:
+            done = _collect(pending.popleft(), xs, ys, done, callback)
+
+    return {
+        'name': np.asarray(names, dtype=str),
+        'x': np.concatenate(xs) if xs else np.empty(0),
+        'y': np.concatenate(ys) if ys else np.empty(0),
+    }
+
+
+def _collect(future, xs, ys, done, callback):
+    x, y = future.result()
+    xs.append(x)
+    ys.append(y)
+    done += len(x)
+    if callback is not None:
+        callback(done)
+    return done
+
+
+def _video_chunks(path, chunksize, names, kwargs):
+    # the frames of a video file must be decoded sequentially, so they are
+    # decoded in this process and a stack of frames is sent to a process
+    chunk = []
+    basename = os.path.basename(path)
+    for i, frame in enumerate(read_video(path)):
+        names.append(f'{basename}:{i}')
+        chunk.append(frame)
+        if len(chunk) == chunksize:
+            yield _locate_stack, np.asarray(chunk), kwargs
+            chunk = []
+    if chunk:
+        yield _locate_stack, np.asarray(chunk), kwargs
+
+
+def main():
+    """Console script to replay the analysis on recorded images."""
+    parser = argparse.ArgumentParser(description='Replay the analysis on recorded images.')
+    parser.add_argument(
+        'path',
+        help='a directory of images or a video file'
+    )
+    parser.add_argument(
+        '--analysis', choices=ANALYSES, default='crosshair',
+        help='locate the crosshair or the origin (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--threshold', type=int,
+        help='the threshold value (default: 25 for the crosshair, 30 for the origin)'
+    )
+    parser.add_argument(
+        '--estimator', choices=sorted(ESTIMATORS), default='gaussian',
+        help='the sub-pixel peak estimator (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--workers', type=int,
+        help='the number of processes (default: the number of CPUs)'
+    )
+    parser.add_argument(
+        '--chunksize', type=int, default=16,
+        help='the number of images that are sent to a process at a time (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--output', default='replay.npz',
+        help='the file to write the results to (default: %(default)s)'
+    )
+    args = parser.parse_args()
+
+    def progress(done):
+        print(f'\r{done} images', end='', flush=True)
+
+    t0 = time.perf_counter()
+    result = replay(args.path, analysis=args.analysis, thresh=args.threshold,
+                    estimator=args.estimator, workers=args.workers,
+                    chunksize=args.chunksize, callback=progress)
+    elapsed = time.perf_counter() - t0
+    n = result['x'].size
+    failed = int(np.count_nonzero(np.isnan(result['x']) | np.isnan(result['y'])))
+    thresh = THRESHOLDS[args.analysis] if args.threshold is None else args.threshold
+    np.savez(args.output, analysis=args.analysis, thresh=thresh, estimator=args.estimator, **result)
+    print(f'\r{n} images in {elapsed:.1f} s ({n / elapsed if elapsed else 0:.1f} images/s), '
+          f'{failed} not located, saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Simulated hardware so that the web application can run on a computer that is not a Raspberry Pi.
+
+The simulated devices have the same interface as the objects from the
+:mod:`picamera`, :mod:`RPi.GPIO` and :mod:`rpi_ws281x` packages, so they are
+passed to :class:`~autocollimator.camera.Camera`,
+:class:`~autocollimator.lightbulb.Lightbulb` and
+:class:`~autocollimator.led_ring.LEDRing` in place of the real hardware.
+"""
+import math
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from .frames import yuv_shape
+
+
+class Scene(object):
+
+    def __init__(self, *, resolution=(2560, 1920), crosshair=(1301.3, 947.6),
+                 origin=(1280., 960.), line_width=6., blur=2., noise=2.,
+                 framerate=30., seed=None):
+        """The image that the camera sees.
+
+        Positions are in pixel units at the specified `resolution` and are
+        scaled if the camera uses a different resolution.
+
+        When the LED ring is off, only the (illuminated) crosshair is visible
+        on a dark background. When the LED ring is on, the axes of the origin
+        reticle are visible as dark lines and the crosshair is red.
+
+        Parameters
+        ----------
+        resolution : :class:`tuple`, optional
+            The (width, height) of the sensor.
+        crosshair : :class:`tuple`, optional
+            The (x, y) location of the crosshair.
+        origin : :class:`tuple`, optional
+            The (x, y) location of the origin (where the axes of the reticle intersect).
+        line_width : :class:`float`, optional
+            The width of the lines of the crosshair and of the reticle.
+        blur : :class:`float`, optional
+            The standard deviation, in pixels, of the gaussian blur of the optics.
+        noise : :class:`float`, optional
+            The standard deviation, in greyscale units, of the noise of the sensor.
+        framerate : :class:`float`, optional
+            The maximum number of frames per second that the camera captures
+            when capturing continuously.
+        seed : :class:`int`, optional
+            The seed of the random-number generator of the noise.
+        """
+        self.resolution = tuple(int(v) for v in resolution)
+        self.crosshair = tuple(crosshair)
+        self.origin = tuple(origin)
+        self.line_width = line_width
+        self.blur = blur
+        self.noise = noise
+        self.framerate = framerate
+
+        self.brightness = 0  # of the LED ring, between [0, 255]
+        self.lightbulb = False
+
+        self._rng = np.random.default_rng(seed)
+        self._noise = {}
+        self._cache = (None, None)
+
+    def render(self, resolution):
+        """Render an image of the scene.
+
+        Parameters
+        ----------
+        resolution : :class:`tuple`
+            The (width, height) of the image.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The image, in BGR format.
+        """
+        key = (tuple(resolution), self.brightness, self.crosshair, self.origin,
+               self.line_width, self.blur)
+        if self._cache[0] != key:
+            self._cache = (key, self._render(resolution))
+        image = self._cache[1]
+        if self.noise > 0:
+            image = image + self._noise_for(image.shape)
+        return np.clip(image, 0, 255).astype(np.uint8)
+
+    def _render(self, resolution):
+        # render the noise-free image
+        width, height = resolution
+        scale = width / self.resolution[0]
+        x = np.arange(width, dtype=np.float32)
+        y = np.arange(height, dtype=np.float32)
+        w = self.line_width * scale
+        s = max(self.blur * scale, 1e-3)
+        crosshair = np.maximum.outer(
+            self._profile(y, self.crosshair[1] * scale, w, s),
+            self._profile(x, self.crosshair[0] * scale, w, s))
+
+        if self.brightness == 0:
+            image = np.empty((height, width, 3), dtype=np.float32)
+            image[:] = (200. * crosshair + 5.)[:, :, np.newaxis]
+        else:
+            reticle = np.maximum.outer(
+                self._profile(y, self.origin[1] * scale, w, s),
+                self._profile(x, self.origin[0] * scale, w, s))
+            # the lines of the reticle are opaque, the blur only affects the edges
+            reticle = np.minimum(1., 2. * reticle)
+            background = 40. + 180. * self.brightness / 255.
+            grey = 5. + (background - 5.) * (1. - reticle)
+            image = np.empty((height, width, 3), dtype=np.float32)
+            for channel, colour in enumerate((85., 85., 130.)):
+                image[:, :, channel] = grey + (colour - grey) * crosshair
+        return image
+
+    @staticmethod
+    def _profile(values, centre, width, sigma):
+        # a line of the specified width that is blurred by a gaussian
+        erf = np.vectorize(math.erf, otypes=[np.float32])
+        a = (values - centre + width / 2.) / (math.sqrt(2.) * sigma)
+        b = (values - centre - width / 2.) / (math.sqrt(2.) * sigma)
+        return 0.5 * (erf(a) - erf(b))
+
+    def _noise_for(self, shape):
+        # generating gaussian noise for every pixel of every frame is slow, so
+        # a random view of a larger, cached, noise pattern is used instead
+        try:
+            bank = self._noise[shape]
+        except KeyError:
+            bank_shape = (shape[0] + 64,) + shape[1:]
+            bank = self._rng.normal(0., self.noise, bank_shape).astype(np.float32)
+            self._noise[shape] = bank
+        offset = int(self._rng.integers(0, 64))
+        return bank[offset:offset + shape[0]]
+
+
+class SimulatedPiCamera(object):
+
+    def __init__(self, scene):
+        """A simulated :class:`picamera.PiCamera`.
+
+        Parameters
+        ----------
+        scene : :class:`Scene`
+            The scene that the camera sees.
+        """
+        self._scene = scene
+        self._closed = False
+        self._recording = None
+        self.resolution = scene.resolution
+
+    @property
+    def resolution(self):
+        """:class:`tuple`: The (width, height) of the images."""
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, value):
+        if self._recording is not None:
+            raise RuntimeError('Cannot change the resolution while recording')
+        if isinstance(value, str):
+            value = {'720p': (1280, 720), '1080p': (1920, 1080)}.get(value) or \
+                    tuple(int(v) for v in value.split('x'))
+        self._resolution = tuple(value)
+
+    def capture(self, output, format='jpeg', use_video_port=False, **ignore):
+        """Capture an image into `output` (a writable buffer or a file-like object)."""
+        _write(output, self._encode(format))
+
+    def capture_continuous(self, output, format='jpeg', use_video_port=False, **ignore):
+        """Capture images continuously into `output`, yielding after each image."""
+        period = 1. / self._scene.framerate
+        t0 = time.perf_counter()
+        while not self._closed:
+            _write(output, self._encode(format))
+            t0 += period
+            delay = t0 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                t0 = time.perf_counter()
+            yield output
+
+    @property
+    def recording(self):
+        """:class:`bool`: Whether the camera is recording."""
+        return self._recording is not None
+
+    def start_recording(self, output, format='mjpeg', **ignore):
+        """Start recording video into `output` (a file-like object) in a background thread."""
+        if format != 'mjpeg':
+            raise ValueError(f'The simulated camera does not support recording in the {format!r} format')
+        if self._recording is not None:
+            raise RuntimeError('The camera is already recording')
+        stop = threading.Event()
+        thread = threading.Thread(target=self._record, args=(output, stop), daemon=True)
+        self._recording = (thread, stop)
+        thread.start()
+
+    def stop_recording(self, **ignore):
+        """Stop recording video."""
+        if self._recording is None:
+            raise RuntimeError('The camera is not recording')
+        thread, stop = self._recording
+        stop.set()
+        thread.join()
+        self._recording = None
+
+    def close(self):
+        """Close the camera."""
+        self._closed = True
+        if self._recording is not None:
+            self.stop_recording()
+
+    def _record(self, output, stop):
+        # the hardware encoder writes each frame in multiple chunks
+        period = 1. / self._scene.framerate
+        t0 = time.perf_counter()
+        while not stop.is_set():
+            data = self._encode('jpeg').tobytes()
+            half = len(data) // 2
+            output.write(data[:half])
+            output.write(data[half:])
+            t0 += period
+            delay = t0 - time.perf_counter()
+            if delay > 0:
+                stop.wait(delay)
+            else:
+                t0 = time.perf_counter()
+
+    def _encode(self, format):
+        image = self._scene.render(self._resolution)
+        if format == 'bgr':
+            return image
+        if format == 'yuv':
+            # YUV420, the width is padded to a multiple of 32 and the height to a multiple of 16
+            height, width = image.shape[:2]
+            padded_height, padded_width = yuv_shape(image.shape)
+            padded = cv.copyMakeBorder(image, 0, padded_height - height, 0, padded_width - width,
+                                       cv.BORDER_REPLICATE)
+            return cv.cvtColor(padded, cv.COLOR_BGR2YUV_I420)
+        if format == 'jpeg':
+            return cv.imencode('.jpeg', image)[1]
+        raise ValueError(f'The simulated camera does not support the {format!r} format')
+
+
+class SimulatedPixelStrip(object):
+
+    def __init__(self, scene, number, *ignore, **ignored):
+        """A simulated :class:`rpi_ws281x.PixelStrip`.
+
+        Parameters
+        ----------
+        scene : :class:`Scene`
+            The scene that the LED ring illuminates.
+        number : :class:`int`
+            The number of LED's.
+        """
+        self._scene = scene
+        self._pixels = [(0, 0, 0)] * number
+        self._brightness = 0
+
+    def begin(self):
+        pass
+
+    def getBrightness(self):
+        return self._brightness
+
+    def numPixels(self):
+        return len(self._pixels)
+
+    def setBrightness(self, brightness):
+        self._brightness = brightness
+
+    def setPixelColorRGB(self, index, red, green, blue):
+        self._pixels[index] = (red, green, blue)
+
+    def show(self):
+        lit = any(any(pixel) for pixel in self._pixels)
+        self._scene.brightness = self._brightness if lit else 0
+
+
+class SimulatedGPIO(object):
+
+    BCM = 11
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, scene):
+        """A simulated :mod:`RPi.GPIO` module.
+
+        Parameters
+        ----------
+        scene : :class:`Scene`
+            The scene that the lightbulb illuminates.
+        """
+        self._scene = scene
+        self._state = {}
+
+    def cleanup(self):
+        self._state.clear()
+
+    def input(self, channel):
+        return self._state.get(channel, self.LOW)
+
+    def output(self, channel, value):
+        self._state[channel] = value
+        self._scene.lightbulb = bool(value)
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channel, direction, initial=LOW):
+        self._state[channel] = initial
+
+
+def _write(output, data):
+    # write data to a file-like object or copy it into a writable numpy buffer
+    if hasattr(output, 'write'):
+        output.write(data.tobytes())
+    else:
+        output[:] = data.reshape(-1)
+
+
+def simulated_devices(scene=None):
+    """Create the simulated camera, lightbulb and LED ring.
+
+    Parameters
+    ----------
+    scene : :class:`Scene`, optional
+        The scene that the camera sees. If not specified then a
+        :class:`Scene` with the default values is created.
+
+    Returns
+    -------
+    :class:`dict`
+        The ``camera``, ``lightbulb`` and ``leds`` keyword arguments for
+        :class:`~autocollimator.autocollimator.AutoCollimator`.
+    """
+    from .camera import Camera
+    from .led_ring import LEDRing
+    from .lightbulb import Lightbulb
+
+    if scene is None:
+        scene = Scene()
+    return {
+        'camera': Camera(camera=SimulatedPiCamera(scene)),
+        'lightbulb': Lightbulb(gpio=SimulatedGPIO(scene)),
+        'leds': LEDRing(strip=SimulatedPixelStrip(scene, 24)),
+    }
@@ -0,0 +1,217 @@
+import threading
+
+from .analysis import crosshair_position
+from .frames import Frame
+from .utils import (
+    CROP_PADDING,
+    Workspace,
+    crop_bounds,
+    from_crop,
+    locate_crosshair,
+)
+
+
+class Tracker(object):
+
+    def __init__(self, *, thresh=None, estimator='gaussian', half_size=128, margin=20, downscale=1):
+        """Track the location of the crosshair in a sequence of images.
+
+        The first image is processed at full frame. Each subsequent image is
+        only processed within a window that is centred on the last location
+        of the crosshair. If the crosshair cannot be located within the window,
+        or if it is too close to the edge of the window, then the full frame
+        is processed again.
+
+        The intermediate arrays are reused for each image (see
+        :class:`~autocollimator.utils.Workspace`), so the arrays in a result
+        are overwritten by the next call to :meth:`locate`.
+
+        Parameters
+        ----------
+        thresh : :class:`int`, optional
+            The threshold value. See :func:`~autocollimator.utils.locate_crosshair`.
+        estimator : :class:`str`, optional
+            The name of the sub-pixel peak estimator.
+            See :data:`~autocollimator.utils.ESTIMATORS`.
+        half_size : :class:`int`, optional
+            Half the width (and height) of the window, in pixels.
+        margin : :class:`int`, optional
+            The minimum distance, in pixels, that the crosshair must be from
+            the edge of the window to be considered as found (an edge of the
+            window that is also an edge of the image is ignored).
+        downscale : :class:`int`, optional
+            If greater than 1 then the full frame is searched coarse-to-fine.
+            See :func:`~autocollimator.utils.locate_coarse_to_fine`.
+        """
+        super(Tracker, self).__init__()
+        self._lock = threading.Lock()
+        self.thresh = thresh
+        self.estimator = estimator
+        self.half_size = half_size
+        self.margin = margin
+        self.downscale = downscale
+        self._shape = None
+        self._position = None
+        self._workspace = Workspace()
+
+    @property
+    def position(self):
+        """:class:`tuple` or :data:`None`: The last (x, y) location of the crosshair."""
+        return self._position
+
+    def locate(self, image, *, timings=None, analyzer=None):
+        """Locate the crosshair.
+
+        Parameters
+        ----------
+        image : :class:`numpy.ndarray` or :class:`~autocollimator.frames.Frame`
+            The image object. If a frame and the crosshair is filtered from
+            the image by its colour, then only the window (not the full
+            frame) is converted to BGR.
+        timings : :class:`dict`, optional
+            If specified then the time, in seconds, of each stage is added to it.
+            See :func:`~autocollimator.utils.locate_coarse_to_fine`.
+        analyzer : :class:`~autocollimator.analysis.Analyzer`, optional
+            If specified (and it has worker processes) then the image is
+            analysed by the analyzer, see
+            :func:`~autocollimator.analysis.crosshair_position`. Only the
+            window is copied to the analyzer. Otherwise the image is
+            analysed in the calling thread.
+
+        Returns
+        -------
+        :class:`dict`
+            See :func:`~autocollimator.utils.locate_crosshair`. The processed
+            image and the projections are of the window, if the window was
+            used. If the image was analysed by an `analyzer` then only the
+            location and the offset are returned.
+        """
+        return self.submit(image, timings=timings, analyzer=analyzer)()
+
+    def submit(self, image, *, timings=None, analyzer=None):
+        """Start to locate the crosshair.
+
+        If an `analyzer` is specified then this method returns while the
+        image is analysed, so the caller can, for example, capture the next
+        image in the meantime. Wait for the result of an image before the next
+        image is submitted, so that the window is centred on the last location.
+
+        Parameters
+        ----------
+        image : :class:`numpy.ndarray` or :class:`~autocollimator.frames.Frame`
+            The image object. The image must not be modified (or released)
+            until the result is returned, since the full frame is processed
+            if the crosshair is not found within the window.
+        timings : :class:`dict`, optional
+            See :meth:`locate`.
+        analyzer : :class:`~autocollimator.analysis.Analyzer`, optional
+            See :meth:`locate`.
+
+        Returns
+        -------
+        :obj:`callable`
+            Call it (without arguments) to wait for the result. See :meth:`locate`.
+        """
+        with self._lock:
+            if self._shape != image.shape:
+                self._shape = image.shape
+                self._position = None
+            position = self._position
+
+        if position is None:
+            wait = self._submit(image, None, timings, analyzer, downscale=self.downscale)
+            return lambda: self._update(wait())
+
+        window = self._window(image.shape, position)
+        wait = self._submit(image, window, timings, analyzer)
+
+        def result():
+            located = wait()
+            if not self._within(located, image.shape, window):
+                # process the full frame
+                located = self._submit(image, None, timings, analyzer, downscale=self.downscale)()
+            return self._update(located)
+
+        return result
+
+    def reset(self):
+        """Process the full frame for the next image."""
+        with self._lock:
+            self._position = None
+
+    def _submit(self, image, region, timings, analyzer, **kwargs):
+        # start to locate the crosshair within a region of the image (or the full image). Only
+        # a crop that contains the region is processed, with enough of the surrounding pixels
+        # for the result to be the same as processing the region of the full image
+        if region is None:
+            x0, y0 = 0, 0
+            crop = self._crop(image, None)
+        else:
+            bounds, region = crop_bounds(image.shape, region, pad=CROP_PADDING)
+            x0, y0 = bounds[:2]
+            crop = self._crop(image, bounds)
+
+        if analyzer is None or analyzer.workers == 0:
+            with self._lock:
+                result = locate_crosshair(crop, thresh=self.thresh, estimator=self.estimator, region=region,
+                                          workspace=self._workspace, timings=timings, **kwargs)
+            return lambda: from_crop(result, x0, y0)
+
+        future = analyzer.submit(crosshair_position, crop, thresh=self.thresh,
+                                 estimator=self.estimator, region=region, **kwargs)
+
+        def wait():
+            result = future.result()
+            if timings is not None:
+                for stage, seconds in result['timings'].items():
+                    timings[stage] = timings.get(stage, 0.) + seconds
+            return from_crop(result, x0, y0)
+
+        return wait
+
+    def _crop(self, image, bounds):
+        # the pixels of the image within the (x, y, w, h) bounds (a view, if possible)
+        if isinstance(image, Frame):
+            if self.thresh is None:
+                # only the crop is converted, since the crosshair is filtered by its colour
+                return image.bgr(bounds)
+            image = image.image
+        if bounds is None:
+            return image
+        x, y, w, h = bounds
+        return image[y:y+h, x:x+w]
+
+    def _window(self, shape, position):
+        # the (x, y, w, h) window that is centred on a position
+        height, width = shape[:2]
+        x, y = position
+        x0 = min(max(0, round(x) - self.half_size), width - 1)
+        y0 = min(max(0, round(y) - self.half_size), height - 1)
+        x1 = min(x0 + 2 * self.half_size, width)
+        y1 = min(y0 + 2 * self.half_size, height)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _within(self, result, shape, window):
+        # whether the crosshair was found within the window, and not too close to an edge
+        x, y = result['x'], result['y']
+        if x is None or y is None:
+            return False
+        height, width = shape[:2]
+        x0, y0, w, h = window
+        x1, y1 = x0 + w, y0 + h
+        # the margin only applies to the edges of the window that are not the edges of the image
+        if (x0 > 0 and x < x0 + self.margin) or (x1 < width and x > x1 - 1 - self.margin):
+            return False
+        if (y0 > 0 and y < y0 + self.margin) or (y1 < height and y > y1 - 1 - self.margin):
+            return False
+        return True
+
+    def _update(self, result):
+        # remember the location for the next image
+        with self._lock:
+            if result['x'] is None or result['y'] is None:
+                self._position = None
+            else:
+                self._position = (result['x'], result['y'])
+        return result
+
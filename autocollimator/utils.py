@@ -1,10 +1,17 @@
-from io import BytesIO
+import time
 from base64 import b64encode
+from functools import lru_cache
 
 import cv2 as cv
 import numpy as np
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
+
+# the region of the image that the origin is located in, by default
+ORIGIN_REGION = (0.4, 0.4, 0.2, 0.2)
+
+# the number of pixels around a region of interest to also copy when only a crop of
+# an image is analysed, so that closing and the peak estimators (see fit) behave as
+# they would in the full image
+CROP_PADDING = 16
 
 
 def adaptive_threshold(image, *, radius=2, use_mean=True, c=0):
@@ -38,7 +45,7 @@ def adaptive_threshold(image, *, radius=2, use_mean=True, c=0):
     return cv.adaptiveThreshold(image, 255, method, cv.THRESH_BINARY_INV, size, c)
 
 
-def threshold(image, value, *, inverse=True):
+def threshold(image, value, *, inverse=True, dst=None):
     """Apply a threshold to an image.
 
     Parameters
@@ -49,32 +56,40 @@ def threshold(image, value, *, inverse=True):
         The threshold value, between 0 and 255.
     inverse : :class:`bool, optional
         Whether to invert black and white values.
+    dst : :class:`numpy.ndarray`, optional
+        The array to write the thresholded image to.
 
     Returns
     -------
     The image with the threshold applied.
     """
-    image = greyscale(image)
+    if image.ndim > 2:
+        image = greyscale(image, dst=dst)
     inv = cv.THRESH_BINARY_INV if inverse else cv.THRESH_BINARY
-    _, out = cv.threshold(image, value, 255, inv)
+    _, out = cv.threshold(image, value, 255, inv, dst=dst)
     return out
 
 
-def greyscale(image):
+def greyscale(image, *, dst=None):
     """Convert an image to greyscale.
 
     Parameters
     ----------
     image : :class:`numpy.ndarray`
         The image object.
+    dst : :class:`numpy.ndarray`, optional
+        The array to write the greyscale image to.
 
     Returns
     -------
     The image converted to greyscale.
     """
     if image.ndim == 2:
-        return image
-    return cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        if dst is None:
+            return image
+        dst[:] = image
+        return dst
+    return cv.cvtColor(image, cv.COLOR_BGR2GRAY, dst=dst)
 
 
 def roi(image, x, y, w, h):
@@ -101,7 +116,36 @@ def roi(image, x, y, w, h):
     -------
     The cropped image.
     """
-    height, width = image.shape[:2]
+    x, y, w, h = roi_bounds(image.shape, x, y, w, h)
+    new = np.full(image.shape, 255, dtype=np.uint8)
+    new[y:y+h, x:x+w] = image[y:y+h, x:x+w]
+    return new
+
+
+def roi_bounds(shape, x, y, w, h):
+    """Get the bounds, in pixels, of a region of interest.
+
+    Parameters
+    ----------
+    shape : :class:`tuple`
+        The shape of the image.
+    x : :class:`int` or :class:`float`
+        The x value of the top-left corner.
+        If a :class:`float` then a number between 0 and 1.
+    y : :class:`int` or :class:`float`
+        The y value of the top-left corner.
+        If a :class:`float` then a number between 0 and 1.
+    w : :class:`int` or :class:`float`
+        The width of the region. If a :class:`float` then a number between 0 and 1.
+    h : :class:`int` or :class:`float`
+        The height of the region. If a :class:`float` then a number between 0 and 1.
+
+    Returns
+    -------
+    :class:`tuple`
+        The (x, y, w, h) values, in pixels, clipped to be within the image.
+    """
+    height, width = shape[:2]
 
     # rescale the input parameters if any of the parameters is a float
     if isinstance(x, float) or isinstance(y, float) or isinstance(w, float) or isinstance(h, float):
@@ -110,12 +154,67 @@ def roi(image, x, y, w, h):
         w = int(width * w)
         h = int(height * h)
 
-    new = np.ones(image.shape, dtype=np.uint8) * 255
-    new[y:y+h, x:x+w] = image[y:y+h, x:x+w]
-    return new
+    x0 = min(max(0, x), width)
+    y0 = min(max(0, y), height)
+    x1 = min(max(x0, x + w), width)
+    y1 = min(max(y0, y + h), height)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def crop_bounds(shape, region, *, pad=0):
+    """Get the bounds, in pixels, of a crop of an image that contains a region of interest.
+
+    Parameters
+    ----------
+    shape : :class:`tuple`
+        The shape of the image.
+    region : :class:`tuple`
+        The (x, y, w, h) region of interest. See :func:`roi_bounds`.
+    pad : :class:`int`, optional
+        The number of pixels that the crop extends beyond each side of the
+        region (the crop is clipped to be within the image).
+
+    Returns
+    -------
+    :class:`tuple`
+        The (x, y, w, h) bounds of the crop, in pixels of the image, and the
+        (x, y, w, h) bounds of the region, in pixels of the crop.
+    """
+    height, width = shape[:2]
+    x, y, w, h = roi_bounds(shape, *region)
+    x0, y0 = max(0, x - pad), max(0, y - pad)
+    x1, y1 = min(width, x + w + pad), min(height, y + h + pad)
+    return (x0, y0, x1 - x0, y1 - y0), (x - x0, y - y0, w, h)
+
+
+def from_crop(result, x0, y0):
+    """Convert the location in a crop of an image to the location in the image.
 
+    Parameters
+    ----------
+    result : :class:`dict`
+        The location, and the offset of the processed region, in the crop.
+        See :func:`locate_crosshair` or :func:`locate_origin`. Modified in place.
+    x0 : :class:`int`
+        The x value, in pixels of the image, of the top-left corner of the crop.
+    y0 : :class:`int`
+        The y value, in pixels of the image, of the top-left corner of the crop.
 
-def filter_crosshair(image, *, bgr1=(50, 50, 90), bgr2=(120, 120, 170)):
+    Returns
+    -------
+    :class:`dict`
+        The `result`.
+    """
+    if result['x'] is not None:
+        result['x'] += x0
+    if result['y'] is not None:
+        result['y'] += y0
+    x, y = result['offset']
+    result['offset'] = (x + x0, y + y0)
+    return result
+
+
+def filter_crosshair(image, *, bgr1=(50, 50, 90), bgr2=(120, 120, 170), dst=None):
     """Filter the crosshair from an image.
 
     Parameters
@@ -126,17 +225,19 @@ def filter_crosshair(image, *, bgr1=(50, 50, 90), bgr2=(120, 120, 170)):
         The (blue, green, red) lower bound.
     bgr2 : :class:`tuple`, optional
         The (blue, green, red) upper bound.
+    dst : :class:`numpy.ndarray`, optional
+        The array to write the filtered image to.
 
     Returns
     -------
     :class:`numpy.ndarray`
-        A new image, with the same shape as the input image, with only the
-        crosshair visible.
+        An image, with the same height and width as the input image, with
+        only the crosshair visible.
     """
-    return cv.inRange(image, bgr1, bgr2)
+    return cv.inRange(image, bgr1, bgr2, dst=dst)
 
 
-def closing(image, *, radius=2, iterations=3):
+def closing(image, *, radius=2, iterations=3, dst=None):
     """Apply closing to an image.
 
     Parameters
@@ -149,6 +250,8 @@ def closing(image, *, radius=2, iterations=3):
         i.e., 3x3 area.
     iterations : :class:`int`, optional
         The number of times dilation and erosion are applied.
+    dst : :class:`numpy.ndarray`, optional
+        The array to write the closed image to.
 
     Returns
     -------
@@ -156,9 +259,80 @@ def closing(image, *, radius=2, iterations=3):
     """
     if radius < 1:
         return image
+    return cv.morphologyEx(image, cv.MORPH_CLOSE, _kernel(radius), dst=dst, iterations=iterations)
+
+
+@lru_cache()
+def _kernel(radius):
+    # the structuring element for closing
     d = 2 * radius + 1
-    kernel = np.ones((d, d), dtype=np.uint8)
-    return cv.morphologyEx(image, cv.MORPH_CLOSE, kernel, iterations=iterations)
+    return np.ones((d, d), dtype=np.uint8)
+
+
+class Workspace(object):
+
+    def __init__(self):
+        """Preallocated arrays for locating the crosshair or the origin.
+
+        Processing an image requires an intermediate image (the filtered or
+        thresholded image, which closing is applied to in place) and the
+        projections.
+        A workspace keeps these arrays between calls, so that processing
+        a sequence of images that have the same resolution does not
+        allocate new arrays for each image.
+
+        The arrays in the result of a function that was called with a
+        workspace (the processed image and the projections) are views of
+        the arrays of the workspace, and are overwritten by the next call.
+        A workspace must not be used by multiple threads at the same time.
+        """
+        super(Workspace, self).__init__()
+        self._shape = None
+        self._buffers = {}
+
+    @property
+    def nbytes(self):
+        """:class:`int`: The number of bytes that are allocated."""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def array(self, name, shape, dtype=np.uint8):
+        """Get an array. The values of the array are not initialised.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            The name of the array. The memory of the array is reused by
+            the next call with the same name, if it is large enough.
+        shape : :class:`tuple`
+            The shape of the array.
+        dtype : :class:`numpy.dtype`, optional
+            The data type of the array.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            A C-contiguous array.
+        """
+        dtype = np.dtype(dtype)
+        size = dtype.itemsize * int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=np.uint8)
+            self._buffers[name] = buffer
+        return buffer[:size].view(dtype).reshape(shape)
+
+    def resize(self, shape):
+        """Release the arrays if the resolution of the images changed.
+
+        Parameters
+        ----------
+        shape : :class:`tuple`
+            The shape of the image that will be processed.
+        """
+        shape = tuple(shape[:2])
+        if shape != self._shape:
+            self._shape = shape
+            self._buffers.clear()
 
 
 def normalize(image, axis):
@@ -183,8 +357,147 @@ def normalize(image, axis):
     return summed / maximum
 
 
-def fit(data, *, n=10):
-    """Find the location of projected data along an axis via a gaussian fit.
+def _neighbourhood(data, n):
+    # the indices of the maximum value in each row and the values (and
+    # whether the index is within the bounds of the row) of the neighbouring
+    # pixels, i.e., an (m, 2n+1) array of values centred on the maximum
+    index = np.argmax(data, axis=1)
+    offsets = np.arange(-n, n + 1)
+    indices = index[:, np.newaxis] + offsets
+    valid = (indices >= 0) & (indices < data.shape[1])
+    values = np.take_along_axis(data, np.clip(indices, 0, data.shape[1] - 1), axis=1)
+    values = np.where(valid, values, 0.)
+    return index, offsets, values, valid
+
+
+def _estimate_gaussian(data, n):
+    # Caruana's method: fit a parabola to the logarithm of the data using
+    # weighted least squares (the weights are the square of the data to
+    # suppress the noise amplification of the logarithm at small values).
+    # A flat-topped (saturated) peak has no curvature, in which case the
+    # centroid is used instead.
+    index, k, values, valid = _neighbourhood(data, n)
+    positive = valid & (values > 0)
+    weights = np.where(positive, values * values, 0.)
+    z = weights * np.log(np.where(positive, values, 1.))
+    k2 = k * k
+    s0, s1, s2 = np.sum(weights, axis=1), weights @ k, weights @ k2
+    s3, s4 = weights @ (k2 * k), weights @ (k2 * k2)
+    t0, t1, t2 = np.sum(z, axis=1), z @ k, z @ k2
+
+    # solve the normal equations for the linear (b) and quadratic (c)
+    # coefficients using Cramer's rule
+    m00 = s2 * s4 - s3 * s3
+    m01 = s1 * s4 - s2 * s3
+    m02 = s1 * s3 - s2 * s2
+    determinant = s0 * m00 - s1 * m01 + s2 * m02
+    ok = (np.sum(positive, axis=1) >= 3) & (np.abs(determinant) > 1e-12)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = (s0 * (t1 * s4 - s3 * t2) - t0 * m01 + s2 * (s1 * t2 - t1 * s2)) / determinant
+        c = (s0 * (s2 * t2 - t1 * s3) - s1 * (s1 * t2 - t1 * s2) + t0 * m02) / determinant
+        offset = -b / (2. * c)
+    ok &= c < 0
+    ok &= np.abs(offset) <= n
+    if ok.all():
+        return index + offset
+    return np.where(ok, index + offset, _estimate_centroid(data, n))
+
+
+def _estimate_centroid(data, n):
+    # the intensity-weighted centroid of the neighbouring pixels
+    index, k, values, _ = _neighbourhood(data, n)
+    total = np.sum(values, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.sum(values * k, axis=1) / total
+    return np.where(total > 0, index + offset, np.nan)
+
+
+def _estimate_parabola(data, n):
+    # interpolate a parabola through the maximum value and its two neighbours
+    index, _, values, valid = _neighbourhood(data, 1)
+    left, centre, right = values.T
+    denominator = left - 2. * centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = 0.5 * (left - right) / denominator
+    ok = valid.all(axis=1) & (denominator < 0)
+    return np.where(ok, index + offset, np.nan)
+
+
+def _estimate_curve_fit(data, n):
+    # the reference implementation, an iterative least-squares gaussian fit
+    # (scipy is imported here since it takes a long time to import)
+    from scipy.optimize import curve_fit
+
+    def gauss(value, *p):
+        a, mu, sigma = p
+        return a * np.exp(-(value - mu) ** 2 / (2. * sigma ** 2))
+
+    out = np.full(data.shape[0], np.nan)
+    for i, row in enumerate(data):
+        max_index = np.argmax(row)
+        guess = [1., max_index, 1.]
+        x_range = np.arange(max(0, max_index - n), min(max_index + n, row.size))
+        try:
+            params, _ = curve_fit(gauss, x_range, row[x_range], p0=guess)
+        except (RuntimeError, TypeError, ValueError):
+            continue
+        out[i] = params[1]
+    return out
+
+
+ESTIMATORS = {
+    'gaussian': _estimate_gaussian,
+    'centroid': _estimate_centroid,
+    'parabola': _estimate_parabola,
+    'curve_fit': _estimate_curve_fit,
+}
+"""The sub-pixel peak estimators that are available to :func:`fit` and :func:`peak`.
+
+Each value is a callable that accepts an (m, L) array of projected data and
+the number of neighbouring pixels, `n`, and returns an array of length m
+containing the location of the peak in each row (:data:`numpy.nan` if the
+location could not be determined).
+
+* ``gaussian`` -- a log-parabola (Caruana) fit, a closed-form gaussian estimator
+  (the centroid is used if the peak is flat topped)
+* ``centroid`` -- the intensity-weighted centroid
+* ``parabola`` -- a three-point parabolic interpolation about the maximum value
+* ``curve_fit`` -- an iterative gaussian fit using :func:`scipy.optimize.curve_fit`
+"""
+
+
+def peak(data, *, n=10, estimator='gaussian'):
+    """Find the location of the peak of projected data along the last axis.
+
+    Parameters
+    ----------
+    data : :class:`numpy.ndarray`
+        The projected data. If a 2D array then the peak of each row is located.
+    n : :class:`int`, optional
+        The number of neighbouring pixels (to the left and to the right of
+        the maximum value) to include in the estimate.
+    estimator : :class:`str`, optional
+        The name of the estimator to use. See :data:`ESTIMATORS`.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The location of the peak(s). A value is :data:`numpy.nan` if the
+        location could not be determined.
+    """
+    try:
+        function = ESTIMATORS[estimator]
+    except KeyError:
+        raise ValueError(f'Invalid estimator {estimator!r}, must be one of: '
+                         f'{", ".join(ESTIMATORS)}') from None
+
+    data = np.asarray(data, dtype=float)
+    rows = data.reshape((-1, data.shape[-1]))
+    return function(rows, n).reshape(data.shape[:-1])
+
+
+def fit(data, *, n=10, estimator='gaussian'):
+    """Find the location of projected data along an axis.
 
     Parameters
     ----------
@@ -193,79 +506,79 @@ def fit(data, *, n=10):
     n : :class:`int`, optional
         The number of neighbouring pixels (to the left and to the right of
         the initial guess) to include in the fit.
+    estimator : :class:`str`, optional
+        The name of the estimator to use. See :data:`ESTIMATORS`.
 
     Returns
     -------
     :class:`float` or :data:`None`
-        The location determined by a gaussian fit. If curve fitting fails
+        The location of the peak. If the location cannot be determined
         then returns :data:`None`.
     """
-    def gauss(value, *p):
-        a, mu, sigma = p
-        return a * np.exp(-(value - mu) ** 2 / (2. * sigma ** 2))
-
-    max_index = np.argmax(data)
-    guess = [1., max_index, 1.]
-    x_range = np.arange(max(0, max_index - n), min(max_index + n, data.size))
-    try:
-        params, _ = curve_fit(gauss, x_range, data[x_range], p0=guess)
-        return round(params[1], 1)
-    except:
-        pass
+    value = float(peak(data, n=n, estimator=estimator))
+    if np.isnan(value):
+        return None
+    return round(value, 1)
 
 
-def plot_crosshair(crosshair):
+def plot_crosshair(crosshair, *, width=1000, quality=None):
     """Return a base64 string of the image that was used to locate the crosshair.
 
+    The processed image is drawn with the x projection above it and the
+    y projection to the right of it.
+
     Parameters
     ----------
     crosshair : :class:`dict`
-        The location of the crosshair.
+        The location of the crosshair. See :func:`locate_crosshair`.
+    width : :class:`int`, optional
+        The maximum width, in pixels, of the processed image in the plot.
+    quality : :class:`int`, optional
+        The JPEG quality, between [0, 100].
 
     Returns
     -------
     :class:`str`
         A base64 string of the plot.
     """
-    x_size = crosshair['x_projection'].size
-    y_size = crosshair['y_projection'].size
-
-    size = 10
-    fig = plt.figure(figsize=(size, size * y_size / x_size))
-
-    ax_image = plt.axes([0.0, 0.0, 0.9, 0.9])
-    ax_x = plt.axes([0.0, 0.9, 0.9, 0.1])
-    ax_y = plt.axes([0.9, 0.0, 0.1, 0.9])
-
-    ax_image.set_axis_off()
-    ax_x.set_axis_off()
-    ax_y.set_axis_off()
-
-    ax_x.plot(crosshair['x_projection'])
-    ax_y.plot(crosshair['y_projection'], np.flip(np.arange(y_size)))
+    image = crosshair['image']
+    if image.size == 0:
+        return ''
 
-    ax_x.set_xlim((0, crosshair['x_projection'].size - 1))
-    ax_y.set_ylim((0, crosshair['y_projection'].size - 1))
+    # the projections are of the full image, the processed image is of the region
+    h, w = image.shape[:2]
+    x0, y0 = crosshair.get('offset', (0, 0))
+    x_projection = crosshair['x_projection'][x0:x0+w]
+    y_projection = crosshair['y_projection'][y0:y0+h]
 
-    ax_image.imshow(crosshair['image'])
+    scale = min(1., width / w)
+    iw, ih = max(1, round(w * scale)), max(1, round(h * scale))
+    strip = max(32, iw // 9)
 
-    bbox = ax_x.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
-    ax_image.figure.set_size_inches(bbox.width, h=bbox.width * y_size / x_size)
+    plot = np.full((strip + ih, iw + strip, 3), 255, dtype=np.uint8)
+    image = cv.resize(image, (iw, ih), interpolation=cv.INTER_AREA)
+    if image.ndim == 2:
+        image = cv.applyColorMap(cv.normalize(image, None, 0, 255, cv.NORM_MINMAX), cv.COLORMAP_VIRIDIS)
+    plot[strip:, :iw] = image
 
-    x0, y0 = crosshair['x'], crosshair['y']
-    if x0 is not None and y0 is not None:
-        ax_image.text(x0, y0, f'({x0:.1f}, {y0:.1f})', color='white', size=16,
-                      verticalalignment='bottom', horizontalalignment='left')
-        ax_image.text(x0, y0, f'X', color='white', size=10,
-                      verticalalignment='center', horizontalalignment='center')
+    colour = (180, 119, 31)
+    for projection, length, horizontal in ((x_projection, iw, True), (y_projection, ih, False)):
+        if projection.size < 2:
+            continue
+        index = np.linspace(0, length - 1, projection.size)
+        value = (strip - 1) * (1. - np.clip(projection, 0, 1))
+        if horizontal:
+            points = np.column_stack((index, value))
+        else:
+            points = np.column_stack((iw + strip - 1 - value, strip + index))
+        cv.polylines(plot, [np.round(points).astype(np.int32)], False, colour, thickness=1, lineType=cv.LINE_AA)
 
-    with BytesIO() as buffer:
-        plt.savefig(buffer, format='jpeg')
-        buffer.seek(0)
-        b64 = b64encode(buffer.read()).decode()
+    x, y = crosshair['x'], crosshair['y']
+    if x is not None and y is not None:
+        position = {'x': (x - x0) * scale, 'y': strip + (y - y0) * scale}
+        add_marker(plot, position, (255, 255, 255), label=f'({x:.1f}, {y:.1f})')
 
-    plt.close(fig=fig)
-    return b64
+    return to_base64(plot, quality=quality)
 
 
 def add_marker(image, position, colour, label=None):
@@ -303,7 +616,8 @@ def add_marker(image, position, colour, label=None):
     cv.putText(image, 'X', pos, font_face, font_scale, colour, thickness=thickness)
 
 
-def locate_crosshair(image, *, thresh=None):
+def locate_crosshair(image, *, thresh=None, estimator='gaussian', region=None, workspace=None,
+                     downscale=1, half_size=64, timings=None):
     """Locate the crosshair.
 
     Parameters
@@ -313,37 +627,105 @@ def locate_crosshair(image, *, thresh=None):
     thresh : :class:`int`, optional
         The threshold value. If :data:`None` then filter the crosshair from the
         image based on RGB values.
+    estimator : :class:`str`, optional
+        The name of the sub-pixel peak estimator. See :data:`ESTIMATORS`.
+    region : :class:`tuple`, optional
+        The (x, y, w, h) region of interest to process. See :func:`roi_bounds`.
+        Pixels outside the region are treated as background. If not specified
+        then the full image is processed.
+    workspace : :class:`Workspace`, optional
+        The workspace to use for the intermediate arrays.
+    downscale : :class:`int`, optional
+        If greater than 1 then search coarse-to-fine. See :func:`locate_coarse_to_fine`.
+    half_size : :class:`int`, optional
+        Half the width (and height) of the full-resolution window of a
+        coarse-to-fine search.
+    timings : :class:`dict`, optional
+        If specified then the time, in seconds, of each stage is added to it.
+        See :func:`locate_coarse_to_fine`.
 
     Returns
     -------
     :class:`dict`
-        The location of the crosshair (in pixel units), the processed image
-        and the x and y projections.
+        The location of the crosshair (in pixel units of the full image), the
+        processed image (of the region), the x and y projections (of the full
+        image) and the (x, y) offset of the region within the full image.
     """
     if thresh is None:
-        img = filter_crosshair(image)
-        img = closing(img)
+        process, close = filter_crosshair, True
     else:
-        img = threshold(image, thresh, inverse=False)
+        def process(img, dst):
+            return threshold(img, thresh, inverse=False, dst=dst)
+        close = False
+    result = locate_coarse_to_fine(image, process, close=close, estimator=estimator, region=region,
+                                   workspace=workspace, downscale=downscale, half_size=half_size,
+                                   timings=timings)
+    if result['x'] is not None and result['x'] < 1:
+        result['x'] = None
+    if result['y'] is not None and result['y'] < 1:
+        result['y'] = None
+    return result
 
-    x_projection = normalize(img, axis=0)
-    y_projection = normalize(img, axis=1)
 
-    try:
-        x, y = fit(x_projection), fit(y_projection)
-    except:
-        x, y = None, None
+def locate_crosshair_stack(images, *, thresh=None, estimator='gaussian', inplace=False):
+    """Locate the crosshair in each image of a stack of images.
 
-    if x is not None and x < 1:
-        x = None
-    if y is not None and y < 1:
-        y = None
+    The projections of all images are computed in one pass and the peaks of
+    the projections are located using a vectorised estimator.
 
-    return {'x': x, 'y': y, 'image': img, 'x_projection': x_projection,
-            'y_projection': y_projection}
+    Parameters
+    ----------
+    images : :class:`numpy.ndarray`
+        The images, with shape (N, height, width) if greyscale or
+        (N, height, width, 3) if BGR.
+    thresh : :class:`int`, optional
+        The threshold value. If :data:`None` then filter the crosshair from the
+        images based on RGB values (the images must be BGR).
+    estimator : :class:`str`, optional
+        The name of the sub-pixel peak estimator. See :data:`ESTIMATORS`.
+    inplace : :class:`bool`, optional
+        Whether to apply the threshold in place, i.e., to overwrite the
+        (greyscale) images rather than to allocate another stack.
+
+    Returns
+    -------
+    :class:`dict`
+        The location of the crosshair (in pixel units) in each image, as
+        arrays of length N (a value is :data:`numpy.nan` if the crosshair
+        could not be located), and the (N, width) x projections and the
+        (N, height) y projections.
+    """
+    n, height, width = images.shape[:3]
+
+    # thresholding and colour filtering operate on each pixel independently,
+    # so the images are stacked vertically and processed by a single call
+    tall = images.reshape((n * height,) + images.shape[2:])
+    if thresh is None:
+        img = filter_crosshair(tall).reshape((n, height, width))
+        for i in range(n):
+            img[i] = closing(img[i])
+    else:
+        dst = tall if inplace and tall.ndim == 2 else None
+        img = threshold(tall, thresh, inverse=False, dst=dst).reshape((n, height, width))
 
+    projections = []
+    for axis in (1, 2):
+        summed = np.sum(img, axis=axis, dtype=np.uint32).astype(float)
+        maximum = np.max(summed, axis=1, keepdims=True)
+        projections.append(np.divide(summed, maximum, out=summed, where=maximum > 0))
+    x_projection, y_projection = projections
 
-def locate_origin(image, *, thresh=20):
+    x = peak(x_projection, estimator=estimator)
+    y = peak(y_projection, estimator=estimator)
+    with np.errstate(invalid='ignore'):
+        x[x < 1] = np.nan
+        y[y < 1] = np.nan
+
+    return {'x': x, 'y': y, 'x_projection': x_projection, 'y_projection': y_projection}
+
+
+def locate_origin(image, *, thresh=20, estimator='gaussian', region=ORIGIN_REGION,
+                  workspace=None, downscale=1, half_size=64, timings=None):
     """Locate the origin (where the x and y axes intersect).
 
     Parameters
@@ -352,27 +734,226 @@ def locate_origin(image, *, thresh=20):
         The image object.
     thresh : :class:`int`, optional
         The threshold value.
+    estimator : :class:`str`, optional
+        The name of the sub-pixel peak estimator. See :data:`ESTIMATORS`.
+    region : :class:`tuple`, optional
+        The (x, y, w, h) region of interest to process. See :func:`roi_bounds`.
+    workspace : :class:`Workspace`, optional
+        The workspace to use for the intermediate arrays.
+    downscale : :class:`int`, optional
+        If greater than 1 then search coarse-to-fine. See :func:`locate_coarse_to_fine`.
+    half_size : :class:`int`, optional
+        Half the width (and height) of the full-resolution window of a
+        coarse-to-fine search.
+    timings : :class:`dict`, optional
+        If specified then the time, in seconds, of each stage is added to it.
+        See :func:`locate_coarse_to_fine`.
+
+    Returns
+    -------
+    :class:`dict`
+        The location of the origin (in pixel units of the full image), the
+        processed image (of the region), the x and y projections (of the full
+        image) and the (x, y) offset of the region within the full image.
+    """
+    def process(img, dst):
+        return threshold(img, thresh, dst=dst)
+    return locate_coarse_to_fine(image, process, close=True, estimator=estimator, region=region,
+                                 workspace=workspace, downscale=downscale, half_size=half_size,
+                                 timings=timings)
+
+
+def locate_coarse_to_fine(image, process, *, close=True, estimator='gaussian', region=None,
+                          workspace=None, downscale=1, half_size=64, timings=None):
+    """Locate where the lines in an image intersect, using a coarse-to-fine search.
+
+    The region of the image is downscaled (by keeping every `downscale`
+    pixel, so that thin lines keep their colour instead of being blended
+    with the background) and the intersection is located in the downscaled
+    image. Then, only a window of the full-resolution image that is
+    centred on the coarse location is processed to locate the intersection
+    with sub-pixel precision. If the intersection is not found by the coarse
+    search then the full-resolution region is processed.
+
+    The value of `downscale` must be smaller than the width of the lines.
+
+    Parameters
+    ----------
+    image : :class:`numpy.ndarray`
+        The image object.
+    process : :obj:`callable`
+        A function, ``process(image, dst)``, that converts (a region of) the
+        image to a binary image where the lines are white.
+    close : :class:`bool`, optional
+        Whether to apply :func:`closing` to the binary image.
+    estimator : :class:`str`, optional
+        The name of the sub-pixel peak estimator. See :data:`ESTIMATORS`.
+    region : :class:`tuple`, optional
+        The (x, y, w, h) region of interest to process. See :func:`roi_bounds`.
+        If not specified then the full image is processed.
+    workspace : :class:`Workspace`, optional
+        The workspace to use for the intermediate arrays.
+    downscale : :class:`int`, optional
+        The factor to downscale the image by for the coarse search. If 1 then
+        the region is only processed at full resolution.
+    half_size : :class:`int`, optional
+        Half the width (and height) of the full-resolution window.
+    timings : :class:`dict`, optional
+        If specified then the time, in seconds, of each stage is added to it.
+        The stages are ``downscale`` (downscale the image for the coarse search),
+        ``process`` (convert the image to a binary image and apply :func:`closing`),
+        ``project`` (sum the rows and the columns) and ``fit`` (locate the peaks
+        of the projections). The times of the coarse and fine searches are summed.
 
     Returns
     -------
     :class:`dict`
-        The location of the origin, in pixel units, and the processed image.
+        The location of the intersection (in pixel units of the full image),
+        the processed image (of the region or of the window), the x and y
+        projections (of the full image) and the (x, y) offset of the region
+        or of the window within the full image.
     """
-    img = roi(image, 0.4, 0.4, 0.2, 0.2)
-    img = threshold(img, thresh)
-    img = closing(img)
-    x = fit(normalize(img, axis=0))
-    y = fit(normalize(img, axis=1))
-    return {'x': x, 'y': y, 'image': img}
+    if workspace is None:
+        workspace = Workspace()
+    workspace.resize(image.shape)
+
+    if downscale > 1:
+        height, width = image.shape[:2]
+        if region is None:
+            x0, y0, w, h = 0, 0, width, height
+        else:
+            x0, y0, w, h = roi_bounds(image.shape, *region)
+        cw, ch = w // downscale, h // downscale
+        if cw > 0 and ch > 0:
+            t0 = time.perf_counter() if timings is not None else None
+            coarse = cv.resize(image[y0:y0+h, x0:x0+w], (cw, ch),
+                               dst=workspace.array('coarse', (ch, cw) + image.shape[2:]),
+                               interpolation=cv.INTER_NEAREST)
+            if timings is not None:
+                _elapsed(timings, 'downscale', t0)
+            result = _locate_region(coarse, None, process, close, estimator, workspace,
+                                    prefix='coarse_', timings=timings)
+            if result['x'] is not None and result['y'] is not None:
+                x = round(x0 + result['x'] * w / cw)
+                y = round(y0 + result['y'] * h / ch)
+                wx0, wy0 = max(x0, x - half_size), max(y0, y - half_size)
+                wx1, wy1 = min(x0 + w, x + half_size + 1), min(y0 + h, y + half_size + 1)
+                if wx1 > wx0 and wy1 > wy0:
+                    window = (wx0, wy0, wx1 - wx0, wy1 - wy0)
+                    result = _locate_region(image, window, process, close, estimator, workspace,
+                                            timings=timings)
+                    if result['x'] is not None and result['y'] is not None:
+                        return result
+
+    return _locate_region(image, region, process, close, estimator, workspace, timings=timings)
+
+
+def _elapsed(timings, stage, t0):
+    # add the time since t0 to a stage and return the current time
+    t1 = time.perf_counter()
+    timings[stage] = timings.get(stage, 0.) + t1 - t0
+    return t1
+
+
+def _locate_region(image, region, process, close, estimator, workspace, *,
+                   prefix='', radius=2, iterations=3, timings=None):
+    # Only the region of interest (a view, not a copy) is processed. The
+    # result is identical to processing the full image with every pixel
+    # outside the region set to the background value (zero, after processing),
+    # since closing does not extend a shape beyond its bounding rectangle.
+    # The processed region is padded with zeros (on the sides that are not at
+    # the edge of the image) so that closing near the edge of the region
+    # behaves the same as it would in the full image.
+    height, width = image.shape[:2]
+    if region is None:
+        x0, y0, w, h = 0, 0, width, height
+    else:
+        x0, y0, w, h = roi_bounds(image.shape, *region)
+    if w == 0 or h == 0:
+        raise ValueError(f'The region of interest is empty, {region}')
+
+    top = left = bottom = right = 0
+    if close and radius > 0:
+        pad = 2 * radius * iterations
+        top = pad if y0 > 0 else 0
+        left = pad if x0 > 0 else 0
+        bottom = pad if y0 + h < height else 0
+        right = pad if x0 + w < width else 0
+
+    t = time.perf_counter() if timings is not None else None
+
+    # the processed region is written to the centre of the padded array
+    mask = workspace.array(prefix + 'mask', (h + top + bottom, w + left + right))
+    mask[:top] = 0
+    mask[top + h:] = 0
+    mask[top:top + h, :left] = 0
+    mask[top:top + h, left + w:] = 0
+    img = process(image[y0:y0+h, x0:x0+w], dst=mask[top:top+h, left:left+w])
+    if close and radius > 0:
+        # closing in place gives the same result, and is faster, than writing to another array
+        closing(mask, radius=radius, iterations=iterations, dst=mask)
+        img = mask[top:top+h, left:left+w]
+    if timings is not None:
+        t = _elapsed(timings, 'process', t)
+
+    # the sums of 8-bit values of each row and column fit in 32-bit integers
+    x_sum = cv.reduce(img, 0, cv.REDUCE_SUM, dst=workspace.array(prefix + 'x_sum', (1, w), np.int32), dtype=cv.CV_32S)
+    y_sum = cv.reduce(img, 1, cv.REDUCE_SUM, dst=workspace.array(prefix + 'y_sum', (h, 1), np.int32), dtype=cv.CV_32S)
+
+    x_projection = workspace.array(prefix + 'x_projection', (width,), float)
+    y_projection = workspace.array(prefix + 'y_projection', (height,), float)
+    x_projection.fill(0)
+    y_projection.fill(0)
+    x_projection[x0:x0+w] = x_sum[0]
+    y_projection[y0:y0+h] = y_sum[:, 0]
+    for projection in (x_projection, y_projection):
+        maximum = np.max(projection)
+        if maximum > 0:
+            projection /= maximum
+    if timings is not None:
+        t = _elapsed(timings, 'project', t)
+
+    x = fit(x_projection, estimator=estimator)
+    y = fit(y_projection, estimator=estimator)
+    if timings is not None:
+        _elapsed(timings, 'fit', t)
+
+    return {'x': x, 'y': y, 'image': img, 'x_projection': x_projection,
+            'y_projection': y_projection, 'offset': (x0, y0)}
+
+
+def resize(image, width):
+    """Resize an image to a particular width, preserving the aspect ratio.
+
+    Parameters
+    ----------
+    image : :class:`numpy.ndarray`
+        The image object.
+    width : :class:`int`
+        The width, in pixels, of the resized image. If the image is
+        not wider than this value then the image is returned unchanged.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The resized image.
+    """
+    height, w = image.shape[:2]
+    if w <= width:
+        return image
+    size = (width, max(1, round(height * width / w)))
+    return cv.resize(image, size, interpolation=cv.INTER_AREA)
 
 
-def to_bytes(image):
+def to_bytes(image, *, quality=None):
     """Convert an opencv image to bytes.
 
     Parameters
     ----------
     image : :class:`numpy.ndarray`
         The image object.
+    quality : :class:`int`, optional
+        The JPEG quality, between [0, 100]. Default is the OpenCV default (95).
 
     Returns
     -------
@@ -381,17 +962,20 @@ def to_bytes(image):
     """
     if isinstance(image, bytes):
         return image
-    _, buf = cv.imencode('.jpeg', image)
+    params = () if quality is None else (cv.IMWRITE_JPEG_QUALITY, int(quality))
+    _, buf = cv.imencode('.jpeg', image, params)
     return buf.tobytes()
 
 
-def to_base64(image):
+def to_base64(image, *, quality=None):
     """Convert an opencv image to a base64 string.
 
     Parameters
     ----------
     image : :class:`numpy.ndarray`
         The image object.
+    quality : :class:`int`, optional
+        The JPEG quality, between [0, 100]. Default is the OpenCV default (95).
 
     Returns
     -------
@@ -400,7 +984,7 @@ def to_base64(image):
     """
     if image.size == 0:
         return ''
-    return b64encode(to_bytes(image)).decode()
+    return b64encode(to_bytes(image, quality=quality)).decode()
 
 
 def to_img_tag(b64):
@@ -1,7 +1,16 @@
+import argparse
+import base64
+import io
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
 
-import cv2 as cv
+import numpy as np
 from flask import (
+    g,
     jsonify,
     render_template,
     request,
@@ -11,16 +20,42 @@ from flask import (
     Response,
 )
 
-from .autocollimator import AutoCollimator
+from .analysis import (
+    Analyzer,
+    InlineAnalyzer,
+    PreviewEncoder,
+    crosshair_position,
+    encode,
+    plot,
+)
+from .autocollimator import (
+    BACKENDS,
+    PRIORITY_MEASURE,
+    PRIORITY_STREAM,
+    create_autocollimator,
+)
+from .broadcast import Broadcaster
+from .calibration import (
+    Calibration,
+    OriginMonitor,
+)
+from .measurements import (
+    DTYPE as MEASUREMENT_DTYPE,
+    MeasurementLog,
+)
+from .metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    Registry,
+    Timings,
+)
+from .tracker import Tracker
 from .utils import (
-    add_marker,
-    locate_crosshair,
-    locate_origin,
+    ESTIMATORS,
+    greyscale,
+    locate_crosshair_stack,
     to_arcmin,
-    to_base64,
     to_content_type,
     to_img_tag,
-    plot_crosshair,
 )
 
 
@@ -35,16 +70,190 @@ from .utils import (
 #     7: '3200x2400'
 # }
 
-autocollimator = AutoCollimator()
-
-index_args = {}
-origin_args = {}
-origin_position = {}
+# created by init(), the first time that a request is received if not sooner
+autocollimator = None
+calibration = None
+analyzer = InlineAnalyzer()
+measurement_log = None
+init_lock = threading.RLock()
+
+# the trackers of /crosshair, for each (threshold, estimator, downscale), the
+# most recently used is last. The workspace of a tracker is a few MB, so only
+# MAX_TRACKERS are kept
+trackers = OrderedDict()
+trackers_lock = threading.Lock()
+
+# the video and event streams that are running, see subscribe()
+streams = {}
+streams_lock = threading.Lock()
+
+# the metrics that are exposed at /metrics
+metrics_enabled = True
+registry = Registry()
+request_seconds = registry.histogram(
+    'autocollimator_request_seconds',
+    'The time to handle a request (until the response headers are sent).',
+    ('endpoint',))
+stage_seconds = registry.histogram(
+    'autocollimator_stage_seconds',
+    'The time of each stage of a request, or of each frame of a stream.',
+    ('endpoint', 'stage'))
+stream_frames = registry.counter(
+    'autocollimator_stream_frames_total',
+    'The number of frames that a stream has sent.',
+    ('stream',))
+stream_rate = registry.rate(
+    'autocollimator_stream_frames_per_second',
+    'The frame rate of a stream, during the last 5 seconds.',
+    ('stream',))
 
 app = Flask(__name__)
 app.config['JSON_SORT_KEYS'] = False
 
 STREAM_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+EVENTS_MIMETYPE = 'text/event-stream'
+
+# the maximum number of frames that /crosshair may average
+MAX_FRAMES = 32
+
+# the number of frames that /crosshair processes at a time when averaging, so
+# the memory that is required does not depend on the number of frames
+# (a 2560x1920 frame is 4.9 MB)
+CHUNK_FRAMES = 8
+
+# the types of image that /crosshair may return
+IMAGE_TYPES = ('none', 'jpeg', 'thumbnail')
+
+# the maximum factor that an image may be downscaled by for a coarse-to-fine search
+MAX_DOWNSCALE = 8
+
+# the maximum number of trackers that /crosshair keeps
+MAX_TRACKERS = 4
+
+# the formats that /measurements may return
+MEASUREMENT_FORMATS = ('json', 'npy')
+
+# the maximum number of measurements that /measurements returns
+MAX_MEASUREMENTS = 100000
+
+
+def init(*, backend=None, continuous=False, calibration_file=None, workers=0, metrics=True,
+         log=True, log_dir=None, **kwargs):
+    """Create the :class:`~autocollimator.autocollimator.AutoCollimator`,
+    load the :class:`~autocollimator.calibration.Calibration`, start
+    the :class:`~autocollimator.analysis.Analyzer` and open the
+    :class:`~autocollimator.measurements.MeasurementLog`.
+
+    Parameters
+    ----------
+    backend : :class:`str`, optional
+        The hardware backend, ``raspberrypi`` or ``simulated``. If not
+        specified then the value of the ``AUTOCOLLIMATOR_BACKEND``
+        environment variable is used, or ``raspberrypi`` if the environment
+        variable is not defined.
+    continuous : :class:`bool`, optional
+        Whether to capture images continuously in a background thread.
+    calibration_file : :class:`str`, optional
+        The path of the calibration file. See
+        :func:`~autocollimator.calibration.default_path`.
+    workers : :class:`int`, optional
+        The number of processes that analyse the images. If 0 then the
+        images are analysed in the threads that handle the requests.
+    metrics : :class:`bool`, optional
+        Whether to measure the time of each stage of a request (which is
+        added to the ``Server-Timing`` header of the response) and to
+        update the metrics that are exposed at ``/metrics``.
+    log : :class:`bool`, optional
+        Whether to append every measurement of the crosshair to the
+        :class:`~autocollimator.measurements.MeasurementLog`.
+    log_dir : :class:`str`, optional
+        The directory of the measurement log. See
+        :func:`~autocollimator.measurements.default_directory`.
+    kwargs
+        All additional keyword arguments are passed to
+        :func:`~autocollimator.autocollimator.create_autocollimator`.
+    """
+    global autocollimator, calibration, analyzer, metrics_enabled, measurement_log
+    with init_lock:
+        metrics_enabled = metrics
+        calibration = Calibration(calibration_file)
+        if measurement_log is not None:
+            measurement_log.close()
+        measurement_log = MeasurementLog(log_dir) if log else None
+        analyzer.close()
+        analyzer = Analyzer(workers=workers) if workers > 0 else InlineAnalyzer()
+        stop_streams()
+        if autocollimator is not None:
+            autocollimator.close()
+        if backend is None:
+            backend = os.environ.get('AUTOCOLLIMATOR_BACKEND', 'raspberrypi')
+        autocollimator = create_autocollimator(backend, **kwargs)
+        if continuous:
+            autocollimator.start_continuous()
+
+
+@app.before_request
+def before_request():
+    if autocollimator is None:
+        # concurrent first requests must not each create the hardware
+        with init_lock:
+            if autocollimator is None:
+                init()
+    if metrics_enabled:
+        g.timings = Timings()
+        g.t0 = time.perf_counter()
+
+
+@app.after_request
+def after_request(response):
+    timings = g.get('timings')
+    if timings is not None:
+        endpoint = request.endpoint or 'unknown'
+        total = time.perf_counter() - g.t0
+        observe(endpoint, timings)
+        request_seconds.observe(total, endpoint)
+        timings.add('total', total)
+        response.headers['Server-Timing'] = timings.header()
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Return the metrics in the Prometheus text format."""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/measurements')
+def measurements():
+    """Return the measurements of the crosshair within a time range."""
+    start = request.args.get('start', type=float)
+    stop = request.args.get('stop', type=float)
+    limit = request.args.get('limit', default=MAX_MEASUREMENTS, type=int)
+    if not 1 <= limit <= MAX_MEASUREMENTS:
+        return f'Invalid limit value: {limit}, must be between 1 and {MAX_MEASUREMENTS}', 400
+    fmt = request.args.get('format', default='json')
+    if fmt not in MEASUREMENT_FORMATS:
+        return f'Invalid format value: {fmt}', 400
+    if measurement_log is None:
+        return 'The measurements are not logged', 404
+
+    with stage('query'):
+        records = measurement_log.query(start, stop, limit=limit)
+
+    if fmt == 'npy':
+        with stage('encode'):
+            buffer = io.BytesIO()
+            np.save(buffer, records)
+        return Response(buffer.getvalue(), mimetype='application/octet-stream')
+
+    with stage('json'):
+        columns = {}
+        for name in MEASUREMENT_DTYPE.names:
+            values = records[name].tolist()
+            if MEASUREMENT_DTYPE[name].kind == 'f':
+                values = [None if v != v else v for v in values]
+            columns[name] = values
+        return jsonify(columns)
 
 
 @app.route('/favicon.ico')
@@ -59,8 +268,7 @@ def favicon():
 @app.route('/<string:path>')
 def page_not_found(**ignore):
     """Return page not found for all undefined routes."""
-    autocollimator.origin_stream_enabled = False
-    autocollimator.index_stream_enabled = False
+    stop_streams()
     return make_response(
         render_template('page_not_found.html', url_root=request.url_root),
         404
@@ -70,74 +278,147 @@ def page_not_found(**ignore):
 @app.route('/')
 def index():
     """Fast video streaming home page for alignment purposes."""
-    global index_args
-    index_args = request.args
-    autocollimator.index_stream_enabled = True
-    autocollimator.origin_stream_enabled = False
-    return render_template('index.html')
+    stop_streams(keep='index_stream')
+    # the parameters are passed on to the stream
+    return render_template('index.html', args=request.args.to_dict())
 
 
 @app.route('/index_stream')
 def index_stream():
     """Fast video streaming route."""
-    def stream():
-        while autocollimator.index_stream_enabled:
-            yield to_content_type(autocollimator.frame())
-
-    brightness = index_args.get('brightness', default=50, type=float)
+    def stream(stop):
+        autocollimator.resolution('720p')
+        autocollimator.illuminate('view', brightness=brightness)
+        # the frames are encoded by the GPU, at the frame rate of the camera
+        autocollimator.start_recording()
+        try:
+            while not stop.is_set():
+                yield to_content_type(autocollimator.frame())
+                count_frame('index_stream')
+        finally:
+            autocollimator.stop_recording()
 
-    autocollimator.resolution('720p')
-    autocollimator.turn_led_on(brightness=brightness)
-    return Response(stream(), mimetype=STREAM_MIMETYPE)
+    brightness = request.args.get('brightness', type=float)
+    stop_streams(keep='index_stream')
+    subscription = subscribe('index_stream', (brightness,), stream)
+    return Response(subscription, mimetype=STREAM_MIMETYPE)
 
 
 @app.route('/origin')
 def origin():
     """Locate the origin."""
-    global origin_args
-    origin_args = request.args
-    autocollimator.origin_stream_enabled = True
-    autocollimator.index_stream_enabled = False
-    return render_template('origin.html')
+    stop_streams(keep='origin_stream')
+    # the parameters are passed on to the stream
+    return render_template('origin.html', args=request.args.to_dict())
 
 
 @app.route('/origin_stream')
 def origin_stream():
     """Locate the origin and the crosshair."""
-    def stream():
-        global origin_position
+    def stream(stop):
+        autocollimator.resolution('2560x1920')
+        autocollimator.illuminate('view', brightness=brightness)
+        tracker = Tracker(estimator=estimator)
+        monitor = OriginMonitor(calibration, thresh=threshold, estimator=estimator,
+                                interval=interval, drift=drift)
         i = 0
-        while autocollimator.origin_stream_enabled:
-            i += 1
-            image = autocollimator.capture()
-            origin_position = locate_origin(image, thresh=threshold)
-
+        seq = 0
+        frame_seq = None
+        # the frame that is being analysed, and the callables that wait for the results
+        analysing = None
+
+        def submit(frame, number):
+            # start to locate the origin and the crosshair, the analyses run at the same time
+            # (if there are worker processes) and while the next frame is captured
             if debug:
-                add_marker(origin_position['image'], origin_position, (255, 255, 255))
-                yield to_content_type(origin_position['image'])
-                continue
-
-            add_marker(image, origin_position, (255, 255, 255))
-            crosshair_position = locate_crosshair(image)
-            add_marker(image, crosshair_position, (0, 255, 0))
-
-            height, width = image.shape[:2]
-            cv.putText(image, f'{i:06d}', (10, 25), cv.FONT_HERSHEY_DUPLEX,
-                       1, (127, 127, 127), thickness=1)
-            cv.putText(image, f'{width}x{height}', (10, 50), cv.FONT_HERSHEY_DUPLEX,
-                       1, (127, 127, 127), thickness=1)
-
-            yield to_content_type(image)
-
-    threshold = origin_args.get('threshold', default=30, type=int)
-    debug = origin_args.get('debug', default=0, type=int)
-
-    default_brightness = autocollimator.led_brightness()
-    brightness = origin_args.get('brightness', default=default_brightness, type=float)
-
-    autocollimator.resolution('2560x1920')
-    autocollimator.turn_led_on(brightness=brightness)
-    return Response(stream(), mimetype=STREAM_MIMETYPE)
+                # the debug image is the processed image, which a worker process does not return
+                return frame, number, monitor.submit(frame.image), None
+            # the crosshair is filtered from the image by its colour, only the window is converted to BGR
+            return (frame, number, monitor.submit(frame.image, analyzer=analyzer),
+                    tracker.submit(frame, analyzer=analyzer))
+
+        def finish(frame, number, origin_result, crosshair_result):
+            # wait for the analyses of a frame and then encode the preview
+            with frame:
+                origin_ = origin_result()
+                if debug:
+                    # the processed image is of the region that contains the origin
+                    x0, y0 = origin_['offset']
+                    x, y = origin_['x'], origin_['y']
+                    markers = []
+                    if x is not None and y is not None:
+                        markers.append(({'x': x - x0, 'y': y - y0}, (255, 255, 255), f'({x:.1f}, {y:.1f})'))
+                    preview.submit(origin_['image'], markers=markers)
+                else:
+                    crosshair_ = crosshair_result()
+                    height, width = frame.shape[:2]
+                    preview.submit(
+                        frame,
+                        markers=[(xy(origin_), (255, 255, 255), None), (xy(crosshair_), (0, 255, 0), None)],
+                        labels=[(f'{number:06d}', (10, 25)), (f'{width}x{height}', (10, 50))])
+
+        # the images are analysed at full resolution but the stream sends a
+        # downscaled preview that is encoded in a background thread
+        with PreviewEncoder(analyzer, width=None if debug else size, quality=quality) as preview:
+            try:
+                while not stop.is_set():
+                    timings = Timings()
+                    with timings.stage('capture'):
+                        frame = autocollimator.capture(after=frame_seq, priority=PRIORITY_STREAM)
+                    frame_seq = frame.seq
+                    if analysing is not None:
+                        # the previous frame was analysed while this frame was captured
+                        pending, analysing = analysing, None
+                        with timings.stage('locate'):
+                            finish(*pending)
+
+                    i += 1
+                    if i == 1 and pixels_per_arcmin is not None:
+                        calibration.update(frame.shape, pixels_per_arcmin=pixels_per_arcmin)
+                    try:
+                        analysing = submit(frame, i)
+                    except:
+                        frame.release()
+                        raise
+
+                    latest = preview.latest(after=seq)
+                    if latest is not None:
+                        seq, jpeg = latest
+                        yield to_content_type(jpeg)
+                        count_frame('origin_stream', timings)
+            finally:
+                if analysing is not None:
+                    analysing[0].release()
+
+    threshold = request.args.get('threshold', default=30, type=int)
+    if not 0 <= threshold <= 255:
+        return f'Invalid threshold value: {threshold}, must be between 0 and 255', 400
+    debug = request.args.get('debug', default=0, type=int)
+    estimator = request.args.get('estimator', default='gaussian')
+    if estimator not in ESTIMATORS:
+        return f'Invalid estimator value: {estimator}', 400
+    interval = request.args.get('interval', default=10., type=float)
+    if interval < 0:
+        return f'Invalid interval value: {interval}', 400
+    drift = request.args.get('drift', default=1., type=float)
+    if drift < 0:
+        return f'Invalid drift value: {drift}', 400
+    pixels_per_arcmin = request.args.get('pixels_per_arcmin', type=float)
+    if pixels_per_arcmin is not None and pixels_per_arcmin <= 0:
+        return f'Invalid pixels_per_arcmin value: {pixels_per_arcmin}', 400
+    size = request.args.get('size', default=1280, type=int)
+    if size < 1:
+        return f'Invalid size value: {size}', 400
+    quality = request.args.get('quality', type=int)
+    if quality is not None and not 0 <= quality <= 100:
+        return f'Invalid quality value: {quality}, must be between 0 and 100', 400
+
+    brightness = request.args.get('brightness', type=float)
+
+    params = (threshold, debug, estimator, interval, drift, pixels_per_arcmin, size, quality, brightness)
+    stop_streams(keep='origin_stream')
+    subscription = subscribe('origin_stream', params, stream)
+    return Response(subscription, mimetype=STREAM_MIMETYPE)
 
 
 @app.route('/crosshair')
@@ -145,76 +426,513 @@ def crosshair():
     """Locate the crosshair."""
     result = {}
 
-    autocollimator.origin_stream_enabled = False
-    autocollimator.index_stream_enabled = False
-    autocollimator.turn_led_off()
-
-    image = autocollimator.capture()
-
     threshold = request.args.get('threshold', default=25, type=int)
-    pixels_per_arcmin = request.args.get('pixels_per_arcmin', default=17.9, type=float)
+    if not 0 <= threshold <= 255:
+        return f'Invalid threshold value: {threshold}, must be between 0 and 255', 400
+    pixels_per_arcmin = request.args.get('pixels_per_arcmin', type=float)
+    estimator = request.args.get('estimator', default='gaussian')
+    if estimator not in ESTIMATORS:
+        return f'Invalid estimator value: {estimator}', 400
+    frames = request.args.get('frames', default=1, type=int)
+    if not 1 <= frames <= MAX_FRAMES:
+        return f'Invalid frames value: {frames}, must be between 1 and {MAX_FRAMES}', 400
+    downscale = request.args.get('downscale', default=1, type=int)
+    if not 1 <= downscale <= MAX_DOWNSCALE:
+        return f'Invalid downscale value: {downscale}, must be between 1 and {MAX_DOWNSCALE}', 400
+    show = request.args.get('show', default=0, type=int)
+    image_type = request.args.get('image', default='jpeg')
+    if image_type not in IMAGE_TYPES:
+        return f'Invalid image value: {image_type}', 400
+    if show and image_type == 'none':
+        image_type = 'jpeg'
+    quality = request.args.get('quality', type=int)
+    if quality is not None and not 0 <= quality <= 100:
+        return f'Invalid quality value: {quality}, must be between 0 and 100', 400
+    size = request.args.get('size', default=640, type=int)
+    if size < 1:
+        return f'Invalid size value: {size}', 400
     org = request.args.get('origin')
-    if org is None:
-        if not origin_position:
-            h, w = image.shape[:2]
-            xy0 = {'x': w//2, 'y': h//2}
-        else:
-            xy0 = {'x': origin_position['x'], 'y': origin_position['y']}
+    try:
+        xy0 = parse_origin(org)
+    except (ValueError, TypeError):
+        return f'Invalid origin value: {org}', 400
+    brightness = request.args.get('brightness', type=float)
+
+    stop_streams()
+    if frames > 1:
+        with stage('average'):
+            crosshair_ = average_crosshair(frames, threshold, estimator)
+        shape = crosshair_['shape']
+        seq, timestamp = crosshair_['seq'], crosshair_['t']
+        illumination = crosshair_['illumination']
+        image_future = capture_image(image_type, brightness)
     else:
-        try:
-            x0, y0 = org.split(',')
-            xy0 = {'x': float(x0), 'y': float(y0)}
-        except (ValueError, TypeError):
-            return f'Invalid origin value: {org}', 400
+        with stage('capture'):
+            frame = autocollimator.capture(scene='measure')
+        with frame:
+            if request.args.get('debug', default=0, type=int):
+                with stage('plot'):
+                    future = analyzer.submit(plot, frame.image, thresh=threshold, estimator=estimator)
+                    return to_img_tag(future.result())
+
+            # the image is captured while the crosshair is located
+            image_future = capture_image(image_type, brightness)
+
+            timings = {}
+            with stage('locate'):
+                if request.args.get('track', default=1, type=int):
+                    key = (threshold, estimator, downscale)
+                    tracker = checkout_tracker(key)
+                    try:
+                        crosshair_ = tracker.locate(frame.image, timings=timings, analyzer=analyzer)
+                    finally:
+                        checkin_tracker(key, tracker)
+                else:
+                    crosshair_ = analyzer.submit(crosshair_position, frame.image, thresh=threshold,
+                                                 estimator=estimator, downscale=downscale).result()
+                    timings = crosshair_['timings']
+            add_timings(timings)
+            shape = frame.shape
+            seq, timestamp = frame.seq, frame.timestamp
+            illumination = frame.led_brightness, frame.lightbulb
+
+    if xy0 is None:
+        xy0 = default_origin(shape)
+    if pixels_per_arcmin is None:
+        pixels_per_arcmin = calibration.pixels_per_arcmin(shape)
 
-    crosshair_ = locate_crosshair(image, thresh=threshold)
     result['x_pixel'] = crosshair_['x']
     result['y_pixel'] = crosshair_['y']
 
-    if request.args.get('debug', default=0, type=int):
-        return to_img_tag(plot_crosshair(crosshair_))
-
     arcmin = to_arcmin(crosshair_, xy0, pixels_per_arcmin=pixels_per_arcmin)
     result['x_arcmin'] = arcmin['x']
     result['y_arcmin'] = arcmin['y']
 
+    if frames > 1:
+        for key in ('x', 'y'):
+            std = crosshair_[f'{key}_std']
+            result[f'{key}_pixel_std'] = std
+            result[f'{key}_arcmin_std'] = None if std is None else std / pixels_per_arcmin
+
+    with stage('log'):
+        log_measurement(crosshair_, arcmin, shape, illumination, seq=seq, t=timestamp, frames=frames)
+
     degree_per_arcmin = 60.0
     if arcmin['x'] is not None:
         result['x_degree'] = arcmin['x'] / degree_per_arcmin
     if arcmin['y'] is not None:
         result['y_degree'] = arcmin['y'] / degree_per_arcmin
 
-    default_brightness = autocollimator.led_brightness()
-    brightness = origin_args.get('brightness', default=default_brightness, type=float)
-    autocollimator.turn_led_on(brightness=brightness)
-
-    image = autocollimator.capture()
-    autocollimator.turn_led_off()
-    if arcmin['x'] is not None and arcmin['y'] is not None:
-        add_marker(image, crosshair_, (0, 255, 0), label='({x:.1f}, {y:.1f})'.format(**arcmin))
-
     result['origin'] = xy0
     result['pixels_per_arcmin'] = pixels_per_arcmin
+    if frames > 1:
+        result['frames'] = frames
+        result['positions'] = crosshair_['positions']
+
+    if image_future is None:
+        result['image'] = None
+        with stage('json'):
+            return jsonify(result)
 
-    result['image'] = to_base64(image)
-    if request.args.get('show', default=0, type=int):
+    markers = []
+    if arcmin['x'] is not None and arcmin['y'] is not None:
+        markers.append((xy(crosshair_), (0, 255, 0), '({x:.1f}, {y:.1f})'.format(**arcmin)))
+    with stage('capture_image'):
+        frame = image_future.result()
+    # restore the illumination for the next measurement, without waiting
+    autocollimator.submit(autocollimator.illuminate, 'measure')
+    with frame, stage('encode'):
+        future = analyzer.submit(encode, frame.bgr(), quality=quality, markers=markers,
+                                 width=size if image_type == 'thumbnail' else None)
+
+    with stage('encode'):
+        result['image'] = base64.b64encode(future.result()).decode()
+    if show:
         return to_img_tag(result['image'])
 
-    return jsonify(result)
+    with stage('json'):
+        return jsonify(result)
+
+
+@app.route('/crosshair/events')
+def crosshair_events():
+    """Stream the location of the crosshair as Server-Sent Events."""
+    def stream(stop):
+        autocollimator.illuminate('measure')
+        tracker = Tracker(thresh=threshold, estimator=estimator, downscale=downscale)
+        seq = None
+        while not stop.is_set():
+            timings = Timings()
+            with timings.stage('capture'):
+                frame = autocollimator.capture(after=seq, priority=PRIORITY_STREAM)
+            with frame, timings.stage('locate'):
+                seq = frame.seq
+                crosshair_ = tracker.locate(frame.image, analyzer=analyzer)
+            arcmin = to_arcmin(crosshair_, xy0 or default_origin(frame.shape),
+                               pixels_per_arcmin=pixels_per_arcmin or
+                               calibration.pixels_per_arcmin(frame.shape))
+            record = {
+                'seq': seq,
+                't': frame.timestamp,
+                'x_pixel': crosshair_['x'],
+                'y_pixel': crosshair_['y'],
+                'x_arcmin': arcmin['x'],
+                'y_arcmin': arcmin['y'],
+            }
+            with timings.stage('log'):
+                log_measurement(crosshair_, arcmin, frame.shape, (frame.led_brightness, frame.lightbulb),
+                                seq=seq, t=frame.timestamp)
+            yield f'id: {seq}\ndata: {json.dumps(record)}\n\n'
+            count_frame('crosshair_events', timings)
+
+    threshold = request.args.get('threshold', default=25, type=int)
+    if not 0 <= threshold <= 255:
+        return f'Invalid threshold value: {threshold}, must be between 0 and 255', 400
+    pixels_per_arcmin = request.args.get('pixels_per_arcmin', type=float)
+    estimator = request.args.get('estimator', default='gaussian')
+    if estimator not in ESTIMATORS:
+        return f'Invalid estimator value: {estimator}', 400
+    downscale = request.args.get('downscale', default=1, type=int)
+    if not 1 <= downscale <= MAX_DOWNSCALE:
+        return f'Invalid downscale value: {downscale}, must be between 1 and {MAX_DOWNSCALE}', 400
+    org = request.args.get('origin')
+    try:
+        xy0 = parse_origin(org)
+    except (ValueError, TypeError):
+        return f'Invalid origin value: {org}', 400
+
+    stop_streams(keep='crosshair_events')
+    params = (threshold, pixels_per_arcmin, estimator, downscale, org)
+    subscription = subscribe('crosshair_events', params, stream)
+    return Response(subscription, mimetype=EVENTS_MIMETYPE, headers={'Cache-Control': 'no-cache'})
+
+
+def subscribe(name, params, produce):
+    """Subscribe to a stream.
+
+    Each stream (a name and the values of its parameters) is produced once,
+    in a background thread, and is sent to all clients that are viewing
+    the stream. A slow client skips frames rather than slowing down the
+    other clients. The stream stops when the last client disconnects or
+    when :func:`stop_streams` is called.
+
+    Parameters
+    ----------
+    name : :class:`str`
+        The name of the stream.
+    params : :class:`tuple`
+        The values of the parameters of the stream.
+    produce : :obj:`callable`
+        A generator function, ``produce(stop)``, that yields the data of the
+        stream until the :class:`threading.Event` `stop` is set.
+
+    Returns
+    -------
+    :class:`~autocollimator.broadcast.Subscription`
+        The subscription to the stream.
+    """
+    key = (name, params)
+    with streams_lock:
+        broadcaster = streams.get(key)
+        if broadcaster is not None:
+            try:
+                return broadcaster.subscribe()
+            except RuntimeError:  # the last client disconnected
+                # the producer may still be running, it must finish before a new one starts
+                broadcaster.stop(wait=True)
+        broadcaster = streams[key] = Broadcaster(produce, name=name)
+        return broadcaster.subscribe()
+
+
+def stop_streams(*, keep=None):
+    """Stop the streams, since the illumination or the resolution is about to change.
+
+    Waits for the producers to finish, so that a stream does not change the
+    state of the hardware after this function returns.
+
+    Parameters
+    ----------
+    keep : :class:`str`, optional
+        The name of the streams to keep running.
+    """
+    with streams_lock:
+        for key, broadcaster in list(streams.items()):
+            if key[0] != keep or broadcaster.stopped:
+                broadcaster.stop(wait=True)
+                del streams[key]
+
+
+def stage(name):
+    """Measure the time of a stage of the current request.
+
+    Use as a context manager. Does nothing if the metrics are disabled.
+    """
+    timings = g.get('timings')
+    if timings is None:
+        return nullcontext()
+    return timings.stage(name)
+
+
+def add_timings(timings):
+    """Add the time of each stage (a :class:`dict`) to the current request."""
+    if g.get('timings') is not None:
+        g.timings.update(timings)
+
+
+def observe(endpoint, timings):
+    """Add the time of each stage to the histograms."""
+    for name, seconds in timings:
+        stage_seconds.observe(seconds, endpoint, name)
+
+
+def count_frame(name, timings=None):
+    """Update the metrics of a stream after a frame was sent."""
+    if not metrics_enabled:
+        return
+    stream_frames.increment(name)
+    stream_rate.tick(name)
+    if timings is not None:
+        observe(name, timings)
+
+
+def parse_origin(value):
+    """Parse the origin from a URL parameter.
+
+    Returns :data:`None` if the value is :data:`None`, otherwise the
+    x and y values of the comma-separated string.
+    """
+    if value is None:
+        return
+    x0, y0 = value.split(',')
+    return {'x': float(x0), 'y': float(y0)}
+
+
+def log_measurement(crosshair_, arcmin, shape, illumination, *, seq, t, frames=1):
+    """Append a measurement of the crosshair to the measurement log (if enabled).
+
+    The `illumination` is the brightness of the LED ring and whether the
+    lightbulb was on when the (last) image was captured, see
+    :meth:`~autocollimator.autocollimator.AutoCollimator.capture`.
+    """
+    if measurement_log is None:
+        return
+    height, width = shape[:2]
+    led_brightness, lightbulb = illumination
+    measurement_log.append(
+        t=t,
+        seq=seq,
+        x_pixel=crosshair_['x'],
+        y_pixel=crosshair_['y'],
+        x_arcmin=arcmin['x'],
+        y_arcmin=arcmin['y'],
+        x_pixel_std=crosshair_.get('x_std'),
+        y_pixel_std=crosshair_.get('y_std'),
+        frames=frames,
+        width=width,
+        height=height,
+        led_brightness=led_brightness,
+        lightbulb=lightbulb,
+    )
+
+
+def xy(position):
+    """Returns only the x and y values of a location (i.e., without the arrays
+    of the processed image) so that it can be sent to an analysis process."""
+    return {'x': position['x'], 'y': position['y']}
+
+
+def default_origin(shape):
+    """Returns the location of the origin from the calibration or the centre of the image."""
+    origin_ = calibration.origin(shape)
+    if origin_ is None:
+        h, w = shape[:2]
+        return {'x': w//2, 'y': h//2}
+    return origin_
+
+
+def checkout_tracker(key):
+    """Get the tracker of /crosshair for (threshold, estimator, downscale).
+
+    A tracker must not be used by multiple requests at the same time, so it
+    is removed from the trackers until :func:`checkin_tracker` is called.
+    """
+    with trackers_lock:
+        tracker = trackers.pop(key, None)
+    if tracker is None:
+        threshold, estimator, downscale = key
+        tracker = Tracker(thresh=threshold, estimator=estimator, downscale=downscale)
+    return tracker
+
+
+def checkin_tracker(key, tracker):
+    """Return a tracker that :func:`checkout_tracker` returned.
+
+    The least recently used trackers are discarded if there are more
+    than :data:`MAX_TRACKERS`.
+    """
+    with trackers_lock:
+        trackers[key] = tracker
+        while len(trackers) > MAX_TRACKERS:
+            trackers.popitem(last=False)
+
+
+def capture_image(image_type, brightness):
+    """Capture the image that /crosshair returns, with the LED ring on.
+
+    Returns a :class:`~concurrent.futures.Future` of the
+    :class:`~autocollimator.frames.Frame`, or :data:`None` if an image
+    is not returned.
+    """
+    if image_type == 'none':
+        return
+    return autocollimator.submit(autocollimator.capture, scene='view', brightness=brightness,
+                                 priority=PRIORITY_MEASURE)
+
+
+def average_crosshair(frames, threshold, estimator):
+    """Locate the crosshair in multiple frames that are captured back-to-back.
+
+    Returns the mean and standard deviation of the location of the crosshair
+    (in pixel units), the location in each frame, the shape of the frames and
+    the sequence number, timestamp and illumination of the last frame.
+    """
+    chunk = None
+    n = 0
+    seq = None
+    located = {'x': [], 'y': []}
+    for i in range(frames):
+        with autocollimator.capture(after=seq, scene='measure') as frame:
+            if chunk is None:
+                chunk = np.empty((min(frames, CHUNK_FRAMES),) + frame.shape[:2], dtype=np.uint8)
+            greyscale(frame.image, dst=chunk[n])
+            seq = frame.seq
+            timestamp = frame.timestamp
+            shape = frame.shape
+            illumination = frame.led_brightness, frame.lightbulb
+        n += 1
+        if n == len(chunk) or i == frames - 1:
+            # the chunk is overwritten by the thresholded images
+            stack = locate_crosshair_stack(chunk[:n], thresh=threshold, estimator=estimator, inplace=True)
+            located['x'].append(stack['x'])
+            located['y'].append(stack['y'])
+            n = 0
+
+    located = {key: np.concatenate(values) for key, values in located.items()}
+    result = {'shape': shape, 'seq': seq, 't': timestamp, 'illumination': illumination}
+    for key in ('x', 'y'):
+        values = located[key]
+        ok = values[~np.isnan(values)]
+        if ok.size == 0:
+            result[key], result[f'{key}_std'] = None, None
+        else:
+            result[key] = float(np.mean(ok))
+            result[f'{key}_std'] = float(np.std(ok, ddof=1)) if ok.size > 1 else 0.
+    result['positions'] = [
+        {'x': None if np.isnan(x) else float(x), 'y': None if np.isnan(y) else float(y)}
+        for x, y in zip(located['x'], located['y'])
+    ]
+    return result
 
 
 @app.route('/shutdown')
 def shutdown():
     """Close the application and shutdown the Raspberry Pi."""
+    stop_streams()
     autocollimator.close()
     os.system('sudo shutdown now')
 
 
 def run():
     """Console script to start the webapp."""
+    parser = argparse.ArgumentParser(description='Start the autocollimator webapp.')
+    parser.add_argument(
+        '--continuous', action='store_true',
+        help='capture images continuously in a background thread'
+    )
+    parser.add_argument(
+        '--backend', choices=BACKENDS,
+        default=os.environ.get('AUTOCOLLIMATOR_BACKEND', 'raspberrypi'),
+        help='the hardware backend (default: the AUTOCOLLIMATOR_BACKEND '
+             'environment variable, otherwise raspberrypi)'
+    )
+    parser.add_argument(
+        '--calibration',
+        help='the path of the calibration file (default: the AUTOCOLLIMATOR_CALIBRATION '
+             'environment variable, otherwise ~/.autocollimator/calibration.json)'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=0,
+        help='the number of processes that analyse the images (default: %(default)s, '
+             'the images are analysed in the threads that handle the requests)'
+    )
+    parser.add_argument(
+        '--no-metrics', action='store_true',
+        help='do not measure the time of each stage of a request (the Server-Timing '
+             'header) and do not update the metrics that are exposed at /metrics'
+    )
+    parser.add_argument(
+        '--log-dir',
+        help='the directory of the measurement log (default: the AUTOCOLLIMATOR_LOG '
+             'environment variable, otherwise ~/.autocollimator/log)'
+    )
+    parser.add_argument(
+        '--no-log', action='store_true',
+        help='do not append the measurements of the crosshair to the measurement log'
+    )
+    parser.add_argument(
+        '--host', default='0.0.0.0',
+        help='the hostname to listen on (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--port', type=int, default=80,
+        help='the port of the webserver (default: %(default)s)'
+    )
+    group = parser.add_argument_group('simulated backend')
+    group.add_argument(
+        '--crosshair', type=coordinates,
+        help='the X,Y location of the crosshair, in pixels'
+    )
+    group.add_argument(
+        '--noise', type=float,
+        help='the standard deviation of the noise, in greyscale units'
+    )
+    group.add_argument(
+        '--blur', type=float,
+        help='the standard deviation of the blur, in pixels'
+    )
+    group.add_argument(
+        '--resolution', type=coordinates,
+        help='the WIDTH,HEIGHT of the sensor, in pixels'
+    )
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.backend == 'simulated':
+        for key in ('crosshair', 'noise', 'blur', 'resolution'):
+            value = getattr(args, key)
+            if value is not None:
+                kwargs[key] = value
+
     try:
-        app.run(host='0.0.0.0', port=80, threaded=True)
+        init(backend=args.backend, continuous=args.continuous,
+             calibration_file=args.calibration, workers=args.workers,
+             metrics=not args.no_metrics, log=not args.no_log, log_dir=args.log_dir, **kwargs)
+        app.run(host=args.host, port=args.port, threaded=True)
     except KeyboardInterrupt:
         pass
     finally:
-        autocollimator.close()
+        stop_streams()
+        if autocollimator is not None:
+            autocollimator.close()
+        analyzer.close()
+        if measurement_log is not None:
+            measurement_log.close()
+
+
+def coordinates(value):
+    """Convert an X,Y command-line argument to a tuple of two numbers."""
+    try:
+        x, y = (float(v) for v in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid X,Y value: {value!r}')
+    return x, y
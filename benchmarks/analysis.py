@@ -0,0 +1,63 @@
+"""
+Compare analysing the images in the calling thread with a pool of processes.
+
+Simulated images (see :mod:`autocollimator.simulation`) are processed like
+the ``/origin`` stream does, i.e., the crosshair is located and the image is
+annotated and encoded as a JPEG image. With a pool of processes, the next
+image is captured (rendered) while the previous image is encoded. The number
+of images per second is reported.
+
+Usage::
+
+    python benchmarks/analysis.py [--number 50] [--workers 3]
+"""
+import argparse
+import time
+
+from autocollimator.analysis import (
+    Analyzer,
+    InlineAnalyzer,
+    encode,
+)
+from autocollimator.simulation import Scene
+from autocollimator.tracker import Tracker
+
+
+def run(analyzer, scene, number):
+    """Process the images and return the number of images per second."""
+    tracker = Tracker(thresh=100)
+    pending = None
+    t0 = time.perf_counter()
+    for i in range(number):
+        image = scene.render(scene.resolution)
+        crosshair = tracker.locate(image)
+        future = analyzer.submit(encode, image, markers=[(
+            {'x': crosshair['x'], 'y': crosshair['y']}, (0, 255, 0), None)])
+        if pending is not None:
+            pending.result()
+        pending = future
+    pending.result()
+    return number / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=50, help='the number of images')
+    parser.add_argument('--workers', type=int, default=3, help='the number of processes')
+    parser.add_argument('--resolution', default='2560x1920', help='the WIDTHxHEIGHT of the images')
+    args = parser.parse_args()
+
+    resolution = tuple(int(v) for v in args.resolution.split('x'))
+    scene = Scene(resolution=resolution, seed=0)
+    scene.brightness = 128
+
+    print(f'{args.number} images of {args.resolution}')
+    print(f'{"analyzer":>9} {"images/s":>9}')
+    for name, analyzer in (('inline', InlineAnalyzer()), ('pool', Analyzer(workers=args.workers))):
+        with analyzer:
+            run(analyzer, scene, 2)  # warm up
+            print(f'{name:>9} {run(analyzer, scene, args.number):>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the accuracy and speed of the sub-pixel peak estimators.
+
+Synthetic projections of a blurred crosshair line (a box profile convolved
+with a gaussian, plus noise) are generated at random sub-pixel locations
+and each estimator in :data:`autocollimator.utils.ESTIMATORS` is used to
+locate the peak.
+
+Usage::
+
+    python benchmarks/estimators.py [--number 1000] [--noise 0.02]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from autocollimator.utils import ESTIMATORS, fit, peak
+
+
+def projections(number, *, size=2560, width=6., sigma=2., noise=0.02, seed=0):
+    """Create normalized projections and the true location of each peak."""
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(0.2 * size, 0.8 * size, number)
+    x = np.arange(size, dtype=float)
+    # a box of the specified width convolved with a gaussian, evaluated analytically
+    erf = np.vectorize(math.erf)
+    lo = (x - centres[:, np.newaxis] + width / 2.) / (np.sqrt(2.) * sigma)
+    hi = (x - centres[:, np.newaxis] - width / 2.) / (np.sqrt(2.) * sigma)
+    data = 0.5 * (erf(lo) - erf(hi))
+    data += rng.normal(0., noise, data.shape)
+    data = np.clip(data, 0., None)
+    data /= np.max(data, axis=1)[:, np.newaxis]
+    return data, centres
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=1000, help='the number of projections')
+    parser.add_argument('--noise', type=float, default=0.02, help='the standard deviation of the noise')
+    args = parser.parse_args()
+
+    data, centres = projections(args.number, noise=args.noise)
+
+    print(f'{args.number} projections of length {data.shape[1]}, noise={args.noise}')
+    print(f'{"estimator":>10} {"rms error":>10} {"max error":>10} {"failed":>7} '
+          f'{"fit() [us]":>11} {"peak() [us]":>12}')
+    for name in ESTIMATORS:
+        t0 = time.perf_counter()
+        for row in data:
+            fit(row, estimator=name)
+        t_fit = 1e6 * (time.perf_counter() - t0) / args.number
+
+        t0 = time.perf_counter()
+        values = peak(data, estimator=name)
+        t_peak = 1e6 * (time.perf_counter() - t0) / args.number
+
+        error = values - centres
+        ok = ~np.isnan(error)
+        rms = np.sqrt(np.mean(error[ok] ** 2))
+        print(f'{name:>10} {rms:>10.4f} {np.max(np.abs(error[ok])):>10.4f} '
+              f'{np.sum(~ok):>7d} {t_fit:>11.1f} {t_peak:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
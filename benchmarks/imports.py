@@ -0,0 +1,59 @@
+"""
+Measure the time that it takes to import the modules of the package.
+
+Each module is imported in a new Python process, so that no module has
+already been imported (and cached) by a previous measurement. The time is
+the median of several processes. The heavy modules that were also imported
+are reported (i.e., any of cv2, numpy, scipy, matplotlib and flask).
+
+Usage::
+
+    python benchmarks/imports.py [--repeat 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = (
+    'autocollimator',
+    'autocollimator.client',
+    'autocollimator.utils',
+    'autocollimator.webapp',
+)
+
+HEAVY = ('cv2', 'numpy', 'scipy', 'matplotlib', 'flask')
+
+SCRIPT = '''
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(json.dumps({{'time': t1 - t0, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module, repeat):
+    """Returns the median import time [s] of a module and the heavy modules that were imported."""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', SCRIPT.format(module=module, heavy=HEAVY)])
+        result = json.loads(out)
+        times.append(result['time'])
+    return statistics.median(times), result['heavy']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='the number of processes per module')
+    args = parser.parse_args()
+
+    print(f'{"module":<24} {"time [ms]":>10}  heavy modules')
+    for module in MODULES:
+        t, heavy = measure(module, args.repeat)
+        print(f'{module:<24} {1e3 * t:>10.1f}  {", ".join(heavy)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare the coarse-to-fine search with processing the full-resolution image.
+
+Simulated images of the crosshair (see :mod:`autocollimator.simulation`), at
+random sub-pixel locations, are created and the crosshair is located with
+different `downscale` factors (a factor of 1 processes the full-resolution
+image). The RMS error relative to the true location of the crosshair, the
+number of images in which the crosshair was not found and the time per image
+are reported.
+
+Usage::
+
+    python benchmarks/pyramid.py [--number 20] [--noise 2]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from autocollimator.simulation import Scene
+from autocollimator.utils import (
+    Workspace,
+    locate_crosshair,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=20, help='the number of images per resolution')
+    parser.add_argument('--noise', type=float, default=2., help='the standard deviation of the noise')
+    parser.add_argument('--thresh', type=int, default=100, help='the threshold value')
+    args = parser.parse_args()
+
+    factors = (1, 2, 4)
+    print(f'{args.number} images per resolution, noise={args.noise}, thresh={args.thresh}')
+    print(f'{"resolution":>10} {"downscale":>10} {"rms error":>10} {"failed":>7} {"time [ms]":>10}')
+    rng = np.random.default_rng(0)
+    for resolution in ((1280, 960), (2560, 1920), (3200, 2400)):
+        width, height = resolution
+        errors = {f: [] for f in factors}
+        times = {f: 0. for f in factors}
+        workspace = Workspace()
+        for i in range(args.number):
+            truth = (rng.uniform(0.1, 0.9) * width, rng.uniform(0.1, 0.9) * height)
+            scene = Scene(resolution=resolution, crosshair=truth, noise=args.noise, seed=i)
+            image = scene.render(resolution)
+            for factor in factors:
+                t0 = time.perf_counter()
+                result = locate_crosshair(image, thresh=args.thresh, downscale=factor, workspace=workspace)
+                times[factor] += time.perf_counter() - t0
+                if result['x'] is None or result['y'] is None:
+                    errors[factor].append((np.nan, np.nan))
+                else:
+                    errors[factor].append((result['x'] - truth[0], result['y'] - truth[1]))
+
+        for factor in factors:
+            e = np.asarray(errors[factor])
+            failed = np.sum(np.isnan(e[:, 0]))
+            rms = np.sqrt(np.nanmean(e ** 2)) if failed < len(e) else np.nan
+            t = 1e3 * times[factor] / args.number
+            print(f'{width}x{height:<5} {factor:>10} {rms:>10.3f} {failed:>7} {t:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare processing a region of interest in place with processing the full image.
+
+The full-image path is how :func:`autocollimator.utils.locate_origin` used to
+work: :func:`~autocollimator.utils.roi` creates a full-size copy of the image
+(with the pixels outside the region set to white) which is then thresholded,
+closed and projected. The region path processes a view of the region and maps
+the coordinates back into full-image pixels. Both paths must give identical
+results.
+
+The time per call and the peak memory that is allocated per call (traced by
+:mod:`tracemalloc`, which includes the arrays that OpenCV returns) are reported.
+
+Usage::
+
+    python benchmarks/roi.py [--number 50] [--resolution 2560x1920]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from autocollimator.simulation import Scene
+from autocollimator.utils import (
+    closing,
+    fit,
+    locate_origin,
+    normalize,
+    roi,
+    threshold,
+)
+
+
+def locate_origin_full(image, *, thresh=20, estimator='gaussian'):
+    """The full-image implementation of :func:`~autocollimator.utils.locate_origin`."""
+    img = roi(image, 0.4, 0.4, 0.2, 0.2)
+    img = threshold(img, thresh)
+    img = closing(img)
+    x = fit(normalize(img, axis=0), estimator=estimator)
+    y = fit(normalize(img, axis=1), estimator=estimator)
+    return {'x': x, 'y': y, 'image': img}
+
+
+def measure(function, images, **kwargs):
+    """Returns the results, the time per call [ms] and the peak memory per call [MB]."""
+    function(images[0], **kwargs)  # warm up
+
+    t0 = time.perf_counter()
+    results = [function(image, **kwargs) for image in images]
+    elapsed = 1e3 * (time.perf_counter() - t0) / len(images)
+
+    tracemalloc.start()
+    function(images[0], **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return results, elapsed, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=50, help='the number of images')
+    parser.add_argument('--resolution', default='2560x1920', help='the WIDTHxHEIGHT of the images')
+    parser.add_argument('--thresh', type=int, default=30, help='the threshold value')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.split('x'))
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(args.number):
+        scene = Scene(resolution=(width, height), seed=i,
+                      origin=(width * rng.uniform(0.45, 0.55), height * rng.uniform(0.45, 0.55)))
+        scene.brightness = 128
+        images.append(scene.render((width, height)))
+
+    full, t_full, m_full = measure(locate_origin_full, images, thresh=args.thresh)
+    region, t_region, m_region = measure(locate_origin, images, thresh=args.thresh)
+
+    identical = all((a['x'], a['y']) == (b['x'], b['y']) for a, b in zip(full, region))
+
+    print(f'locate_origin, {args.number} images of {width}x{height}, identical results: {identical}')
+    print(f'{"path":>6} {"time [ms]":>10} {"memory [MB]":>12}')
+    print(f'{"full":>6} {t_full:>10.2f} {m_full:>12.2f}')
+    print(f'{"region":>6} {t_region:>10.2f} {m_region:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Compare locating the crosshair with and without a preallocated workspace.
+
+Three variants are compared:
+
+* ``baseline`` -- the pipeline before the workspace was added, every stage
+  allocates a new array (the filtered image, the result of closing, the
+  64-bit sums of the rows and columns and the 64-bit projections)
+* ``allocate`` -- :func:`~autocollimator.utils.locate_crosshair` without a
+  workspace (a new :class:`~autocollimator.utils.Workspace` for each frame)
+* ``workspace`` -- :func:`~autocollimator.utils.locate_crosshair` with a
+  :class:`~autocollimator.utils.Workspace` that is reused for each frame
+
+Each variant runs in a separate process (the variants are run alternately,
+``--repeat`` times, and the median is reported). The memory that is allocated
+while a frame is processed is traced by :mod:`tracemalloc`, which is the
+memory that the allocator must find for every frame. The peak resident set
+size (RSS) of the process, while the frames are processed, is reported
+relative to the RSS before the first frame was processed (the memory that was
+freed by rendering the frames is returned to the operating system first, so
+that it is not reused). Resetting the peak RSS requires Linux.
+
+On a desktop, glibc recycles the blocks that were freed by the previous frame,
+so the time of ``allocate`` and ``workspace`` is similar. On the Raspberry Pi
+the allocations of other threads (e.g., encoding the JPEG images) fragment
+the heap, so the arrays that are allocated for each frame also cause page
+faults.
+
+Usage::
+
+    python benchmarks/workspace.py [--number 100] [--repeat 5] [--resolution 2560x1920]
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from autocollimator.simulation import Scene
+from autocollimator.utils import (
+    Workspace,
+    closing,
+    filter_crosshair,
+    fit,
+    locate_crosshair,
+    threshold,
+)
+
+VARIANTS = ('baseline', 'allocate', 'workspace')
+
+
+def status(key):
+    """Returns a value from /proc/self/status [MB]."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) / 1e3  # the value is in kB
+
+
+def reset_peak_rss():
+    """Return the freed memory to the operating system and reset the peak resident set size."""
+    libc = ctypes.util.find_library('c')
+    if libc:
+        ctypes.CDLL(libc).malloc_trim(0)
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def locate_baseline(image, *, thresh=None, workspace=None):
+    """Locate the crosshair by allocating a new array at every stage."""
+    if thresh is None:
+        img = closing(filter_crosshair(image))
+    else:
+        img = threshold(image, thresh, inverse=False)
+    projections = []
+    for axis in (0, 1):
+        summed = np.sum(img, axis=axis)
+        projections.append(summed / np.max(summed))
+    return {'x': fit(projections[0]), 'y': fit(projections[1]), 'image': img}
+
+
+def run(variant, number, resolution, thresh):
+    """Process the frames and return the results of the benchmark."""
+    scene = Scene(resolution=resolution, seed=0)
+    scene.brightness = 128
+    frames = [scene.render(resolution) for _ in range(4)]
+
+    locate = locate_baseline if variant == 'baseline' else locate_crosshair
+    workspace = Workspace() if variant == 'workspace' else None
+
+    reset_peak_rss()
+    baseline = status('VmRSS')
+
+    locate(frames[0], thresh=thresh, workspace=workspace)  # warm up
+
+    t0 = time.perf_counter()
+    for i in range(number):
+        locate(frames[i % len(frames)], thresh=thresh, workspace=workspace)
+    elapsed = 1e3 * (time.perf_counter() - t0) / number
+
+    peak_rss = status('VmHWM')
+
+    tracemalloc.start()
+    locate(frames[0], thresh=thresh, workspace=workspace)
+    _, allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'time': elapsed, 'rss': peak_rss - baseline, 'allocated': allocated / 1e6,
+            'workspace': 0. if workspace is None else workspace.nbytes / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=100, help='the number of frames')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of times to run each variant')
+    parser.add_argument('--resolution', default='2560x1920', help='the WIDTHxHEIGHT of the frames')
+    parser.add_argument('--thresh', type=int, help='the threshold value (default: filter the colour)')
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    resolution = tuple(int(v) for v in args.resolution.split('x'))
+    if args.variant:
+        print(json.dumps(run(args.variant, args.number, resolution, args.thresh)))
+        return
+
+    results = {variant: [] for variant in VARIANTS}
+    for _ in range(args.repeat):
+        for variant in VARIANTS:
+            command = [sys.executable, __file__, '--variant', variant,
+                       '--number', str(args.number), '--resolution', args.resolution]
+            if args.thresh is not None:
+                command.extend(['--thresh', str(args.thresh)])
+            results[variant].append(json.loads(subprocess.check_output(command)))
+
+    print(f'locate_crosshair, {args.number} frames of {args.resolution}, thresh={args.thresh}, '
+          f'median of {args.repeat} runs')
+    print(f'{"variant":>9} {"time [ms]":>10} {"peak RSS [MB]":>14} '
+          f'{"allocated [MB]":>15} {"workspace [MB]":>15}')
+    for variant in VARIANTS:
+        r = {key: statistics.median(run[key] for run in results[variant]) for key in results[variant][0]}
+        print(f'{variant:>9} {r["time"]:>10.2f} {r["rss"]:>14.2f} '
+              f'{r["allocated"]:>15.2f} {r["workspace"]:>15.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -76,13 +76,17 @@ def get_version():
     return dev_version
 
 
-# the packages that pr-autocollimator depends on
+# the packages that are needed to decode the image of the crosshair, and to use
+# the measurement log or the replay, on a computer that is not a Raspberry Pi
+image_require = ['opencv-python==4.5.4.60', 'numpy==1.21.4']
+
+# the packages that pr-autocollimator depends on (fetching the location of the
+# crosshair only requires requests)
 install_requires = [
-    'opencv-python==4.5.4.60',
-    'numpy==1.21.4',
     'requests',
+    'opencv-python==4.5.4.60; "arm" in platform_machine',
+    'numpy==1.21.4; "arm" in platform_machine',
     'flask; "arm" in platform_machine',
-    'matplotlib; "arm" in platform_machine',
     'picamera; "arm" in platform_machine',
     'rpi-ws281x; "arm" in platform_machine',
     'RPi.GPIO; "arm" in platform_machine',
@@ -90,7 +94,11 @@ install_requires = [
 ]
 
 # the packages that are needed for running the tests
-tests_require = ['pytest', 'pytest-cov']
+tests_require = ['pytest', 'pytest-cov'] + image_require
+
+# the packages that are needed for running the web application on a computer
+# that is not a Raspberry Pi, with the simulated hardware
+simulation_require = ['flask'] + image_require
 
 testing = {'test', 'tests'}.intersection(sys.argv)
 
@@ -125,10 +133,15 @@ setup(
     ],
     tests_require=tests_require,
     install_requires=install_requires,
-    extras_require={'tests': tests_require},
+    extras_require={
+        'tests': tests_require,
+        'image': image_require,
+        'simulation': simulation_require,
+    },
     entry_points={
         'console_scripts': [
             'autocollimator = autocollimator.webapp:run',
+            'autocollimator-replay = autocollimator.replay:main',
         ],
     },
     packages=find_packages(include=('autocollimator',)),
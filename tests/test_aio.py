@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+
+import pytest
+
+from autocollimator import aio
+from autocollimator.aio import (
+    AsyncAutoCollimatorClient,
+    gather_crosshair,
+)
+
+
+class StandIn(object):
+
+    def __init__(self, *, x=1301.3, delay=0.):
+        """A stand-in for the web application that replies to /crosshair."""
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep the connection alive
+
+            def do_GET(self):
+                stand_in.requests.append(self.path)
+                stand_in.connections.add(self.client_address)
+                time.sleep(stand_in.delay)
+                body = json.dumps({'x_pixel': stand_in.x, 'y_pixel': 947.6, 'image': None}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *ignore):
+                pass
+
+        self.x = x
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.host = '127.0.0.1:{}'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_ins():
+    servers = [StandIn(x=float(i)) for i in range(3)]
+    yield servers
+    aio.close()
+    for server in servers:
+        server.close()
+
+
+def test_gather(stand_ins):
+    hosts = [s.host for s in stand_ins]
+    t0 = time.time()
+    replies = asyncio.run(gather_crosshair(hosts, image='none', threshold=40))
+    t1 = time.time()
+    assert [r['x_pixel'] for r in replies] == [0., 1., 2.]
+    for reply in replies:
+        assert t0 <= reply['t_send'] <= reply['t_receive'] <= t1
+    for server in stand_ins:
+        assert server.requests == ['/crosshair?threshold=40&image=none']
+
+
+def test_gather_is_concurrent(stand_ins):
+    for server in stand_ins:
+        server.delay = 0.3
+    hosts = [s.host for s in stand_ins]
+    t0 = time.perf_counter()
+    asyncio.run(gather_crosshair(hosts, image='none'))
+    # the requests would take 0.9 seconds if they were sent one after another
+    assert time.perf_counter() - t0 < 0.75
+
+
+def test_gather_keeps_connections_alive(stand_ins):
+    hosts = [s.host for s in stand_ins]
+    for _ in range(3):
+        asyncio.run(gather_crosshair(hosts, image='none'))
+    for server in stand_ins:
+        assert len(server.requests) == 3
+        assert len(server.connections) == 1
+
+
+def test_gather_return_exceptions(stand_ins):
+    hosts = [stand_ins[0].host, '127.0.0.1:1']
+    replies = asyncio.run(gather_crosshair(hosts, image='none', return_exceptions=True))
+    assert replies[0]['x_pixel'] == 0.
+    assert isinstance(replies[1], Exception)
+    with pytest.raises(Exception):
+        asyncio.run(gather_crosshair(hosts, image='none'))
+
+
+def test_gather_timeout_does_not_block(stand_ins):
+    for server in stand_ins:
+        server.delay = 0.5
+    hosts = [s.host for s in stand_ins]
+
+    async def poll():
+        return await asyncio.wait_for(gather_crosshair(hosts, image='none'), 0.05)
+
+    t0 = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(poll())
+    assert time.perf_counter() - t0 < 0.4
+
+
+def test_client(stand_ins):
+    async def fetch():
+        async with AsyncAutoCollimatorClient(stand_ins[1].host) as client:
+            return await client.crosshair(image='none')
+
+    reply = asyncio.run(fetch())
+    assert reply['x_pixel'] == 1.
+    assert reply['t_send'] <= reply['t_receive']
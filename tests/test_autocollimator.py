@@ -0,0 +1,46 @@
+import pytest
+
+from autocollimator.autocollimator import AutoCollimator
+from autocollimator.simulation import (
+    Scene,
+    simulated_devices,
+)
+
+
+@pytest.mark.parametrize('continuous', [False, True])
+def test_capture_records_illumination(continuous):
+    scene = Scene(resolution=(320, 240), crosshair=(161.3, 117.6), origin=(160., 120.),
+                  line_width=2., framerate=100., seed=0)
+    autocollimator = AutoCollimator(**simulated_devices(scene))
+    try:
+        if continuous:
+            autocollimator.start_continuous()
+        with autocollimator.capture(scene='view', brightness=40) as frame:
+            assert frame.led_brightness == pytest.approx(40, abs=0.5)
+            assert frame.lightbulb is autocollimator.is_lightbulb_on()
+        # a view image that is captured later does not change the illumination of a measurement
+        with autocollimator.capture(scene='measure') as frame:
+            view = autocollimator.submit(autocollimator.capture, scene='view', brightness=80)
+            with view.result() as other:
+                assert other.led_brightness == pytest.approx(80, abs=0.5)
+            assert frame.led_brightness == 0
+    finally:
+        autocollimator.close()
+
+
+def test_scene_restores_lightbulb():
+    autocollimator = AutoCollimator(**simulated_devices(Scene(resolution=(320, 240), seed=0)))
+    try:
+        assert autocollimator.illuminate('measure')
+        assert autocollimator.is_lightbulb_on()
+        assert not autocollimator.illuminate('measure')
+        assert autocollimator.illuminate('dark')
+        assert not autocollimator.is_lightbulb_on()
+        assert autocollimator.led_brightness() == 0
+        assert autocollimator.illuminate('view', brightness=60)
+        assert autocollimator.is_lightbulb_on()
+        assert autocollimator.illuminate('dark')
+        assert autocollimator.illuminate('measure')
+        assert autocollimator.is_lightbulb_on()
+    finally:
+        autocollimator.close()
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from autocollimator.broadcast import Broadcaster
+
+
+def test_broadcast_to_all_subscribers():
+    def produce(stop):
+        i = 0
+        while not stop.is_set():
+            i += 1
+            yield i
+            time.sleep(0.01)
+
+    broadcaster = Broadcaster(produce, name='numbers')
+    a = broadcaster.subscribe()
+    b = broadcaster.subscribe()
+    assert a.get(timeout=5) >= 1
+    assert b.get(timeout=5) >= 1
+    a.close()
+    assert not broadcaster.stopped
+    b.close()
+    assert broadcaster.stopped
+
+
+def test_stop_wait_for_producer_that_does_not_yield():
+    running = threading.Event()
+    finished = threading.Event()
+
+    def produce(stop):
+        running.set()
+        # e.g., a stream that is waiting for frames that are not available
+        while not stop.wait(0.01):
+            pass
+        finished.set()
+        return
+        yield
+
+    broadcaster = Broadcaster(produce, name='silent')
+    subscription = broadcaster.subscribe()
+    assert running.wait(5)
+    broadcaster.stop(wait=True)
+    assert finished.is_set()
+    assert subscription.closed
+    assert subscription.get() is None
+
+
+def test_last_unsubscribe_stops_producer():
+    finished = threading.Event()
+
+    def produce(stop):
+        try:
+            while not stop.wait(0.01):
+                pass
+        finally:
+            finished.set()
+        yield
+
+    broadcaster = Broadcaster(produce, name='silent')
+    broadcaster.subscribe().close()
+    broadcaster.stop(wait=True)
+    assert finished.is_set()
@@ -0,0 +1,194 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from autocollimator.camera import Camera
+from autocollimator.frames import (
+    FramePool,
+    yuv_shape,
+)
+from autocollimator.simulation import (
+    Scene,
+    SimulatedPiCamera,
+)
+
+
+def simulated_camera(**kwargs):
+    scene = Scene(resolution=(320, 240), crosshair=(161.3, 117.6), origin=(160., 120.),
+                  line_width=2., framerate=100., seed=0)
+    return Camera(camera=SimulatedPiCamera(scene), **kwargs)
+
+
+def test_reference_counting():
+    pool = FramePool((4, 6, 3), size=2)
+    frame = pool.writable()
+    assert frame._refs == 1
+    pool.publish(frame)  # the reference is transferred to the pool
+    assert frame._refs == 1
+    assert len(pool._free) == 1
+
+    latest = pool.latest()
+    assert latest is frame
+    assert frame._refs == 2
+    assert frame.acquire() is frame
+    assert frame._refs == 3
+    frame.release()
+    frame.release()
+    assert frame._refs == 1
+
+    # the frame is still referenced by the pool, so its buffer is not reused
+    other = pool.writable()
+    assert other is not frame
+    assert len(pool._free) == 0
+
+    # the frame is returned to the pool when it is released after the next frame is published
+    with pool.latest() as latest:
+        assert latest is frame
+        pool.publish(other)
+        assert frame._refs == 1
+        assert frame not in pool._free
+    assert frame._refs == 0
+    assert list(pool._free) == [frame]
+
+
+def test_publish_returns_previous_frame():
+    pool = FramePool((2, 2), size=3, format='yuv')
+    frames = []
+    for i in range(10):
+        frame = pool.writable()
+        frames.append(frame)
+        pool.publish(frame)
+        assert pool.seq == i + 1
+        assert frame.seq == i + 1
+    # only the latest frame is referenced, the others are free
+    assert len(pool._free) == 2
+    assert len({id(f) for f in frames}) == 3
+
+
+def test_overflow_frames():
+    pool = FramePool((4, 6, 3), size=2)
+    a = pool.writable()
+    b = pool.writable()
+    assert a._pool is pool
+    assert b._pool is pool
+
+    # all buffers are in use, so a new (overflow) buffer is allocated
+    c = pool.writable()
+    assert c._pool is None
+    assert c.buffer.size == 4 * 6 * 3
+
+    pool.publish(c)
+    with pool.latest() as latest:
+        assert latest is c
+    pool.publish(a)
+    assert c._refs == 0
+    # an overflow frame is not added to the ring
+    assert c not in pool._free
+    assert len(pool._free) == 0
+
+    b.release()
+    assert list(pool._free) == [b]
+
+
+def test_latest_after():
+    pool = FramePool((4, 6, 3), size=4)
+    with pytest.raises(TimeoutError):
+        pool.latest(timeout=0.01)
+
+    pool.publish(pool.writable())
+    with pool.latest() as frame:
+        assert frame.seq == 1
+    with pool.latest(after=0) as frame:
+        assert frame.seq == 1
+    with pytest.raises(TimeoutError):
+        pool.latest(after=1, timeout=0.01)
+
+    def publish():
+        time.sleep(0.05)
+        pool.publish(pool.writable())
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    with pool.latest(after=1, timeout=5) as frame:
+        assert frame.seq == 2
+    thread.join()
+
+
+def test_seq_continues():
+    pool = FramePool((4, 6, 3), seq=41)
+    pool.publish(pool.writable())
+    assert pool.seq == 42
+    with pool.latest(after=41, timeout=1) as frame:
+        assert frame.seq == 42
+
+
+def test_yuv_frame():
+    assert yuv_shape((240, 320)) == (240, 320)
+    assert yuv_shape((1080, 1920)) == (1088, 1920)
+    assert yuv_shape((100, 100, 3)) == (112, 128)
+
+    pool = FramePool((100, 100), size=1, format='yuv')
+    frame = pool.writable()
+    assert frame.buffer.size == 112 * 128 * 3 // 2
+    frame.buffer[:] = 128
+    assert frame.image.shape == (100, 100)
+    assert not frame.image.flags.writeable
+    bgr = frame.bgr()
+    assert bgr.shape == (100, 100, 3)
+    # a uniform grey image (U = V = 128)
+    assert np.all(bgr == bgr[0, 0, 0])
+    frame.release()
+
+
+@pytest.mark.parametrize('shape', [(100, 100), (37, 51)])
+def test_bgr_region(shape):
+    rng = np.random.default_rng(0)
+    pool = FramePool(shape, size=1, format='yuv')
+    frame = pool.writable()
+    frame.buffer[:] = rng.integers(0, 256, frame.buffer.size)
+    full = frame.bgr()
+    for x, y, w, h in [(0, 0, shape[1], shape[0]), (3, 5, 10, 7), (10, 12, 11, 9), (shape[1] - 1, shape[0] - 1, 1, 1)]:
+        # only the region is converted, with the same result as converting the full image
+        assert np.array_equal(frame.bgr((x, y, w, h)), full[y:y+h, x:x+w])
+    frame.release()
+
+
+@pytest.mark.parametrize('format', ['yuv', 'bgr'])
+def test_camera_capture(format):
+    camera = simulated_camera(format=format)
+    try:
+        with camera.capture() as frame:
+            assert frame.seq == 1
+            assert frame.format == format
+            assert frame.image.shape == ((240, 320) if format == 'yuv' else (240, 320, 3))
+            assert frame.bgr().shape == (240, 320, 3)
+        with camera.capture() as frame:
+            assert frame.seq == 2
+        assert camera.seq == 2
+    finally:
+        camera.close()
+
+
+def test_camera_continuous():
+    camera = simulated_camera(buffers=2)
+    try:
+        camera.start_continuous()
+        assert camera.continuous
+        with camera.latest(after=0, timeout=5) as first:
+            seq = first.seq
+            # holding frames does not stop the capture, overflow buffers are allocated
+            with camera.latest(after=seq, timeout=5) as second:
+                with camera.latest(after=second.seq, timeout=5) as third:
+                    assert seq < second.seq < third.seq
+        camera.stop_continuous()
+        assert not camera.continuous
+        # the sequence numbers continue after a change of resolution
+        seq = camera.seq
+        camera.set_resolution((160, 120))
+        with camera.capture() as frame:
+            assert frame.seq == seq + 1
+            assert frame.image.shape == (120, 160)
+    finally:
+        camera.close()
@@ -0,0 +1,59 @@
+import importlib
+import os
+import time
+
+import numpy as np
+
+from autocollimator.measurements import MeasurementLog
+
+# the autocollimator.measurements attribute is the function that fetches the measurements
+measurements = importlib.import_module('autocollimator.measurements')
+
+
+def appended(log):
+    # the times that the records were appended, in the order of the files and the records in the files
+    return np.concatenate([measurements.read(path)['logged'] for _, path in log.files()])
+
+
+def test_query_out_of_order(tmpdir):
+    # the measurements are appended after they are analysed, not in the order that they were captured
+    t0 = time.time() - 10.
+    with MeasurementLog(str(tmpdir)) as log:
+        for i in (0, 1, 5, 2, 3, 6):
+            log.append(t=t0 + i, seq=i)
+        assert log.query(t0 + 2, t0 + 4)['seq'].tolist() == [2, 3]
+        assert log.query()['seq'].tolist() == [0, 1, 2, 3, 5, 6]
+        assert log.query(start=t0 + 3)['seq'].tolist() == [3, 5, 6]
+        assert log.query(stop=t0 + 1.5)['seq'].tolist() == [0, 1]
+        assert log.query(t0 + 1, limit=2)['seq'].tolist() == [1, 2]
+        assert np.all(np.diff(appended(log)) >= 0)
+
+
+def test_clock_jumps_backwards(tmpdir, monkeypatch):
+    now = [2000.]
+    monkeypatch.setattr(measurements.time, 'time', lambda: now[0])
+    with MeasurementLog(str(tmpdir), max_bytes=2 * measurements.DTYPE.itemsize) as log:
+        for i in range(5):
+            log.append(seq=i)
+            now[0] += 1.
+        # e.g., the Raspberry Pi booted without a real-time clock and then NTP synchronised the clock
+        now[0] = 10.
+        for i in range(5, 10):
+            log.append(seq=i)
+            now[0] += 1.
+
+    names = [name for name, _ in MeasurementLog(str(tmpdir)).files()]
+    assert len(names) == 5
+    assert names == sorted(set(names))
+
+    log = MeasurementLog(str(tmpdir))
+    assert log.query()['seq'].tolist() == [5, 6, 7, 8, 9, 0, 1, 2, 3, 4]
+    assert log.query(2001., 2003.)['seq'].tolist() == [1, 2]
+    assert np.all(np.diff(appended(log)) >= 0)
+
+    # the log continues from the last record after it is reopened
+    log.append(seq=10)
+    assert log.query(limit=1)['seq'].tolist() == [5]
+    assert log.query()['logged'][-1] >= 2004.
+    log.close()
+    assert len(os.listdir(str(tmpdir))) == 6
@@ -0,0 +1,68 @@
+import pytest
+
+from autocollimator.simulation import Scene
+from autocollimator.tracker import Tracker
+from autocollimator.utils import (
+    greyscale,
+    locate_crosshair,
+)
+
+
+def render(crosshair):
+    scene = Scene(resolution=(640, 480), crosshair=crosshair, line_width=3., seed=0)
+    scene.brightness = 0  # only the crosshair is visible
+    return greyscale(scene.render((640, 480)))
+
+
+def searches(tracker):
+    # record the region of each search, None is a full-frame search
+    regions = []
+    submit = tracker._submit
+
+    def wrapper(image, region, *args, **kwargs):
+        regions.append(region)
+        return submit(image, region, *args, **kwargs)
+
+    tracker._submit = wrapper
+    return regions
+
+
+@pytest.mark.parametrize('crosshair', [(320.4, 240.6), (12.3, 240.6), (320.4, 470.2), (630.5, 8.4)])
+def test_track_within_window(crosshair):
+    image = render(crosshair)
+    tracker = Tracker(thresh=40, half_size=64)
+    regions = searches(tracker)
+    for _ in range(3):
+        result = tracker.locate(image)
+        assert result['x'] == pytest.approx(crosshair[0], abs=0.5)
+        assert result['y'] == pytest.approx(crosshair[1], abs=0.5)
+    # only the first image is searched at full frame, even if the crosshair is near the edge of the image
+    assert regions[0] is None
+    assert len(regions) == 3
+    assert all(region is not None for region in regions[1:])
+
+
+def test_full_frame_if_near_edge_of_window():
+    tracker = Tracker(thresh=40, half_size=64, margin=20)
+    tracker.locate(render((320.4, 240.6)))
+    regions = searches(tracker)
+    # the crosshair moved close to the edge of the window (but not of the image)
+    result = tracker.locate(render((320.4 + 55, 240.6)))
+    assert regions[0] is not None
+    assert regions[1] is None
+    assert result['x'] == pytest.approx(375.4, abs=0.5)
+
+
+@pytest.mark.parametrize('thresh', [None, 40])
+def test_window_is_same_as_region_of_image(thresh):
+    # only a crop that contains the window is analysed, the result is the same as analysing the window of the image
+    scene = Scene(resolution=(640, 480), crosshair=(101.3, 377.6), line_width=3., seed=0)
+    scene.brightness = 0 if thresh else 128
+    image = scene.render((640, 480))
+    tracker = Tracker(thresh=thresh, half_size=64)
+    tracker.locate(image)
+    window = tracker._window(image.shape, tracker.position)
+    expected = locate_crosshair(image, thresh=thresh, region=window)
+    result = tracker.locate(image)
+    assert (result['x'], result['y']) == (expected['x'], expected['y'])
+    assert result['offset'] == expected['offset']